@@ -0,0 +1,62 @@
+# async_logic.py
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from logic import DB_Manager
+
+# Потоков под запросы SQLite; у каждого своё соединение (см. DB_Manager)
+DB_THREADS = 4
+
+
+class AsyncDB_Manager:
+    """
+    Асинхронный двойник DB_Manager: та же схема и те же методы, но каждый
+    вызов — корутина. SQLite работает в отдельном пуле потоков, так что
+    event loop не блокируется на диске.
+    """
+
+    def __init__(self, database: str, threads: int = DB_THREADS,
+                 group_commit: bool = False, metrics=None, bootstrap: bool = True):
+        self.sync = DB_Manager(database, group_commit, metrics, bootstrap)
+        self.threads = threads
+        self._executor = ThreadPoolExecutor(threads, thread_name_prefix="db")
+
+    def __getattr__(self, name: str):
+        func = getattr(self.sync, name)
+        if name.startswith("_") or not callable(func):
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            return await self.run(func, *args, **kwargs)
+        call.__name__ = name
+        return call
+
+    async def run(self, func, *args, **kwargs):
+        """func в пуле потоков БД — для своих блокирующих вызовов рядом с базой."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    async def warm_up(self):
+        """
+        DB_Manager.warm_up в каждом потоке пула: задачи ждут друг друга
+        на барьере, поэтому пул создаёт все потоки сразу.
+        """
+        barrier = threading.Barrier(self.threads)
+
+        def warm():
+            barrier.wait()
+            self.sync.warm_up()
+
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(self._executor, warm) for _ in range(self.threads)
+        ))
+
+    async def close(self):
+        """Дождаться запросов в работе и закрыть соединения."""
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._executor.shutdown
+        )
+        self.sync.close()
@@ -0,0 +1,723 @@
+# async_main.py
+# Асинхронная точка входа: те же команды, что в main.py,
+# но на AsyncTeleBot и AsyncDB_Manager — один процесс держит тысячи диалогов
+# без потока на каждый запрос.
+import asyncio
+import logging
+
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_helper import ApiTelegramException
+
+from async_logic import AsyncDB_Manager
+from dispatcher import chat_id_of
+from logic import ProjectExists
+from health import Health
+from maintenance import Maintenance
+from metrics import Metrics
+from photos import PhotoStore, PhotoTooLarge
+from share import SnapshotStore, new_token
+from state import make_state_backend
+from transfer import (
+    BadRecord, detect_format, export_file, import_records, iter_lines, read_records
+)
+from config import (
+    TOKEN, DATABASE, PHOTOS_DIR, MAX_PHOTO_SIZE, PHOTO_WORKERS,
+    STATE_BACKEND, STATE_TTL, REDIS_URL, PROJECTS_PAGE_SIZE, SEARCH_LIMIT,
+    SKILL_NAME_MAX, GROUP_COMMIT, METRICS_ENABLED, METRICS_HOST, METRICS_PORT,
+    METRICS_LOG_INTERVAL, SLOW_QUERY_SECONDS,
+    SHARE_DIR, SHARE_URL, SHARE_HOST, SHARE_PORT, HEALTH_HOST, HEALTH_PORT,
+    MAINTENANCE_INTERVAL, MAINTENANCE_MERGE_DUPLICATES
+)
+from ui import (
+    hide_board, cancel_button, INFO_TEXT, attributes,
+    gen_reply_markup, gen_page_markup, gen_skills_markup, toggle_skill,
+    picked_skills, card_text, projects_text, stats_text
+)
+
+logger = logging.getLogger(__name__)
+
+# Сообщения, которые может ждать шаг мастера; остальные идут в хэндлеры
+STEP_CONTENT_TYPES = ('text', 'photo', 'document')
+
+class ChatOrderedTeleBot(AsyncTeleBot):
+    """
+    AsyncTeleBot, у которого обновления одного чата идут по порядку (как
+    ChatDispatcher в main.py): пачки поллинга обрабатываются одновременно,
+    и без этого шаги мастера одного чата обгоняли бы друг друга.
+    Разные чаты — параллельно.
+    Шаги мастеров (в AsyncTeleBot их нет) хранятся в next_step_backend из
+    state.py, как у TeleBot в main.py: с TTL, переживают перезапуск и общие
+    для процессов. Вызовы хранилища блокирующие — они идут через run
+    (AsyncDB_Manager.run: пул потоков БД).
+    """
+
+    def __init__(self, token: str, next_step_backend, run, metrics: Metrics=None, **kwargs):
+        super().__init__(token, **kwargs)
+        self.next_step_backend = next_step_backend
+        self.metrics = metrics
+        self._run = run
+        # chat_id -> [блокировка, сколько обновлений чата ждёт или идёт]
+        self._chats: dict[int, list] = {}
+
+    async def register_next_step_handler(self, message, callback, *args):
+        """Следующее сообщение чата уйдёт в callback(message, *args); args — JSON-типы."""
+        await self._run(self.next_step_backend.register_handler, message.chat.id,
+                        {"callback": callback, "args": args})
+
+    async def clear_step_handler_by_chat_id(self, chat_id: int):
+        await self._run(self.next_step_backend.clear_handlers, chat_id)
+
+    async def process_new_messages(self, new_messages):
+        # как TeleBot: у чата записан шаг — сообщение идёт в шаг, а не в хэндлеры
+        rest = []
+        for message in new_messages:
+            handlers = None
+            if message.content_type in STEP_CONTENT_TYPES:
+                handlers = await self._run(self.next_step_backend.get_handlers, message.chat.id)
+            if not handlers:
+                rest.append(message)
+                continue
+            for handler in handlers:
+                await self._exec_step(handler, message)
+        if rest:
+            await super().process_new_messages(rest)
+
+    async def _exec_step(self, handler, message):
+        step = handler["callback"]
+        if self.metrics is not None:
+            step = self.metrics.wrap("handler", step)  # время по каждому шагу отдельно
+        try:
+            await step(message, *handler["args"])
+        except Exception as e:
+            # как с хэндлерами: сначала exception_handler бота, затем лог
+            if not await self._handle_exception(e):
+                logger.exception("Ошибка в шаге мастера %s", handler["callback"].__name__)
+
+    async def process_new_updates(self, updates):
+        await asyncio.gather(*(self._process_in_order(u) for u in updates))
+
+    async def _process_in_order(self, update):
+        chat_id = chat_id_of(update)
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            entry = self._chats[chat_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            # asyncio.Lock пропускает ожидающих в порядке прихода
+            async with entry[0]:
+                await super().process_new_updates([update])
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chats[chat_id]
+
+# ========== Инициализация ==========
+# время вызовов Telegram API здесь не меряется: оно входит во время хэндлеров
+metrics = Metrics(SLOW_QUERY_SECONDS) if METRICS_ENABLED else None
+# при импорте только объекты; база, соединения и кэши — в startup()
+manager = AsyncDB_Manager(DATABASE, group_commit=GROUP_COMMIT, metrics=metrics,
+                          bootstrap=False)
+# шаги мастеров — в том же хранилище, что у main.py
+bot = ChatOrderedTeleBot(
+    TOKEN, make_state_backend(STATE_BACKEND, manager.sync, STATE_TTL, REDIS_URL),
+    manager.run, metrics
+)
+photo_store = PhotoStore(PHOTOS_DIR, MAX_PHOTO_SIZE, PHOTO_WORKERS)
+snapshots = SnapshotStore(SHARE_DIR, photo_store)
+health = Health()
+# обслуживание идёт в своём потоке на синхронном DB_Manager
+maintenance = Maintenance(manager.sync, photo_store, merge=MAINTENANCE_MERGE_DUPLICATES)
+
+async def startup():
+    """Схема и справочники, затем соединения во всех потоках пула БД (как main.startup)."""
+    await manager.bootstrap()
+    await manager.warm_up()
+    health.add_check("database", manager.sync.schema_ready)
+    health.set_ready()
+
+# ========== Вспомогательные функции ==========
+
+async def cancel(message):
+    """Скрыть клавиатуру и подсказать /info."""
+    await bot.send_message(
+        message.chat.id,
+        "Чтобы посмотреть команды, используй: /info",
+        reply_markup=hide_board
+    )
+
+async def no_projects(message):
+    """Сообщение, если проектов нет."""
+    await bot.send_message(
+        message.chat.id,
+        "У тебя пока нет проектов!\nДобавь их командой /new_project"
+    )
+
+async def project_names(user_id: int) -> list[str]:
+    return [p[2] for p in await manager.get_projects(user_id)]
+
+# ========== Вывод информации о проекте ==========
+async def info_project(message, user_id: int, project_name: str=None,
+                       project_id: int=None):
+    card = await manager.get_project_card(user_id, project_name, project_id)
+    if not card:
+        await bot.send_message(message.chat.id, "❌ Проект не найден.")
+        return
+    photo, file_id = card[6], card[7]
+
+    await bot.send_message(
+        message.chat.id,
+        card_text(card),
+        parse_mode='HTML',
+        reply_markup=hide_board
+    )
+
+    # фото уже лежит у Telegram — отправляем по file_id, без выгрузки байтов
+    if file_id:
+        try:
+            await bot.send_photo(message.chat.id, file_id)
+            return
+        except ApiTelegramException:
+            pass  # file_id больше не действует, отправим файл с диска
+    # уменьшенная копия, если готова: меньше байтов на выгрузку;
+    # файла может не быть на диске — тогда карточка без фото
+    path = photo_store.send_path(photo) if photo else None
+    if path:
+        data = await asyncio.to_thread(_read_file, path)
+        sent = await bot.send_photo(message.chat.id, data)
+        await manager.set_photo_file_id(user_id, card[0], sent.photo[-1].file_id)
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+# ========== Хэндлеры команд ==========
+
+@bot.message_handler(commands=['start'])
+async def start_handler(message):
+    """Запуск — приветствие и подсказка (одним сообщением: лимит на чат)."""
+    await bot.send_message(
+        message.chat.id,
+        "👋 Привет! Я бот‑портфолио 🤖\n"
+        "Сохраняй и просматривай свои проекты!\n\n" + INFO_TEXT,
+        parse_mode='HTML'
+    )
+
+@bot.message_handler(commands=['info'])
+async def info_handler(message):
+    """Справка по всем командам."""
+    await bot.send_message(message.chat.id, INFO_TEXT, parse_mode='HTML')
+
+# ----- /new_project -----
+@bot.message_handler(commands=['new_project'])
+async def new_project_step1(message):
+    await bot.send_message(message.chat.id, "📌 Введите название проекта:")
+    await bot.register_next_step_handler(message, new_project_step2)
+
+async def new_project_step2(message):
+    name = message.text.strip()
+    user_id = message.from_user.id
+    await bot.send_message(message.chat.id, "🔗 Введите ссылку на проект:")
+    await bot.register_next_step_handler(message, new_project_step3, user_id, name)
+
+async def new_project_step3(message, user_id, name):
+    url = message.text.strip()
+    statuses = [s[0] for s in await manager.get_statuses()]
+    await bot.send_message(
+        message.chat.id,
+        "📊 Выберите текущий статус проекта:",
+        reply_markup=gen_reply_markup(statuses)
+    )
+    await bot.register_next_step_handler(message, new_project_step4, user_id, name, url, statuses)
+
+async def new_project_step4(message, user_id, name, url, statuses):
+    choice = message.text
+    if choice == cancel_button:
+        return await cancel(message)
+    if choice not in statuses:
+        await bot.send_message(
+            message.chat.id, "⚠️ Статус не распознан, выберите из списка:",
+            reply_markup=gen_reply_markup(statuses)
+        )
+        return await bot.register_next_step_handler(
+            message, new_project_step4, user_id, name, url, statuses
+        )
+    status_id = await manager.get_status_id(choice)
+    await save_project(message, user_id, name, url, status_id)
+
+async def save_project(message, user_id, name, url, status_id):
+    if not await manager.insert_project([(user_id, name, url, status_id)]):
+        await bot.send_message(
+            message.chat.id,
+            f"⚠️ Проект «{name}» уже есть. Введите другое название:",
+            reply_markup=hide_board
+        )
+        return await bot.register_next_step_handler(
+            message, new_project_rename, user_id, url, status_id
+        )
+    await bot.send_message(
+        message.chat.id,
+        "✅ Проект сохранён!",
+        reply_markup=hide_board
+    )
+
+async def new_project_rename(message, user_id, url, status_id):
+    if message.text == cancel_button:
+        return await cancel(message)
+    await save_project(message, user_id, message.text.strip(), url, status_id)
+
+# ----- /projects -----
+@bot.message_handler(commands=['projects'])
+async def projects_handler(message):
+    cards, has_prev, has_next = await manager.get_project_page(
+        message.from_user.id, limit=PROJECTS_PAGE_SIZE
+    )
+    if not cards:
+        return await no_projects(message)
+
+    await bot.send_message(
+        message.chat.id,
+        projects_text(cards),
+        parse_mode='HTML',
+        reply_markup=gen_page_markup(cards, has_prev, has_next)
+    )
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("pg:"))
+async def projects_page_callback(call):
+    """Листание /projects: редактируем то же сообщение."""
+    await bot.answer_callback_query(call.id)
+    backward, cursor = call.data[3] == "<", int(call.data[4:])
+    cards, has_prev, has_next = await manager.get_project_page(
+        call.from_user.id, cursor, backward, PROJECTS_PAGE_SIZE
+    )
+    if not cards:  # проекты на той странице успели удалить — начнём сначала
+        cards, has_prev, has_next = await manager.get_project_page(
+            call.from_user.id, limit=PROJECTS_PAGE_SIZE
+        )
+    if not cards:
+        return await no_projects(call.message)
+    await bot.edit_message_text(
+        projects_text(cards),
+        call.message.chat.id,
+        call.message.message_id,
+        parse_mode='HTML',
+        reply_markup=gen_page_markup(cards, has_prev, has_next)
+    )
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("p:"))
+async def project_inline_callback(call):
+    await bot.answer_callback_query(call.id)
+    await info_project(call.message, call.from_user.id, project_id=int(call.data[2:]))
+
+# ----- /search -----
+@bot.message_handler(commands=['search'])
+async def search_handler(message):
+    query = message.text.partition(" ")[2].strip()
+    if query:
+        return await search_step2(message, query)
+    await bot.send_message(message.chat.id, "🔍 Что ищем? Введите слова из названия, описания или навыков:")
+    await bot.register_next_step_handler(message, search_step2)
+
+async def search_step2(message, query: str=None):
+    if not await search_results(message, query or message.text or ""):
+        await bot.send_message(message.chat.id, "Ничего не нашлось 🤷")
+
+async def search_results(message, query: str) -> bool:
+    """Показать найденные проекты; False, если ничего не нашлось."""
+    cards = await manager.search_projects(message.from_user.id, query, SEARCH_LIMIT)
+    if not cards:
+        return False
+    await bot.send_message(
+        message.chat.id,
+        projects_text(cards),
+        parse_mode='HTML',
+        reply_markup=gen_page_markup(cards, False, False)
+    )
+    return True
+
+# ----- Выбор проекта из списка (общий шаг нескольких мастеров) -----
+async def ask_project(message, prompt: str, next_step):
+    names = await project_names(message.from_user.id)
+    if not names:
+        return await no_projects(message)
+    await bot.send_message(
+        message.chat.id, prompt, reply_markup=gen_reply_markup(names)
+    )
+    # запись шага — JSON: следующий шаг по имени, список имён — снова из кэша
+    await bot.register_next_step_handler(message, choose_project, next_step.__name__)
+
+async def choose_project(message, next_step: str):
+    proj = message.text
+    if proj == cancel_button:
+        return await cancel(message)
+    names = await project_names(message.from_user.id)
+    if proj not in names:
+        await bot.send_message(
+            message.chat.id, "❌ Проект не найден, повторите:",
+            reply_markup=gen_reply_markup(names)
+        )
+        return await bot.register_next_step_handler(message, choose_project, next_step)
+    await globals()[next_step](message, proj)
+
+# ----- /skills -----
+@bot.message_handler(commands=['skills'])
+async def skills_handler(message):
+    await ask_project(
+        message, "🛠️ Выберите проект, чтобы отметить его навыки:", skills_step2
+    )
+
+async def skills_step2(message, proj):
+    await bot.send_message(message.chat.id, f"Проект «{proj}»", reply_markup=hide_board)
+    pid = await manager.get_project_id(proj, message.from_user.id)
+    await skill_picker(message, pid)
+
+async def skill_picker(message, project_id: int):
+    """Сообщение с мультивыбором навыков; новые навыки можно дописать текстом."""
+    markup = gen_skills_markup(
+        project_id, await manager.get_skills(),
+        await manager.get_project_skill_ids(project_id)
+    )
+    sent = await bot.send_message(
+        message.chat.id,
+        "🔧 Отметьте навыки и нажмите «Готово».\n"
+        "Нужного нет в списке — напишите его (несколько — через запятую).",
+        reply_markup=markup
+    )
+    await bot.register_next_step_handler(
+        message, skills_typed, project_id, sent.message_id, picked_skills(markup)
+    )
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("sk:"))
+async def skills_picker_callback(call):
+    """Отметка навыка меняет только клавиатуру; в БД всё пишется по «Готово»."""
+    chat_id, message_id = call.message.chat.id, call.message.message_id
+    _, project_id, action = call.data.split(":")
+    markup = call.message.reply_markup
+    if action != "ok":
+        await bot.answer_callback_query(call.id)
+        toggle_skill(markup, call.data)
+        await bot.edit_message_reply_markup(chat_id, message_id, reply_markup=markup)
+        # написанные текстом навыки добавятся к текущим отметкам
+        return await bot.register_next_step_handler(
+            call.message, skills_typed, int(project_id), message_id, picked_skills(markup)
+        )
+
+    await bot.clear_step_handler_by_chat_id(chat_id)
+    selected = picked_skills(markup)
+    result = await manager.set_project_skills(call.from_user.id, int(project_id), selected)
+    await bot.answer_callback_query(call.id)
+    if result is None:
+        return await bot.edit_message_text("❌ Проект не найден.", chat_id, message_id)
+    added, removed = result
+    await bot.edit_message_text(
+        f"✅ Навыки сохранены: {', '.join(selected) or '—'}\n"
+        f"Добавлено: {len(added)}, убрано: {len(removed)}",
+        chat_id, message_id
+    )
+
+async def skills_typed(message, project_id, picker_id, selected):
+    # команда вместо названия — пользователь ушёл из мастера
+    if message.text == cancel_button or (message.text or "").startswith("/"):
+        return await cancel(message)
+    names = [n.strip() for n in (message.text or "").split(",") if n.strip()]
+    if not names or any(len(n) > SKILL_NAME_MAX for n in names):
+        await bot.send_message(
+            message.chat.id,
+            f"❌ Напишите названия навыков через запятую (до {SKILL_NAME_MAX} символов):"
+        )
+        return await bot.register_next_step_handler(message, skills_typed, project_id, picker_id, selected)
+
+    uid = message.from_user.id
+    if await manager.set_project_skills(uid, project_id, selected + names) is None:
+        return await bot.send_message(message.chat.id, "❌ Проект не найден.")
+    # старый выбор устарел — показываем новый, уже с добавленными навыками
+    try:
+        await bot.edit_message_reply_markup(message.chat.id, picker_id, reply_markup=None)
+    except ApiTelegramException:
+        pass  # сообщение слишком старое или уже изменено
+    await skill_picker(message, project_id)
+
+# ----- /delete -----
+@bot.message_handler(commands=['delete'])
+async def delete_handler(message):
+    await ask_project(message, "❌ Выберите проект для удаления:", delete_step2)
+
+async def delete_step2(message, proj):
+    uid = message.from_user.id
+    pid = await manager.get_project_id(proj, uid)
+    await manager.delete_project(uid, pid)
+    await asyncio.to_thread(photo_store.collect_garbage, manager.sync)
+    await bot.send_message(
+        message.chat.id,
+        f"✅ Проект «{proj}» удалён.",
+        reply_markup=hide_board
+    )
+
+# ----- /update_projects -----
+@bot.message_handler(commands=['update_projects'])
+async def upd_handler1(message):
+    await ask_project(message, "✏️ Выберите проект для редактирования:", upd_handler2)
+
+async def upd_handler2(message, proj):
+    await bot.send_message(
+        message.chat.id,
+        "Что изменить?",
+        reply_markup=gen_reply_markup(list(attributes.keys()))
+    )
+    await bot.register_next_step_handler(message, upd_handler3, proj)
+
+async def upd_handler3(message, proj):
+    choice = message.text
+    if choice == cancel_button:
+        return await cancel(message)
+    if choice not in attributes:
+        await bot.send_message(
+            message.chat.id, "❌ Опция не распознана, повторите:",
+            reply_markup=gen_reply_markup(list(attributes.keys()))
+        )
+        return await bot.register_next_step_handler(message, upd_handler3, proj)
+
+    prompt, col = attributes[choice]
+    markup = None
+    if col == "status_id":
+        statuses = [s[0] for s in await manager.get_statuses()]
+        markup = gen_reply_markup(statuses)
+
+    await bot.send_message(
+        message.chat.id,
+        prompt,
+        reply_markup=markup or hide_board
+    )
+    await bot.register_next_step_handler(message, upd_handler4, proj, col)
+
+async def upd_handler4(message, proj, col):
+    val = message.text
+    uid = message.from_user.id
+    if val == cancel_button:
+        return await cancel(message)
+
+    # если статус — переводим в id
+    if col == "status_id":
+        sts = [s[0] for s in await manager.get_statuses()]
+        if val not in sts:
+            await bot.send_message(
+                message.chat.id,
+                "❌ Статус неверен, выберите из списка:",
+                reply_markup=gen_reply_markup(sts)
+            )
+            return await bot.register_next_step_handler(message, upd_handler4, proj, col)
+        val = await manager.get_status_id(val)
+
+    try:
+        await manager.update_projects(col, (val, proj, uid))
+    except ProjectExists:
+        await bot.send_message(
+            message.chat.id,
+            f"⚠️ Проект «{val}» уже есть. Введите другое название:",
+            reply_markup=hide_board
+        )
+        return await bot.register_next_step_handler(message, upd_handler4, proj, col)
+    await bot.send_message(
+        message.chat.id,
+        "✅ Обновлено!",
+        reply_markup=hide_board
+    )
+
+# ----- /add_description -----
+@bot.message_handler(commands=['add_description'])
+async def add_desc1(message):
+    await ask_project(message, "📄 Выберите проект для описания:", add_desc2)
+
+async def add_desc2(message, proj):
+    await bot.send_message(
+        message.chat.id,
+        "📝 Введите текст описания:",
+        reply_markup=hide_board
+    )
+    await bot.register_next_step_handler(message, add_desc3, proj)
+
+async def add_desc3(message, proj):
+    uid = message.from_user.id
+    await manager.update_projects("description", (message.text, proj, uid))
+    await bot.send_message(
+        message.chat.id,
+        "✅ Описание сохранено!",
+        reply_markup=hide_board
+    )
+
+# ----- /add_photo -----
+@bot.message_handler(commands=['add_photo'])
+async def add_photo1(message):
+    await ask_project(message, "📷 Выберите проект для фото:", add_photo2)
+
+async def add_photo2(message, proj):
+    await bot.send_message(
+        message.chat.id,
+        "Отправьте фото проекта в ответ на это сообщение:",
+        reply_markup=hide_board
+    )
+    await bot.register_next_step_handler(message, add_photo3, proj)
+
+async def add_photo3(message, proj):
+    if message.content_type != 'photo':
+        await bot.send_message(message.chat.id, "❌ Это не фото, попробуйте ещё раз.")
+        return await bot.register_next_step_handler(message, add_photo3, proj)
+
+    uid = message.from_user.id
+    photo = message.photo[-1]
+    try:
+        if photo.file_size and photo.file_size > MAX_PHOTO_SIZE:
+            raise PhotoTooLarge(photo.file_size)
+        file_info = await bot.get_file(photo.file_id)
+        data = await bot.download_file(file_info.file_path)
+        filename = await asyncio.to_thread(photo_store.save, [data])
+    except PhotoTooLarge:
+        await bot.send_message(
+            message.chat.id,
+            f"❌ Фото больше {MAX_PHOTO_SIZE // (1024 * 1024)} МБ, пришлите поменьше."
+        )
+        return await bot.register_next_step_handler(message, add_photo3, proj)
+
+    await manager.set_project_photo(uid, proj, filename, photo.file_id)
+    photo_store.schedule_variants(filename)
+    await asyncio.to_thread(photo_store.collect_garbage, manager.sync)
+    await bot.send_message(
+        message.chat.id,
+        "✅ Фото сохранено!",
+        reply_markup=hide_board
+    )
+
+# ----- /export, /import -----
+@bot.message_handler(commands=['export'])
+async def export_handler(message):
+    """Выгрузить все проекты файлом: /export или /export csv."""
+    uid = message.from_user.id
+    if not await project_names(uid):
+        return await no_projects(message)
+    fmt = "csv" if message.text.partition(" ")[2].strip().lower() == "csv" else "jsonl"
+    f = await asyncio.to_thread(export_file, manager.sync, uid, fmt)
+    with f:
+        await bot.send_document(message.chat.id, f, visible_file_name=f"portfolio.{fmt}")
+
+@bot.message_handler(commands=['import'])
+async def import_handler(message):
+    await bot.send_message(
+        message.chat.id,
+        "📥 Отправьте файл .jsonl или .csv (как из /export).\n"
+        "Проекты с теми же названиями будут обновлены."
+    )
+    await bot.register_next_step_handler(message, import_step2)
+
+async def import_step2(message):
+    if message.text == cancel_button:
+        return await cancel(message)
+    if message.content_type != 'document':
+        await bot.send_message(message.chat.id, "❌ Это не файл, попробуйте ещё раз.")
+        return await bot.register_next_step_handler(message, import_step2)
+
+    uid = message.from_user.id
+    doc = message.document
+    file_info = await bot.get_file(doc.file_id)
+    data = await bot.download_file(file_info.file_path)
+    records = read_records(iter_lines([data]), detect_format(doc.file_name or ""))
+    try:
+        count = await asyncio.to_thread(import_records, manager.sync, uid, records,
+                                        photo_store=photo_store)
+    except BadRecord as e:
+        await bot.send_message(
+            message.chat.id,
+            f"❌ Ошибка в файле: {e}.\nИсправьте и отправьте снова через /import — "
+            "уже загруженные проекты обновятся, а не задвоятся."
+        )
+        return
+    finally:
+        # у обновлённых проектов могли смениться фото
+        await asyncio.to_thread(photo_store.collect_garbage, manager.sync)
+    await bot.send_message(message.chat.id, f"✅ Загружено проектов: {count}")
+
+# ----- /share -----
+@bot.message_handler(commands=['share'])
+async def share_handler(message):
+    """Публичный снимок портфолио: ссылка или HTML-файл; /share off — отозвать."""
+    uid = message.from_user.id
+    if message.text.partition(" ")[2].strip().lower() == "off":
+        token = await manager.unshare_portfolio(uid)
+        if token:
+            await asyncio.to_thread(snapshots.forget, token)
+        return await bot.send_message(
+            message.chat.id, "🔒 Ссылка закрыта." if token else "Публичной ссылки не было."
+        )
+    if not await project_names(uid):
+        return await no_projects(message)
+    token = await manager.share_portfolio(uid, new_token())
+    if SHARE_URL:
+        return await bot.send_message(
+            message.chat.id,
+            f"🌐 Портфолио по ссылке (обновляется само):\n{SHARE_URL.rstrip('/')}/p/{token}\n"
+            "Закрыть доступ: /share off"
+        )
+    snapshot = await asyncio.to_thread(snapshots.get, manager.sync, token)
+    data = await asyncio.to_thread(_read_file, snapshot.html_path)
+    await bot.send_document(message.chat.id, data, visible_file_name="portfolio.html")
+
+# ----- /stats -----
+@bot.message_handler(commands=['stats'])
+async def stats_handler(message):
+    """Проекты по статусам, свои и общие частые навыки — из сводок БД."""
+    uid = message.from_user.id
+    statuses = await manager.get_status_stats(uid)
+    if not statuses:
+        return await no_projects(message)
+    await bot.send_message(message.chat.id, stats_text(
+        statuses, await manager.get_top_skills(uid), await manager.get_top_skills(),
+        await manager.get_skill_pairs()
+    ), parse_mode='HTML')
+
+# ----- Ловим всё остальное -----
+# регистрируется последним: ловит любые callback_data
+@bot.callback_query_handler(func=lambda call: True)
+async def legacy_inline_callback(call):
+    """Кнопки старых сообщений: в callback_data лежит имя проекта."""
+    await bot.answer_callback_query(call.id)
+    await info_project(call.message, call.from_user.id, call.data)
+
+@bot.message_handler(func=lambda m: True)
+async def fallback_handler(message):
+    uid = message.from_user.id
+    text = message.text or ""
+    # точное имя — по индексу (user_id, project_name), не среди кандидатов поиска
+    card = await manager.get_project_card(uid, project_name=text)
+    if card:
+        return await info_project(message, uid, project_id=card[0])
+    if await search_results(message, text):
+        return
+    await bot.reply_to(message, "Нужна помощь?\n\n" + INFO_TEXT, parse_mode='HTML')
+
+# ========== Старт поллинга ==========
+if metrics is not None:
+    metrics.instrument_handlers(bot)  # все хэндлеры уже зарегистрированы
+
+async def main():
+    logging.basicConfig(level=logging.INFO)
+    # пробы поднимаются до миграций: пока идёт старт, /readyz отвечает 503
+    if HEALTH_PORT:
+        health.serve(HEALTH_HOST, HEALTH_PORT)
+    await startup()
+    if MAINTENANCE_INTERVAL:
+        maintenance.start(MAINTENANCE_INTERVAL)
+    if metrics is not None:
+        metrics.serve(METRICS_HOST, METRICS_PORT)
+        metrics.start_reporter(METRICS_LOG_INTERVAL)
+    if SHARE_URL:
+        from share import ShareServer
+
+        ShareServer(snapshots, manager.sync, SHARE_HOST, SHARE_PORT).serve_background()
+    try:
+        await bot.infinity_polling()
+    finally:
+        maintenance.stop()
+        photo_store.close()
+        await manager.close()
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,1112 @@
+# bench.py
+"""
+Замеры производительности слоя БД.
+
+Запуск:  python bench.py [сценарий ...]
+Без аргументов выполняются все сценарии.
+"""
+import http.client
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from dispatcher import ChatDispatcher
+from logic import DB_Manager, MIGRATIONS
+from maintenance import Maintenance
+from metrics import Metrics
+import replay
+from sender import SendLimiter, TokenBucket
+from supervisor import Supervisor
+from state import LocalRedis, MemoryStateBackend, RedisStateBackend, SqliteStateBackend
+import share
+import transfer
+from webhook import WebhookServer, SECRET_HEADER
+
+N = 5000
+USERS = 500
+
+
+def _fresh_manager(**kwargs) -> tuple[DB_Manager, str]:
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    return DB_Manager(path, **kwargs), path
+
+
+def _cleanup(manager: DB_Manager, path: str):
+    manager.close()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def _ops(func, n: int = N) -> float:
+    start = time.perf_counter()
+    for i in range(n):
+        func(i)
+    return n / (time.perf_counter() - start)
+
+
+def _report(title: str, before: float, after: float):
+    print(f"{title:<28} до: {before:>10,.0f} оп/с   после: {after:>10,.0f} оп/с"
+          f"   x{after / before:.1f}")
+
+
+# ------ Сценарии ------
+
+def bench_connections():
+    """Новое соединение на каждый запрос против долгоживущего."""
+    manager, path = _fresh_manager()
+
+    def naive_insert(i):
+        conn = sqlite3.connect(path)
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO projects (user_id, project_name, url, status_id) VALUES(?,?,?,?)",
+                [(i % USERS, f"naive {i}", "", 1)]
+            )
+        conn.close()
+
+    def naive_select(i):
+        conn = sqlite3.connect(path)
+        conn.execute("SELECT * FROM projects WHERE user_id=?", (i % USERS,)).fetchall()
+        conn.close()
+
+    before_ins = _ops(naive_insert)
+    after_ins = _ops(lambda i: manager.insert_project([(i % USERS, f"pooled {i}", "", 1)]))
+    _report("insert_project", before_ins, after_ins)
+    _report("get_projects", _ops(naive_select),
+            _ops(lambda i: manager.get_projects(i % USERS)))
+    _cleanup(manager, path)
+
+
+# горячие запросы DB_Manager в том виде, в каком они уходят в SQLite
+HOT_QUERIES = {
+    "get_projects": (
+        "SELECT * FROM projects WHERE user_id=?",
+        lambda uid: (uid,)
+    ),
+    "get_project_id": (
+        "SELECT project_id FROM projects WHERE project_name=? AND user_id=?",
+        lambda uid: (f"project {uid}-0", uid)
+    ),
+    "get_project_info": (
+        '''SELECT p.project_name, p.description, p.url, s.status_name
+           FROM projects p LEFT JOIN status s ON p.status_id=s.status_id
+           WHERE p.user_id=? AND p.project_name=?''',
+        lambda uid: (uid, f"project {uid}-0")
+    ),
+    "skill_usage": (
+        "SELECT COUNT(*) FROM project_skills WHERE skill_id=?",
+        lambda uid: (uid % 4 + 1,)
+    ),
+}
+PROJECTS_PER_USER = 20
+
+
+def _generate(conn: sqlite3.Connection, n_projects: int):
+    """Синтетический портфель: 20 проектов на пользователя, по 2 навыка."""
+    rnd = random.Random(0)
+    users = max(1, n_projects // PROJECTS_PER_USER)
+    rows = (
+        (pid, pid % users, f"project {pid % users}-{pid // users}",
+         "описание", "example.com", rnd.randint(1, 5))
+        for pid in range(1, n_projects + 1)
+    )
+    with conn:
+        conn.executemany(
+            "INSERT INTO projects (project_id, user_id, project_name, description, url, status_id)"
+            " VALUES(?,?,?,?,?,?)", rows
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO project_skills VALUES(?,?)",
+            ((pid, rnd.randint(1, 4)) for pid in range(1, n_projects + 1) for _ in range(2))
+        )
+    return users
+
+
+def _measure_queries(conn: sqlite3.Connection, users: int, n: int = 50) -> dict:
+    result = {}
+    for name, (sql, params) in HOT_QUERIES.items():
+        plan = conn.execute("EXPLAIN QUERY PLAN " + sql, params(0)).fetchall()
+        start = time.perf_counter()
+        for i in range(n):
+            conn.execute(sql, params(i % users)).fetchall()
+        ms = (time.perf_counter() - start) / n * 1000
+        result[name] = (ms, " | ".join(r[-1] for r in plan))
+    return result
+
+
+def bench_indexes(sizes=(1_000, 100_000, 1_000_000)):
+    """Планы и задержки горячих запросов до и после миграций индексов."""
+    for size in sizes:
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        conn = sqlite3.connect(path)
+        MIGRATIONS[0](conn)
+        conn.execute("PRAGMA user_version=1")
+        users = _generate(conn, size)
+        before = _measure_queries(conn, users)
+
+        start = time.perf_counter()
+        manager = DB_Manager(path)
+        migrate_s = time.perf_counter() - start
+        conn.close()
+        conn = sqlite3.connect(path)
+        after = _measure_queries(conn, users)
+        conn.close()
+
+        print(f"-- {size:,} проектов (миграция {migrate_s:.2f} с)")
+        for name in HOT_QUERIES:
+            (ms_b, plan_b), (ms_a, plan_a) = before[name], after[name]
+            print(f"{name:<18} {ms_b:>9.3f} мс -> {ms_a:>7.3f} мс")
+            print(f"{'':<18} было:  {plan_b}")
+            print(f"{'':<18} стало: {plan_a}")
+        _cleanup(manager, path)
+
+
+def bench_cache(users: int = 1000, n: int = 50_000):
+    """Шаг мастера /new_project и fallback: справочники + список проектов."""
+    manager, path = _fresh_manager()
+    manager.insert_project([(u, f"p{u}-{k}", "", 1) for u in range(users) for k in range(5)])
+    conn = manager._connect()
+    rnd = random.Random(0)
+
+    def uncached(i):
+        conn.execute("SELECT status_name FROM status").fetchall()
+        conn.execute("SELECT status_id FROM status WHERE status_name=?", ("Обновлен",)).fetchall()
+        conn.execute("SELECT * FROM projects WHERE user_id=?", (rnd.randrange(users),)).fetchall()
+
+    def cached(i):
+        manager.get_statuses()
+        manager.get_status_id("Обновлен")
+        manager.get_projects(rnd.randrange(users))
+        if i % 100 == 0:  # редкие правки сбрасывают кэш пользователя
+            manager.update_projects("url", ("x", "p0-0", rnd.randrange(users)))
+
+    _report("статусы + get_projects", _ops(uncached, n), _ops(cached, n))
+    print(manager.cache_stats())
+    _cleanup(manager, path)
+
+
+class FakeBotAPI:
+    """Заглушка Bot API: каждый вызов занимает фиксированное время сети."""
+
+    def __init__(self, latency: float = 0.005):
+        self.latency = latency
+        self.sent = 0
+        self._lock = threading.Lock()
+
+    def send_message(self, chat_id, text, **kwargs):
+        time.sleep(self.latency)
+        with self._lock:
+            self.sent += 1
+
+
+def _percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def bench_dispatcher(chats: int = 200, updates: int = 4000):
+    """Задержка обработки обновления при 1, 8 и 32 рабочих потоках."""
+    for workers in (1, 8, 32):
+        manager, path = _fresh_manager()
+        api = FakeBotAPI()
+        latencies = []
+        last_seq = {}
+        disorder = 0
+
+        def handler(chat_id, seq, queued_at):
+            nonlocal disorder
+            if last_seq.get(chat_id, -1) > seq:
+                disorder += 1
+            last_seq[chat_id] = seq
+            if seq % 10 == 0:
+                manager.insert_project([(chat_id, f"p{seq}", "", 1)])
+            api.send_message(chat_id, str(manager.get_projects(chat_id)))
+            latencies.append(time.perf_counter() - queued_at)
+
+        dispatcher = ChatDispatcher(workers)
+        start = time.perf_counter()
+        for seq in range(updates):
+            chat_id = seq % chats
+            dispatcher.submit(chat_id, handler, chat_id, seq, time.perf_counter())
+        dispatcher.shutdown()
+        total = time.perf_counter() - start
+
+        print(f"{workers:>2} потоков: {updates / total:>7,.0f} upd/с   "
+              f"p50 {_percentile(latencies, 0.5) * 1000:>8.1f} мс   "
+              f"p99 {_percentile(latencies, 0.99) * 1000:>8.1f} мс   "
+              f"нарушений порядка: {disorder}")
+        _cleanup(manager, path)
+
+
+def bench_async(users: int = 500, latency: float = 0.005):
+    """
+    main.py (пул потоков ChatDispatcher) против async_main.py на одном
+    потоке: настоящие хэндлеры на одном и том же потоке обновлений и
+    локальном Bot API с задержкой latency на вызов (replay.py). Каждый
+    бот — в своём процессе: оба создаются при импорте модуля.
+    """
+    from config import PROJECTS_PAGE_SIZE
+
+    workdir = tempfile.mkdtemp(prefix="bench-async-")
+    database = os.path.join(workdir, "seed.db")
+    updates = os.path.join(workdir, "updates.jsonl")
+    projects = replay.seed(database, users, 12)
+    manager = DB_Manager(database)
+    stream = replay.synthetic_stream(
+        replay.StreamBuilder(), projects, [s[0] for s in manager.get_statuses()],
+        manager.get_skills(), PROJECTS_PAGE_SIZE
+    )
+    manager.close()
+    with open(updates, "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(u, ensure_ascii=False) + "\n" for u in stream)
+
+    results = {}
+    for bot in ("sync", "async"):
+        out = os.path.join(workdir, f"{bot}.json")
+        subprocess.run(
+            [sys.executable, replay.__file__, "--bot", bot, "--updates", updates,
+             "--database", database, "--latency", str(latency), "--out", out],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        with open(out, encoding="utf-8") as f:
+            results[bot] = json.load(f)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    sync, async_ = results["sync"], results["async"]
+    print(f"{len(stream):,} обновлений, Bot API {latency * 1000:.0f} мс на вызов")
+    _report("обработка обновлений", sync["throughput"], async_["throughput"])
+    for name, result in (("main.py", sync), ("async_main.py", async_)):
+        p95 = max(c["p95_ms"] for c in result["commands"].values())
+        print(f"{name:<14} {result['seconds']:>7.2f} с   ошибок {result['errors']}   "
+              f"худший p95 {p95:>9,.0f} мс   SQL на обновление {result['queries_per_update']}   "
+              f"RSS {result['peak_rss_mb']} МБ")
+
+
+def _wizard_step(message, *args):
+    pass
+
+
+def _traced(build) -> tuple[object, int]:
+    tracemalloc.start()
+    obj = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, size
+
+
+def bench_state(users: int = 10_000, projects: int = 20):
+    """Память на активный диалог: замыкания со списками против записей."""
+    def closures():
+        # так было: в шаг передавался свежий список имён проектов пользователя
+        handlers = {}
+        for uid in range(users):
+            names = [f"Проект {uid}-{k}" for k in range(projects)]
+            handlers[uid] = [{"callback": _wizard_step, "args": (names,), "kwargs": {}}]
+        return handlers
+
+    def records(backend):
+        for uid in range(users):
+            backend.register_handler(uid, {"callback": _wizard_step, "args": (f"Проект {uid}-0",)})
+        return backend
+
+    _, before = _traced(closures)
+    _, after = _traced(lambda: records(MemoryStateBackend(ttl=3600, maxsize=users)))
+    _, in_redis = _traced(lambda: records(RedisStateBackend(LocalRedis(), ttl=3600)))
+    print(f"память на диалог: {before / users:,.0f} Б -> {after / users:,.0f} Б "
+          f"(LocalRedis вместо Redis: {in_redis / users:,.0f} Б)")
+
+    def rate(backend) -> float:
+        start = time.perf_counter()
+        for uid in range(users):
+            backend.register_handler(uid, {"callback": _wizard_step, "args": ("Проект",)})
+        for uid in range(users):
+            assert backend.get_handlers(uid)[0]["callback"] is _wizard_step
+        return 2 * users / (time.perf_counter() - start)
+
+    manager, path = _fresh_manager()
+    print(f"SQLite: {rate(SqliteStateBackend(manager, ttl=3600)):,.0f} операций с состоянием/с")
+    _cleanup(manager, path)
+    print(f"Redis (LocalRedis): {rate(RedisStateBackend(LocalRedis(), ttl=3600)):,.0f} "
+          "операций с состоянием/с")
+
+
+def _recorded_update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": "/projects",
+            "chat": {"id": update_id % 1000, "type": "private"},
+            "from": {"id": update_id % 1000, "is_bot": False, "first_name": "u"},
+        },
+    }
+
+
+def bench_webhook(updates: int = 20_000, clients: int = 16, rtt: float = 0.02):
+    """Приём обновлений: webhook против long polling по 100 штук."""
+    processed = []
+    server = WebhookServer(processed.extend, lambda u: u, "secret", port=0,
+                           host="127.0.0.1")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def client(offset: int):
+        conn = http.client.HTTPConnection("127.0.0.1", server.port)
+        headers = {SECRET_HEADER: "secret", "Content-Type": "application/json"}
+        for i in range(offset, updates, clients):
+            conn.request("POST", "/", json.dumps(_recorded_update(i)), headers)
+            conn.getresponse().read()
+        conn.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    while len(processed) < server.accepted:
+        time.sleep(0.001)
+    webhook_rate = len(processed) / (time.perf_counter() - start)
+    server.shutdown()
+
+    # long polling: getUpdates отдаёт до 100 обновлений за один сетевой круг
+    batch = json.dumps({"ok": True, "result": [_recorded_update(i) for i in range(100)]})
+    got = 0
+    start = time.perf_counter()
+    while got < updates:
+        time.sleep(rtt)
+        got += len(json.loads(batch)["result"])
+    polling_rate = got / (time.perf_counter() - start)
+
+    _report("приём обновлений", polling_rate, webhook_rate)
+    print(f"отклонено при переполнении: {server.rejected}")
+
+
+WORDS = ("telegram", "бот", "python", "парсер", "сайт", "игра", "погода",
+         "магазин", "api", "портфолио", "django", "sqlite", "нейросеть", "чат")
+
+
+def bench_search(n_projects: int = 200_000, users: int = 20, n: int = 2000):
+    """Задержка /search (FTS5) на большой базе против LIKE по проектам пользователя."""
+    manager, path = _fresh_manager()
+    rnd = random.Random(0)
+    start = time.perf_counter()
+    for chunk in range(0, n_projects, 10_000):
+        manager.insert_project([
+            (i % users, " ".join(rnd.sample(WORDS, 3)) + f" {i}",
+             f"https://example.com/{rnd.choice(WORDS)}", 1)
+            for i in range(chunk, chunk + 10_000)
+        ])
+    print(f"{n_projects:,} проектов загружено за {time.perf_counter() - start:.1f} с")
+
+    conn = manager._connect()
+
+    # для ранжирования LIKE всё равно пришлось бы выбрать все совпадения
+    def like(i):
+        word = f"%{WORDS[i % len(WORDS)][:4]}%"
+        conn.execute(
+            "SELECT project_id FROM projects WHERE user_id=? AND "
+            "(project_name LIKE ? OR description LIKE ? OR url LIKE ?)",
+            (i % users, word, word, word)
+        ).fetchall()
+
+    def fts(i):
+        manager.search_projects(i % users, WORDS[i % len(WORDS)][:4])
+
+    _report("поиск по проектам", _ops(like, n), _ops(fts, n))
+    latencies = []
+    for i in range(n):
+        t = time.perf_counter()
+        fts(i)
+        latencies.append(time.perf_counter() - t)
+    print(f"FTS p50 {_percentile(latencies, 0.5) * 1000:.3f} мс   "
+          f"p99 {_percentile(latencies, 0.99) * 1000:.3f} мс")
+    _cleanup(manager, path)
+
+
+def bench_import(n_projects: int = 100_000, n_wizard: int = 5000):
+    """Импорт портфолио из JSON Lines пачками против проекта за проектом, как в мастере."""
+    manager, path = _fresh_manager()
+    rnd = random.Random(0)
+    skills = [s[1] for s in manager.get_skills()]
+
+    def wizard(i):
+        name = f"wizard {i}"
+        manager.insert_project([(1, name, "https://example.com", 1)])
+        manager.update_projects("description", (" ".join(rnd.sample(WORDS, 3)), name, 1))
+        manager.insert_skill(1, name, skills[i % len(skills)])
+
+    # файл генерируется на лету: в памяти не бывает больше одной пачки
+    def lines(n):
+        for i in range(n):
+            yield json.dumps({
+                "name": f"import {i}", "description": " ".join(rnd.sample(WORDS, 3)),
+                "url": "https://example.com", "status": "Обновлен",
+                "skills": rnd.sample(skills, 2),
+            }, ensure_ascii=False) + "\n"
+
+    before = _ops(wizard, n_wizard)
+    start = time.perf_counter()
+    count = transfer.import_records(manager, 2, transfer.read_records(lines(n_projects)))
+    elapsed = time.perf_counter() - start
+    _report("импорт проектов", before, count / elapsed)
+    print(f"{count:,} проектов за {elapsed:.1f} с")
+
+    # пик памяти не зависит от размера файла: меряем на части, tracemalloc медленный
+    for n in (n_projects // 10, n_projects // 4):
+        tracemalloc.start()
+        transfer.import_records(manager, 3, transfer.read_records(lines(n)))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"импорт {n:,} проектов: пик памяти {peak / 2**20:.1f} МБ")
+
+    start = time.perf_counter()
+    size = sum(len(line) for line in transfer.export_lines(manager, 2))
+    print(f"экспорт: {time.perf_counter() - start:.1f} с, {size / 2**20:.1f} МБ")
+    _cleanup(manager, path)
+
+
+def bench_skills(n: int = 2000, per_project: int = 4):
+    """Навыки проекта: по одному через insert_skill против set_project_skills разом."""
+    manager, path = _fresh_manager()
+    skills = [s[1] for s in manager.get_skills()][:per_project]
+    manager.insert_project([(1, f"one {i}", "", 1) for i in range(n)]
+                           + [(1, f"batch {i}", "", 1) for i in range(n)])
+    ids = {p[2]: p[0] for p in manager.get_projects(1)}
+
+    def one_by_one(i):
+        for skill in skills:
+            manager.insert_skill(1, f"one {i}", skill)
+
+    def batched(i):
+        manager.set_project_skills(1, ids[f"batch {i}"], skills)
+
+    _report(f"{per_project} навыка на проект", _ops(one_by_one, n), _ops(batched, n))
+    _cleanup(manager, path)
+
+
+def bench_group_commit(writers: int = 50, per_writer: int = 200):
+    """Правки из 50 потоков: каждая своей транзакцией против group commit."""
+
+    def stress(group_commit: bool) -> float:
+        manager, path = _fresh_manager(group_commit=group_commit)
+        manager.insert_project([(w, f"p{w}", "", 1) for w in range(writers)])
+        barrier = threading.Barrier(writers + 1)
+
+        def writer(w):
+            barrier.wait()
+            for i in range(per_writer):
+                if i % 2:
+                    manager.update_projects("description", (f"правка {i}", f"p{w}", w))
+                else:
+                    manager.insert_project([(w, f"p{w} {i}", "", 1)])
+
+        threads = [threading.Thread(target=writer, args=(w,)) for w in range(writers)]
+        for t in threads:
+            t.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for t in threads:
+            t.join()
+        rate = writers * per_writer / (time.perf_counter() - start)
+        if manager._writer is not None:
+            print(f"транзакций: {manager._writer.commits:,} на {manager._writer.writes:,} изменений")
+        _cleanup(manager, path)
+        return rate
+
+    _report(f"записи, {writers} потоков", stress(False), stress(True))
+
+
+def bench_metrics(n: int = 200_000):
+    """Цена замеров: DB_Manager без метрик и с ними, плюс выдача /metrics."""
+    plain, plain_path = _fresh_manager()
+    metrics = Metrics(slow_query=1.0)
+    timed, timed_path = _fresh_manager(metrics=metrics)
+    for manager in (plain, timed):
+        manager.insert_project([(i % USERS, f"p{i}", "", 1) for i in range(N)])
+
+    for title, func, count in (
+        ("get_projects (из кэша)", lambda m, i: m.get_projects(i % USERS), n),
+        ("get_project_card (SQL)", lambda m, i: m.get_project_card(i % USERS, f"p{i % N}"), n // 10),
+    ):
+        before = _ops(lambda i: func(plain, i), count)
+        after = _ops(lambda i: func(timed, i), count)
+        _report(title, before, after)
+        print(f"{'':<28} +{(1 / after - 1 / before) * 1e6:.2f} мкс на вызов с метриками")
+
+    start = time.perf_counter()
+    text = metrics.render()
+    print(f"/metrics: {len(text.splitlines())} строк за {(time.perf_counter() - start) * 1000:.2f} мс")
+    print(metrics.summary(5))
+    _cleanup(plain, plain_path)
+    _cleanup(timed, timed_path)
+
+
+def bench_markup(n: int = 20_000):
+    """Клавиатура на каждое сообщение: сборка и JSON заново против кэша ui."""
+    import ui  # нужен telebot, поэтому не на уровне модуля
+
+    statuses = ["На этапе проектирования", "В процессе разработки",
+                "Разработан. Готов к использованию.", "Обновлен",
+                "Завершен. Не поддерживается"]
+    projects = [f"Проект {i}" for i in range(30)]
+    cards = [(i, f"Проект {i}") for i in range(10)]
+    for title, build, cached in (
+        ("статусы", lambda: ui.build_reply_markup(statuses).to_json(),
+         lambda: ui.gen_reply_markup(statuses)),
+        ("30 проектов", lambda: ui.build_reply_markup(projects).to_json(),
+         lambda: ui.gen_reply_markup(projects)),
+        ("страница /projects", lambda: ui.build_page_markup(cards, True, True).to_json(),
+         lambda: ui.gen_page_markup(cards, True, True)),
+    ):
+        before, after = _ops(lambda i: build(), n), _ops(lambda i: cached(), n)
+        _report(title, before, after)
+        print(f"{'':<28} {1e6 / before:.1f} мкс -> {1e6 / after:.1f} мкс на сообщение")
+
+
+class FloodLimitedBotAPI:
+    """Локальный HTTP Bot API: sendMessage с лимитами Telegram и ответом 429."""
+
+    def __init__(self, rate: float, chat_rate: float, chat_burst: int):
+        self.delivered = 0
+        self.flooded = 0
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        # Telegram считает общий лимит в среднем за секунду: небольшие
+        # неровности прихода запросов он прощает
+        self._global = TokenBucket(rate, burst=max(1, int(rate / 30)))
+        self._chats: dict[int, TokenBucket] = {}
+        self._lock = threading.Lock()
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # заголовки и тело уходят разными write: без этого каждый ответ
+            # ждёт отложенного ACK клиента (~40 мс)
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                chat_id = int(parse_qs(body.decode())["chat_id"][0])
+                wait = api.check(chat_id)
+                if wait:
+                    reply = {"ok": False, "error_code": 429,
+                             "parameters": {"retry_after": wait}}
+                else:
+                    reply = {"ok": True, "result": {"chat": {"id": chat_id}}}
+                data = json.dumps(reply).encode()
+                self.send_response(429 if wait else 200)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            request_queue_size = 128  # все чаты подключаются разом
+
+        self.httpd = Server(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/botTOKEN/sendMessage"
+
+    def check(self, chat_id: int) -> float:
+        """0 — сообщение принято, иначе retry_after."""
+        now = time.monotonic()
+        with self._lock:
+            chat = self._chats.setdefault(chat_id, TokenBucket(self.chat_rate, self.chat_burst))
+            wait = max(self._global.delay(now), chat.delay(now))
+            if wait:
+                self.flooded += 1
+                return wait
+            self._global.take(now)
+            chat.take(now)
+            self.delivered += 1
+            return 0
+
+
+class _Response:
+    def __init__(self, status: int, body: bytes):
+        self.status_code = status
+        self._body = body
+
+    def json(self):
+        return json.loads(self._body)
+
+
+def _http_sender():
+    """Функция как requests.request поверх keep-alive соединения потока."""
+    local = threading.local()
+
+    def send(method, url, params=None, files=None, **kwargs):
+        if not hasattr(local, "conn"):
+            local.conn = http.client.HTTPConnection(urlsplit(url).netloc)
+        local.conn.request(method.upper(), urlsplit(url).path, urlencode(params),
+                           {"Content-Type": "application/x-www-form-urlencoded"})
+        resp = local.conn.getresponse()
+        return _Response(resp.status, resp.read())
+    return send
+
+
+def bench_sender(chats: int = 60, per_chat: int = 20, scale: float = 10):
+    """
+    Всплеск исходящих сообщений: без лимитера против SendLimiter.
+    Лимиты Telegram ускорены в scale раз, чтобы сценарий шёл секунды.
+    """
+    rate, chat_rate, burst = 30 * scale, 1 * scale, 3
+
+    def run(send, prepare=lambda chat_id: nullcontext()) -> tuple[int, float, dict]:
+        api = FloodLimitedBotAPI(rate, chat_rate, burst)
+        latencies: dict[int, list[float]] = {}
+
+        def chat(chat_id: int):
+            with prepare(chat_id):
+                for _ in range(per_chat):
+                    start = time.perf_counter()
+                    send("post", api.url, params={"chat_id": chat_id, "text": "привет"})
+                    latencies.setdefault(chat_id, []).append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=chat, args=(i + 1,)) for i in range(chats)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        api.httpd.shutdown()
+        return api.delivered, elapsed, latencies
+
+    total = chats * per_chat
+    delivered, elapsed, _ = run(_http_sender())
+    print(f"без лимитера: доставлено {delivered} из {total} "
+          f"({delivered / elapsed:,.0f} сообщ/с), потеряно на 429: {total - delivered}")
+
+    limiter = SendLimiter(rate, chat_rate, burst)
+    delivered, elapsed, _ = run(limiter.request_sender(_http_sender()))
+    print(f"SendLimiter:  доставлено {delivered} из {total} "
+          f"({delivered / elapsed:,.0f} сообщ/с, предел {rate:.0f}), "
+          f"повторов после 429: {limiter.retries}")
+
+    # половина чатов — массовый вывод; ответы остальным не должны ждать за ним
+    for title, prioritize in (("без приоритета", False), ("с приоритетом", True)):
+        limiter = SendLimiter(rate, chat_rate, burst)
+        bulk = lambda chat_id: limiter.bulk() if prioritize and chat_id % 2 else nullcontext()
+        _, _, latencies = run(limiter.request_sender(_http_sender()), bulk)
+        interactive = [x for c, v in latencies.items() if c % 2 == 0 for x in v]
+        mass = [x for c, v in latencies.items() if c % 2 for x in v]
+        print(f"{title:<16} ожидание p95: ответы {_percentile(interactive, 0.95) * 1000:>6.0f} мс"
+              f", массовый вывод {_percentile(mass, 0.95) * 1000:>6.0f} мс")
+
+    # общие рабочие потоки ChatDispatcher: один чат пишет без остановки, его
+    # соседи по потоку — по разу; сон на лимите чата держал и соседей
+    chatty = 1000  # чётные чаты попадают в тот же поток, что и он
+    for title, paced in (("сон в потоке", False), ("чат откладывается", True)):
+        limiter = SendLimiter(rate, chat_rate, burst)
+        api = FloodLimitedBotAPI(rate, chat_rate, burst)
+        send = limiter.request_sender(_http_sender())
+        neighbours = []
+
+        def handler(chat_id: int, queued: float):
+            with limiter.pacing() if paced else nullcontext():
+                send("post", api.url, params={"chat_id": chat_id, "text": "привет"})
+            if chat_id != chatty:
+                neighbours.append(time.perf_counter() - queued)
+
+        dispatcher = ChatDispatcher(2, delay=limiter.chat_delay if paced else None)
+        start = time.perf_counter()
+        for i in range(per_chat * 2):
+            dispatcher.submit(chatty, handler, chatty, time.perf_counter())
+            dispatcher.submit(2 * (i + 1), handler, 2 * (i + 1), time.perf_counter())
+        dispatcher.shutdown()
+        elapsed = time.perf_counter() - start
+        api.httpd.shutdown()
+        print(f"{title:<18} соседи частого чата: p95 {_percentile(neighbours, 0.95) * 1000:>6.0f} мс"
+              f", всё за {elapsed:.1f} с, 429: {api.flooded}")
+
+
+def _bench_shard(shard: int, shards: int, path: str):
+    """Шард для bench_shards: /search по каждому обновлению."""
+    manager = DB_Manager(path)
+
+    def process_updates(updates):
+        for update in updates:
+            message = json.loads(json.dumps(update))["message"]  # как Update.de_json
+            manager.search_projects(message["chat"]["id"], message["text"])
+
+    return process_updates, manager.close
+
+
+def bench_shards(updates: int = 20_000, users: int = 2000, max_shards: int = None):
+    """Обработка потока обновлений в 1..N процессах-шардах с общей базой."""
+    max_shards = max_shards or os.cpu_count()
+    manager, path = _fresh_manager()
+    rnd = random.Random(0)
+    manager.insert_project([
+        (i % users, " ".join(rnd.sample(WORDS, 3)) + f" {i}", "", 1)
+        for i in range(users * 10)
+    ])
+    manager.close()
+    stream = [
+        {"update_id": i, "message": {"message_id": i, "date": 0,
+                                     "text": WORDS[i % len(WORDS)],
+                                     "chat": {"id": i % users, "type": "private"}}}
+        for i in range(updates)
+    ]
+    print(f"ядер: {os.cpu_count()}")
+    base = None
+    shards = 1
+    while shards <= max_shards:
+        supervisor = Supervisor(shards, _bench_shard, path)
+        supervisor.start()
+        start = time.perf_counter()
+        for i in range(0, updates, 100):
+            supervisor.dispatch(stream[i:i + 100])
+        supervisor.shutdown()
+        rate = updates / (time.perf_counter() - start)
+        base = base or rate
+        print(f"{shards:>2} шардов: {rate:>8,.0f} upd/с   x{rate / base:.1f}")
+        shards *= 2
+    _cleanup(manager, path)
+
+
+def bench_photos(synthetic: int = 8, uplink: float = 1_000_000):
+    """
+    Уменьшенные копии фото: байты на диске и время выгрузки в Telegram
+    (uplink — байт/с до api.telegram.org) для оригинала и копий.
+    """
+    from PIL import Image, ImageFilter  # нужен Pillow, поэтому не на уровне модуля
+
+    import photos
+
+    root = tempfile.mkdtemp()
+    store = photos.PhotoStore(root, 50 * 1024 * 1024, workers=2)
+    names = []
+    sample = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "project_photos", "1507452899_Renwene.jpg")
+    if os.path.exists(sample):
+        with open(sample, "rb") as f:
+            names.append(store.save([f.read()]))
+    # снимки с телефона: крупные, плавные переходы с мелкими деталями
+    rnd = random.Random(0)
+    for i in range(synthetic):
+        w, h = rnd.choice(((4032, 3024), (2560, 1920), (1920, 1080)))
+        noise = Image.effect_noise((w, h), 40).filter(ImageFilter.GaussianBlur(2))
+        image = Image.merge("RGB", (
+            Image.linear_gradient("L").resize((w, h)), noise,
+            Image.radial_gradient("L").resize((w, h)),
+        ))
+        fd, tmp = tempfile.mkstemp(suffix=".jpg")
+        os.close(fd)
+        image.save(tmp, "JPEG", quality=95)
+        with open(tmp, "rb") as f:
+            names.append(store.save([f.read()]))
+        os.remove(tmp)
+
+    start = time.perf_counter()
+    for name in names:
+        store.schedule_variants(name)
+    store.close()
+    print(f"{len(names)} фото обработано за {time.perf_counter() - start:.1f} с")
+
+    sizes = {"оригинал": 0}
+    for name in names:
+        sizes["оригинал"] += os.path.getsize(store.path(name))
+        for kind in photos.VARIANTS:
+            size = os.path.getsize(store.path(photos.variant_name(name, kind)))
+            sizes[kind] = sizes.get(kind, 0) + size
+    for kind, size in sizes.items():
+        print(f"{kind:<10} {size / len(names) / 1024:>8.0f} КБ на фото   "
+              f"выгрузка {size / len(names) / uplink * 1000:>6.0f} мс")
+    for dirpath, _, files in os.walk(root, topdown=False):
+        for f in files:
+            os.remove(os.path.join(dirpath, f))
+        os.rmdir(dirpath)
+
+
+def bench_share(projects: int = 20, n: int = 5000):
+    """Просмотр /share: сборка страницы из БД на каждого зрителя против снимка на диске."""
+    manager, path = _fresh_manager()
+    skills = [s[1] for s in manager.get_skills()]
+    manager.insert_project([(1, f"Проект {i}", f"https://example.com/{i}", 1)
+                            for i in range(projects)])
+    for pid, *_ in manager.get_projects(1):
+        manager.set_project_skills(1, pid, skills[:2])
+    root = tempfile.mkdtemp()
+    store = share.SnapshotStore(root)
+    token = manager.share_portfolio(1, share.new_token())
+
+    def render(i):
+        store.build(manager, 1, i)
+
+    def snapshot(i):
+        with open(store.get(manager, token).html_path, "rb") as f:
+            f.read()
+
+    _report(f"просмотр, {projects} проектов", _ops(render, n), _ops(snapshot, n))
+    etag = store.get(manager, token).etag
+    revalidate = _ops(lambda i: store.get(manager, token).etag == etag, n)
+    print(f"повторный просмотр (304 по ETag): {revalidate:,.0f} оп/с")
+    _cleanup(manager, path)
+    for dirpath, _, files in os.walk(root, topdown=False):
+        for f in files:
+            os.remove(os.path.join(dirpath, f))
+        os.rmdir(dirpath)
+
+
+# Сводки /stats вручную: то, что без материализации делалось бы на каждый запрос
+ON_THE_FLY = {
+    "статусы пользователя": ('''
+        SELECT st.status_name, COUNT(*) AS n
+        FROM projects p LEFT JOIN status st ON p.status_id=st.status_id
+        WHERE p.user_id=? GROUP BY p.status_id ORDER BY n DESC
+    ''', "get_status_stats"),
+    "навыки пользователя": ('''
+        SELECT s.skill_name, COUNT(*) AS n
+        FROM projects p
+        JOIN project_skills ps ON ps.project_id=p.project_id
+        JOIN skills s ON ps.skill_id=s.skill_id
+        WHERE p.user_id=? GROUP BY s.skill_id ORDER BY n DESC LIMIT 5
+    ''', "get_top_skills"),
+    "навыки всех": ('''
+        SELECT s.skill_name, COUNT(*) AS n
+        FROM project_skills ps JOIN skills s ON ps.skill_id=s.skill_id
+        GROUP BY s.skill_id ORDER BY n DESC LIMIT 5
+    ''', None),
+    "пары навыков": ('''
+        SELECT a.skill_id, b.skill_id, COUNT(*) AS n
+        FROM project_skills a JOIN project_skills b
+          ON a.project_id=b.project_id AND a.skill_id < b.skill_id
+        GROUP BY 1, 2 ORDER BY n DESC LIMIT 5
+    ''', None),
+}
+
+
+def bench_stats(n_links: int = 1_000_000, per_project: int = 4, n_skills: int = 40,
+                n: int = 2000):
+    """/stats: GROUP BY на каждый запрос против сводок, которые ведут триггеры."""
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    conn = sqlite3.connect(path)
+    MIGRATIONS[0](conn)
+    conn.execute("PRAGMA user_version=1")
+    rnd = random.Random(0)
+    n_projects = n_links // per_project
+    users = n_projects // PROJECTS_PER_USER
+    with conn:
+        conn.executemany("INSERT INTO skills (skill_id, skill_name) VALUES(?,?)",
+                         ((i, f"навык {i}") for i in range(1, n_skills + 1)))
+        conn.executemany(
+            "INSERT INTO projects (project_id, user_id, project_name, status_id)"
+            " VALUES(?,?,?,?)",
+            ((pid, pid % users, f"project {pid}", rnd.randint(1, 5))
+             for pid in range(1, n_projects + 1))
+        )
+        # популярность навыков неравномерна, как в жизни
+        weights = [1 / i for i in range(1, n_skills + 1)]
+
+        def pick():
+            picked = set()
+            while len(picked) < per_project:
+                picked.update(rnd.choices(range(1, n_skills + 1), weights,
+                                          k=per_project - len(picked)))
+            return picked
+
+        conn.executemany(
+            "INSERT INTO project_skills VALUES(?,?)",
+            ((pid, skill) for pid in range(1, n_projects + 1) for skill in pick())
+        )
+    links = conn.execute("SELECT COUNT(*) FROM project_skills").fetchone()[0]
+    conn.close()
+    start = time.perf_counter()
+    manager = DB_Manager(path)
+    print(f"{links:,} навыков проектов, миграция со сводками {time.perf_counter() - start:.1f} с")
+
+    conn = manager._connect()
+    for title, (sql, method) in ON_THE_FLY.items():
+        if method is None:
+            # по всей базе: секунды на запрос, хватит нескольких повторов
+            before = _ops(lambda i: conn.execute(sql).fetchall(), 3)
+            after = _ops(lambda i: manager.get_skill_pairs() if "пары" in title
+                         else manager.get_top_skills(), n)
+        else:
+            before = _ops(lambda i: conn.execute(sql, (i % users,)).fetchall(), n)
+            after = _ops(lambda i: getattr(manager, method)(i % users), n)
+        _report(title, before, after)
+        if method is None:
+            print(f"{'':<28} GROUP BY: {1000 / before:,.0f} мс на запрос")
+
+    # цена триггеров: правка навыков проекта со сводками и без них
+    skills = [s[1] for s in manager.get_skills()]
+
+    def edit(i):
+        pid = i * 7919 % n_projects + 1
+        manager.set_project_skills(pid % users, pid, rnd.sample(skills, per_project))
+
+    with_stats = _ops(edit, n)
+    for name in ("stats_skill_insert", "stats_skill_delete"):
+        conn.execute(f"DROP TRIGGER {name}")
+    _report("правка навыков (без сводок)", _ops(edit, n), with_stats)
+    _cleanup(manager, path)
+
+
+def bench_startup(n_projects: int = 100_000, workers: int = 8, runs: int = 20):
+    """
+    Холодный старт слоя БД: от создания DB_Manager до ответа на первое
+    обновление в рабочем потоке. Было — миграции и запись справочников на
+    каждом старте, соединение потока открывается первым обновлением;
+    стало — bootstrap() без записи и прогрев потоков (main.startup).
+    """
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    conn = sqlite3.connect(path)
+    MIGRATIONS[0](conn)
+    conn.execute("PRAGMA user_version=1")
+    users = _generate(conn, n_projects)
+    conn.close()
+    DB_Manager(path).close()
+
+    def update(manager, i):
+        manager.pop_state(i % users)
+        manager.get_project_page(i % users, limit=10)
+
+    def cold_start(warm: bool, i: int) -> tuple[float, float]:
+        start = time.perf_counter()
+        manager = DB_Manager(path, bootstrap=False)
+        dispatcher = ChatDispatcher(workers)
+        if warm:
+            manager.bootstrap()
+            dispatcher.run_on_workers(manager.warm_up)
+        else:
+            manager.migrate()
+            manager.default_insert()
+        ready = time.perf_counter()
+        done = threading.Event()
+        dispatcher.submit(i, lambda: (update(manager, i), done.set()))
+        done.wait()
+        first = time.perf_counter() - ready
+        dispatcher.shutdown()
+        manager.close()
+        return ready - start, first
+
+    results = {}
+    for warm in (False, True):
+        samples = [cold_start(warm, i) for i in range(runs)]
+        results[warm] = [sum(s[k] for s in samples) / runs for k in (0, 1)]
+    for k, title in enumerate(("до готовности", "первое обновление")):
+        before, after = results[False][k] * 1000, results[True][k] * 1000
+        print(f"{title:<28} до: {before:>8.2f} мс   после: {after:>8.2f} мс")
+    _cleanup(DB_Manager(path), path)
+
+
+def bench_maintenance(n_projects: int = 200_000, users: int = 2000):
+    """
+    Задержка правок бота во время обслуживания: всё одним заходом
+    (DELETE, ANALYZE, VACUUM) против порций maintenance.py.
+    """
+    manager, path = _fresh_manager()
+    rnd = random.Random(0)
+    for chunk in range(0, n_projects, 10_000):
+        manager.insert_project([(i % users, f"project {i}", "x" * 200, 1)
+                                for i in range(chunk, chunk + 10_000)])
+    conn = manager._connect()
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO project_skills VALUES(?,?)",
+                         ((pid, rnd.randint(1, 4)) for pid in range(1, n_projects + 1, 2)))
+    # половина проектов удалена — свободные страницы; навыки-сироты пишутся в обход ключей
+    manager._write(lambda c: c.execute("DELETE FROM projects WHERE user_id % 2 = 0"))
+    conn.execute("PRAGMA foreign_keys=OFF")
+    with conn:
+        conn.executemany("INSERT INTO project_skills VALUES(?,?)",
+                         ((n_projects + i, 1) for i in range(20_000)))
+    conn.execute("PRAGMA foreign_keys=ON")
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    print(f"свободных страниц: {free:,}, файл {os.path.getsize(path) / 2**20:.1f} МБ")
+    copy = path + ".copy"
+    dst = sqlite3.connect(copy)
+    conn.backup(dst)
+    dst.close()
+    manager.close()
+
+    def under_load(db: str, job) -> tuple[float, list[float]]:
+        manager = DB_Manager(db)
+        latencies, stop = [], threading.Event()
+
+        def bot():
+            i = 0
+            while not stop.is_set():
+                t = time.perf_counter()
+                manager.update_projects("description", (f"правка {i}", f"project {i * 2 + 1}",
+                                                        (i * 2 + 1) % users))
+                latencies.append(time.perf_counter() - t)
+                i += 1
+                time.sleep(0.001)
+
+        thread = threading.Thread(target=bot)
+        thread.start()
+        start = time.perf_counter()
+        job(manager)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        thread.join()
+        manager.close()
+        return elapsed, latencies
+
+    def monolithic(manager):
+        c = manager._connect()
+        with c:
+            c.execute("BEGIN IMMEDIATE")
+            c.execute("DELETE FROM project_skills WHERE project_id NOT IN (SELECT project_id FROM projects)")
+            c.execute("ANALYZE")
+        c.execute("VACUUM")
+
+    for title, db, job in (("одним заходом", path, monolithic),
+                           ("порциями", copy, lambda m: Maintenance(m).run())):
+        elapsed, latencies = under_load(db, job)
+        print(f"{title:<16} {elapsed:>6.2f} с   правок {len(latencies):>6,}   "
+              f"p99 {_percentile(latencies, 0.99) * 1000:>7.1f} мс   "
+              f"max {max(latencies) * 1000:>7.1f} мс   "
+              f"файл {os.path.getsize(db) / 2**20:.1f} МБ")
+    os.remove(copy)
+    _cleanup(DB_Manager(path), path)
+
+
+SCENARIOS = {
+    "connections": bench_connections,
+    "indexes": bench_indexes,
+    "cache": bench_cache,
+    "dispatcher": bench_dispatcher,
+    "async": bench_async,
+    "state": bench_state,
+    "webhook": bench_webhook,
+    "search": bench_search,
+    "import": bench_import,
+    "skills": bench_skills,
+    "group_commit": bench_group_commit,
+    "metrics": bench_metrics,
+    "markup": bench_markup,
+    "sender": bench_sender,
+    "shards": bench_shards,
+    "photos": bench_photos,
+    "share": bench_share,
+    "stats": bench_stats,
+    "startup": bench_startup,
+    "maintenance": bench_maintenance,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or SCENARIOS:
+        print(f"== {name} ==")
+        SCENARIOS[name]()
@@ -0,0 +1,60 @@
+# cache.py
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Потокобезопасный LRU-кэш с временем жизни записей.
+    Считает попадания и промахи — см. stats().
+    """
+
+    def __init__(self, maxsize: int, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        # растёт при каждой инвалидации: загрузка, начатая до неё,
+        # не должна положить в кэш устаревшее значение
+        self._generation = 0
+
+    def get_or_load(self, key, loader):
+        """Вернуть значение по ключу, при промахе вызвать loader()."""
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and (self.ttl is None or item[1] > now):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[0]
+            self.misses += 1
+            generation = self._generation
+
+        value = loader()
+        expires = now + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if generation == self._generation:
+                self._data[key] = (value, expires)
+                self._data.move_to_end(key)
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+        return value
+
+    def invalidate(self, *keys):
+        """Удалить указанные ключи."""
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
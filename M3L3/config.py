@@ -1,4 +1,98 @@
 # config.py
+# Значения по умолчанию. Любое можно переопределить переменной окружения
+# PORTFOLIO_<ИМЯ> (PORTFOLIO_TOKEN, PORTFOLIO_WORKERS=16, ...) — см. конец файла.
+import os
 
 TOKEN = ""
 DATABASE = "my_database.db"
+# Потоков для обработки обновлений (чаты распределяются между ними)
+WORKERS = 8
+# Хранилище фото проектов и максимальный размер одного фото (байт)
+PHOTOS_DIR = "project_photos"
+MAX_PHOTO_SIZE = 10 * 1024 * 1024
+# Процессов, готовящих уменьшенные копии фото (нужен Pillow)
+PHOTO_WORKERS = 2
+# Где хранить шаги незавершённых мастеров: memory, sqlite или redis
+STATE_BACKEND = "sqlite"
+STATE_TTL = 24 * 60 * 60
+REDIS_URL = "redis://localhost:6379/0"
+# Режим webhook: если WEBHOOK_URL задан, бот принимает обновления по HTTP
+# вместо поллинга. Секрет Telegram присылает в заголовке каждого запроса;
+# он обязателен (1-256 символов A-Z, a-z, 0-9, _ и -), без него webhook не запустится.
+WEBHOOK_URL = ""
+WEBHOOK_SECRET = ""
+WEBHOOK_HOST = "0.0.0.0"
+WEBHOOK_PORT = 8443
+# Писать изменения БД одним потоком, объединяя их в общие транзакции
+# (group commit): выгодно при множестве одновременных правок
+GROUP_COMMIT = False
+# Метрики: время обработчиков, запросов к БД и вызовов Telegram API.
+# Prometheus забирает их с http://METRICS_HOST:METRICS_PORT/metrics,
+# сводка пишется в лог раз в METRICS_LOG_INTERVAL секунд
+METRICS_ENABLED = False
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9100
+METRICS_LOG_INTERVAL = 300
+# Запросы дольше этого (секунд) попадают в лог медленных
+SLOW_QUERY_SECONDS = 0.05
+# Не больше стольких сообщений в секунду на бота (лимит Telegram ~30);
+# по чатам действуют свои лимиты, ответ 429 повторяется после паузы.
+# 0 — не ограничивать (только синхронный бот)
+SEND_RATE = 30
+# supervisor.py: столько процессов-шардов обрабатывают обновления,
+# чаты раздаются по chat_id. SHARD_DATABASES — у каждого шарда своя база
+# (my_database.0.db, ...): в личных чатах chat_id = user_id, так что
+# проекты пользователя лежат в базе его шарда; без него база общая
+SHARDS = 4
+SHARD_DATABASES = False
+# /share: снимки портфолио хранятся в SHARE_DIR. Если задан SHARE_URL
+# (внешний адрес сервера снимков), бот даёт ссылку и поднимает сервер на
+# SHARE_HOST:SHARE_PORT; иначе присылает страницу файлом. В supervisor.py
+# сервер поднимает шард 0, а с SHARD_DATABASES ссылок нет — только файл
+SHARE_DIR = "share_snapshots"
+SHARE_URL = ""
+SHARE_HOST = "0.0.0.0"
+SHARE_PORT = 8080
+# Проектов на одной странице /projects
+PROJECTS_PAGE_SIZE = 10
+# Сколько результатов показывать в /search
+SEARCH_LIMIT = 10
+# Максимальная длина названия навыка, созданного пользователем
+SKILL_NAME_MAX = 64
+# Пробы для оркестратора: GET /healthz — процесс жив, /readyz — схема
+# готова и бот принимает обновления. 0 — не поднимать сервер проб
+HEALTH_HOST = "0.0.0.0"
+HEALTH_PORT = 8081
+# Фоновое обслуживание (maintenance.py): осиротевшие навыки и файлы фото,
+# ANALYZE, возврат свободного места — короткими порциями раз
+# в MAINTENANCE_INTERVAL секунд. 0 — выключено
+MAINTENANCE_INTERVAL = 6 * 60 * 60
+# Сливать проекты, чьи имена отличаются только регистром и пробелами;
+# по умолчанию такие проекты только подсчитываются в отчёте
+MAINTENANCE_MERGE_DUPLICATES = False
+
+ENV_PREFIX = "PORTFOLIO_"
+# Относительные пути считаются от каталога бота, а не от текущего каталога
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PATHS = ("DATABASE", "PHOTOS_DIR", "SHARE_DIR")
+
+
+def _from_env(name: str, default):
+    """Значение из окружения, приведённое к типу значения по умолчанию."""
+    raw = os.environ.get(ENV_PREFIX + name)
+    if raw is None:
+        return default
+    if isinstance(default, bool):
+        return raw.strip().lower() in ("1", "true", "yes", "on")
+    try:
+        return type(default)(raw)
+    except ValueError:
+        raise ValueError(f"{ENV_PREFIX}{name}: ожидается {type(default).__name__}, "
+                         f"получено {raw!r}") from None
+
+
+for _name, _default in list(globals().items()):
+    if _name.isupper() and isinstance(_default, (str, int, float)):
+        globals()[_name] = _from_env(_name, _default)
+for _name in PATHS:
+    globals()[_name] = os.path.join(BASE_DIR, globals()[_name])
@@ -0,0 +1,134 @@
+# dispatcher.py
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+# задача-метка: срок отложенного чата вышел
+_RESUME = object()
+
+
+class ChatDispatcher:
+    """
+    Пул рабочих потоков с очередью на каждый поток.
+    Задачи одного чата всегда попадают в один поток и выполняются строго
+    по порядку (на этом держатся register_next_step_handler-мастера),
+    задачи разных чатов — параллельно.
+
+    delay(chat_id) — сколько чату ещё ждать (например, лимита отправки).
+    Пока он больше нуля, задачи чата откладываются, а поток берёт задачи
+    других чатов: один медленный чат не держит весь поток.
+    """
+
+    def __init__(self, workers: int, queue_size: int = 1000, delay=None):
+        self._delay = delay
+        self._queues = [queue.Queue(queue_size) for _ in range(workers)]
+        self._threads = [
+            threading.Thread(target=self._run, args=(q,), name=f"chat-worker-{i}", daemon=True)
+            for i, q in enumerate(self._queues)
+        ]
+        # отложенные возвраты чатов в очередь: (когда, номер, очередь, chat_id)
+        self._timers: list[tuple[float, int, queue.Queue, int]] = []
+        self._timers_seq = itertools.count()
+        self._timers_cond = threading.Condition()
+        if delay is not None:
+            self._threads.append(
+                threading.Thread(target=self._run_timers, name="chat-timers", daemon=True)
+            )
+        for t in self._threads:
+            t.start()
+
+    def submit(self, chat_id: int, func, *args):
+        """Поставить задачу в очередь потока чата (блокирует, если очередь полна)."""
+        self._queues[hash(chat_id) % len(self._queues)].put((chat_id, func, args))
+
+    def run_on_workers(self, func):
+        """
+        Выполнить func по разу в каждом рабочем потоке и дождаться всех —
+        прогрев при старте (например, соединения SQLite у каждого потока).
+        """
+        done = [threading.Event() for _ in self._queues]
+
+        def run(event):
+            try:
+                func()
+            finally:
+                event.set()
+
+        for q, event in zip(self._queues, done):
+            q.put((None, run, (event,)))
+        for event in done:
+            event.wait()
+
+    def shutdown(self, wait: bool = True):
+        """Дообработать очереди (и отложенные задачи) и остановить потоки."""
+        for q in self._queues:
+            q.put(_STOP)
+        if wait:
+            for t in self._threads[:len(self._queues)]:
+                t.join()
+
+    def _later(self, seconds: float, q: queue.Queue, chat_id: int):
+        """Через seconds вернуть отложенный чат в очередь его потока."""
+        with self._timers_cond:
+            heapq.heappush(self._timers, (time.monotonic() + seconds,
+                                          next(self._timers_seq), q, chat_id))
+            self._timers_cond.notify()
+
+    def _run_timers(self):
+        while True:
+            with self._timers_cond:
+                while not self._timers or self._timers[0][0] > time.monotonic():
+                    self._timers_cond.wait(
+                        self._timers[0][0] - time.monotonic() if self._timers else None
+                    )
+                _, _, q, chat_id = heapq.heappop(self._timers)
+            q.put((chat_id, _RESUME, ()))
+
+    def _run(self, q: queue.Queue):
+        # chat_id -> задачи чата, ждущие своего времени (по порядку прихода);
+        # трогает только этот поток, поэтому без блокировок
+        parked: dict[int, deque] = {}
+        stopping = False
+        while not (stopping and not parked):
+            task = q.get()
+            if task is _STOP:
+                stopping = True
+                continue
+            chat_id, func, args = task
+            if func is _RESUME:
+                tasks = parked.pop(chat_id)
+            elif chat_id in parked:
+                parked[chat_id].append((func, args))
+                continue
+            else:
+                tasks = deque([(func, args)])
+            while tasks:
+                wait = self._delay(chat_id) if self._delay and chat_id is not None else 0
+                if wait:
+                    parked[chat_id] = tasks
+                    self._later(wait, q, chat_id)
+                    break
+                func, args = tasks.popleft()
+                try:
+                    func(*args)
+                except Exception:
+                    logger.exception("Ошибка при обработке обновления")
+
+
+def chat_id_of(update) -> int:
+    """Чат, к которому относится обновление (для маршрутизации)."""
+    if update.callback_query:
+        call = update.callback_query
+        return call.message.chat.id if call.message else call.from_user.id
+    for msg in (update.message, update.edited_message,
+                update.channel_post, update.edited_channel_post):
+        if msg:
+            return msg.chat.id
+    return 0
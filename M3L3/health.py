@@ -0,0 +1,78 @@
+# health.py
+# Пробы для оркестратора (Kubernetes, docker healthcheck):
+#   GET /healthz — процесс жив и отвечает;
+#   GET /readyz  — старт закончен и все проверки проходят: 200, иначе 503.
+# Сервер поднимается первым делом, ещё до миграций, поэтому во время
+# долгого старта проба живости проходит, а готовности — нет.
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+
+class Health:
+    """Флаг готовности и проверки, которые /readyz выполняет при каждом запросе."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.startup_seconds: float | None = None
+        self._ready = threading.Event()
+        self._checks: dict[str, object] = {}
+
+    def add_check(self, name: str, check):
+        """check() -> bool; исключение считается провалом."""
+        self._checks[name] = check
+
+    def set_ready(self):
+        self.startup_seconds = time.monotonic() - self.started
+        self._ready.set()
+        logger.info("Готов к приёму обновлений через %.2f с после запуска", self.startup_seconds)
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def status(self) -> tuple[bool, dict]:
+        """(готов ли, тело ответа /readyz)."""
+        checks = {}
+        for name, check in self._checks.items():
+            try:
+                checks[name] = bool(check())
+            except Exception as e:
+                checks[name] = False
+                logger.warning("Проверка готовности %s: %r", name, e)
+        ok = self.ready and all(checks.values())
+        return ok, {"ready": ok, "startup_seconds": self.startup_seconds, "checks": checks}
+
+    def serve(self, host: str, port: int) -> ThreadingHTTPServer:
+        """HTTP-сервер проб в отдельном потоке."""
+        health = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/healthz":
+                    self._reply(200, {"alive": True})
+                elif self.path == "/readyz":
+                    ok, body = health.status()
+                    self._reply(200 if ok else 503, body)
+                else:
+                    self._reply(404, {})
+
+            def _reply(self, code: int, body: dict):
+                data = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        httpd = ThreadingHTTPServer((host, port), Handler)
+        httpd.daemon_threads = True
+        threading.Thread(target=httpd.serve_forever, name="health-http", daemon=True).start()
+        return httpd
@@ -1,63 +1,837 @@
 # logic.py
+import json
+import re
 import sqlite3
+import threading
+import time
+import weakref
 from config import DATABASE
+from cache import LRUCache
+from writer import GroupCommitWriter
+
+# Настройки каждого соединения.
+# WAL: читатели не блокируют писателя; synchronous=NORMAL в WAL безопасен
+# и избавляет от fsync на каждый коммит.
+PRAGMAS = (
+    # новые базы освобождают место порциями (maintenance.py); режим
+    # задаётся до первой записи в файл, у существующих баз — только VACUUM
+    "PRAGMA auto_vacuum=INCREMENTAL",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",      # ~16 МБ страничного кэша
+    "PRAGMA mmap_size=134217728",    # 128 МБ отображения файла в память
+    "PRAGMA temp_store=MEMORY",
+    # проверка внешних ключей (на время миграций отключается, см. migrate)
+    "PRAGMA foreign_keys=ON",
+)
+# Сколько секунд ждать, пока другой поток держит блокировку записи
+BUSY_TIMEOUT = 10
+# Сколько подготовленных запросов sqlite3 держит на соединение
+STATEMENT_CACHE_SIZE = 128
+# Кэш списков проектов: число пользователей и время жизни записи (сек)
+PROJECTS_CACHE_SIZE = 10000
+PROJECTS_CACHE_TTL = 300
+
+# ------ Миграции ------
+# Версия схемы = число применённых миграций, хранится в PRAGMA user_version.
+# Новые миграции только добавляются в конец списка MIGRATIONS.
+
+def _unique_keys(conn: sqlite3.Connection, table: str) -> set[tuple]:
+    """Наборы столбцов всех UNIQUE-индексов таблицы."""
+    keys = set()
+    for _, index, unique, *_ in conn.execute(f"PRAGMA index_list({table})"):
+        if unique:
+            cols = conn.execute(f"PRAGMA index_info({index})").fetchall()
+            keys.add(tuple(c[2] for c in cols))
+    return keys
+
+def _merge_duplicates(conn: sqlite3.Connection, table: str, id_col: str,
+                      key: tuple[str, ...], refs: list[tuple[str, str]]):
+    """
+    Схлопнуть строки table с одинаковым key: ссылки refs [(таблица, столбец)]
+    переводятся на запись с наименьшим id, остальные записи удаляются.
+    """
+    cols = ", ".join(key)
+    conn.execute("DROP TABLE IF EXISTS temp._remap")
+    conn.execute("CREATE TEMP TABLE _remap (old_id INTEGER PRIMARY KEY, new_id INTEGER)")
+    conn.execute(f'''
+        INSERT INTO _remap
+        SELECT t.{id_col}, k.keep_id FROM {table} t
+        JOIN (SELECT {cols}, MIN({id_col}) AS keep_id FROM {table}
+              GROUP BY {cols} HAVING COUNT(*) > 1) k USING ({cols})
+        WHERE t.{id_col} <> k.keep_id
+    ''')
+    for ref_table, ref_col in refs:
+        # OR IGNORE: если запись-приёмник уже связана, дубль связи уйдёт позже
+        conn.execute(f'''
+            UPDATE OR IGNORE {ref_table}
+            SET {ref_col} = (SELECT new_id FROM _remap WHERE old_id = {ref_col})
+            WHERE {ref_col} IN (SELECT old_id FROM _remap)
+        ''')
+    conn.execute(f"DELETE FROM {table} WHERE {id_col} IN (SELECT old_id FROM _remap)")
+    conn.execute("DROP TABLE temp._remap")
+
+def _schema_v1(conn: sqlite3.Connection):
+    """Исходные таблицы."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS status (
+            status_id   INTEGER PRIMARY KEY,
+            status_name TEXT UNIQUE
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS skills (
+            skill_id   INTEGER PRIMARY KEY,
+            skill_name TEXT UNIQUE
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS projects (
+            project_id   INTEGER PRIMARY KEY,
+            user_id      INTEGER,
+            project_name TEXT,
+            description  TEXT,
+            url          TEXT,
+            status_id    INTEGER,
+            photo        TEXT,
+            FOREIGN KEY(status_id) REFERENCES status(status_id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS project_skills (
+            project_id INTEGER,
+            skill_id   INTEGER,
+            UNIQUE(project_id, skill_id),
+            FOREIGN KEY(project_id) REFERENCES projects(project_id),
+            FOREIGN KEY(skill_id)   REFERENCES skills(skill_id)
+        )
+    ''')
+
+def _schema_v2(conn: sqlite3.Connection):
+    """Индексы под горячие запросы и уникальность имён."""
+    # в ранних базах не было столбца photo
+    columns = [r[1] for r in conn.execute("PRAGMA table_info(projects)")]
+    if "photo" not in columns:
+        conn.execute("ALTER TABLE projects ADD COLUMN photo TEXT")
+
+    # перед UNIQUE-индексами схлопываем накопившиеся дубликаты
+    _merge_duplicates(conn, "status", "status_id", ("status_name",),
+                      [("projects", "status_id")])
+    _merge_duplicates(conn, "skills", "skill_id", ("skill_name",),
+                      [("project_skills", "skill_id")])
+    _merge_duplicates(conn, "projects", "project_id", ("user_id", "project_name"),
+                      [("project_skills", "project_id")])
+    conn.execute('''
+        DELETE FROM project_skills
+        WHERE project_id NOT IN (SELECT project_id FROM projects)
+           OR skill_id NOT IN (SELECT skill_id FROM skills)
+    ''')
+    conn.execute('''
+        DELETE FROM project_skills WHERE rowid NOT IN (
+            SELECT MIN(rowid) FROM project_skills GROUP BY project_id, skill_id
+        )
+    ''')
+
+    # в новых базах UNIQUE уже есть в самой таблице — второй индекс не нужен
+    if ("status_name",) not in _unique_keys(conn, "status"):
+        conn.execute("CREATE UNIQUE INDEX ux_status_name ON status(status_name)")
+    if ("skill_name",) not in _unique_keys(conn, "skills"):
+        conn.execute("CREATE UNIQUE INDEX ux_skills_name ON skills(skill_name)")
+    # (user_id, project_name) покрывает get_projects, get_project_id,
+    # get_project_photo, get_project_info и update_projects
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_projects_user_name
+        ON projects(user_id, project_name)
+    ''')
+    if ("project_id", "skill_id") not in _unique_keys(conn, "project_skills"):
+        conn.execute('''
+            CREATE UNIQUE INDEX ux_project_skills
+            ON project_skills(project_id, skill_id)
+        ''')
+    # обратный обход: от навыка к проектам
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS ix_project_skills_skill
+        ON project_skills(skill_id, project_id)
+    ''')
+
+def _schema_v3(conn: sqlite3.Connection):
+    """Счётчики ссылок на файлы фото (хранилище по содержимому, photos.py)."""
+    conn.execute('''
+        CREATE TABLE photo_files (
+            name TEXT PRIMARY KEY,
+            refs INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO photo_files (name, refs)
+        SELECT photo, COUNT(*) FROM projects
+        WHERE photo IS NOT NULL GROUP BY photo
+    ''')
+    # файлы-кандидаты на удаление ищутся по частичному индексу
+    conn.execute('''
+        CREATE INDEX ix_photo_files_orphans ON photo_files(name) WHERE refs <= 0
+    ''')
+    # счётчики ведут триггеры — так их не обойти ни одним UPDATE/DELETE
+    conn.execute('''
+        CREATE TRIGGER photo_ref_insert AFTER INSERT ON projects
+        WHEN NEW.photo IS NOT NULL
+        BEGIN
+            INSERT INTO photo_files (name, refs) VALUES (NEW.photo, 1)
+            ON CONFLICT(name) DO UPDATE SET refs = refs + 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER photo_ref_update AFTER UPDATE OF photo ON projects
+        WHEN OLD.photo IS NOT NEW.photo
+        BEGIN
+            UPDATE photo_files SET refs = refs - 1 WHERE name = OLD.photo;
+            INSERT INTO photo_files (name, refs)
+            SELECT NEW.photo, 1 WHERE NEW.photo IS NOT NULL
+            ON CONFLICT(name) DO UPDATE SET refs = refs + 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER photo_ref_delete AFTER DELETE ON projects
+        WHEN OLD.photo IS NOT NULL
+        BEGIN
+            UPDATE photo_files SET refs = refs - 1 WHERE name = OLD.photo;
+        END
+    ''')
+
+def _schema_v4(conn: sqlite3.Connection):
+    """file_id фото на серверах Telegram: повторно отправляем по нему."""
+    conn.execute("ALTER TABLE projects ADD COLUMN photo_file_id TEXT")
+
+def _schema_v5(conn: sqlite3.Connection):
+    """Шаги незавершённых мастеров (state.SqliteStateBackend)."""
+    conn.execute('''
+        CREATE TABLE wizard_state (
+            chat_id INTEGER PRIMARY KEY,
+            record  TEXT NOT NULL,
+            expires REAL NOT NULL
+        )
+    ''')
+
+def _schema_v6(conn: sqlite3.Connection):
+    """Постраничный вывод: записи индекса по user_id упорядочены по rowid."""
+    conn.execute("CREATE INDEX ix_projects_user ON projects(user_id)")
+
+_FTS_SKILLS = '''
+    (SELECT COALESCE(GROUP_CONCAT(s.skill_name, ' '), '')
+     FROM project_skills ps JOIN skills s ON ps.skill_id=s.skill_id
+     WHERE ps.project_id={pid})
+'''
+
+def _schema_v7(conn: sqlite3.Connection):
+    """Полнотекстовый поиск по проектам (FTS5), синхронизация триггерами."""
+    conn.execute('''
+        CREATE VIRTUAL TABLE projects_fts USING fts5(
+            owner, project_name, description, url, skills,
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3 4 5 6'
+        )
+    ''')
+    conn.execute(f'''
+        INSERT INTO projects_fts (rowid, owner, project_name, description, url, skills)
+        SELECT project_id, 'u' || user_id, project_name, description, url,
+               {_FTS_SKILLS.format(pid="projects.project_id")}
+        FROM projects
+    ''')
+    conn.execute('''
+        CREATE TRIGGER projects_fts_insert AFTER INSERT ON projects
+        BEGIN
+            INSERT INTO projects_fts (rowid, owner, project_name, description, url, skills)
+            VALUES (NEW.project_id, 'u' || NEW.user_id, NEW.project_name,
+                    NEW.description, NEW.url, '');
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER projects_fts_update
+        AFTER UPDATE OF user_id, project_name, description, url ON projects
+        BEGIN
+            UPDATE projects_fts
+            SET owner='u' || NEW.user_id, project_name=NEW.project_name,
+                description=NEW.description, url=NEW.url
+            WHERE rowid=NEW.project_id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER projects_fts_delete AFTER DELETE ON projects
+        BEGIN
+            DELETE FROM projects_fts WHERE rowid=OLD.project_id;
+        END
+    ''')
+    for event, ref in (("INSERT", "NEW"), ("DELETE", "OLD")):
+        conn.execute(f'''
+            CREATE TRIGGER project_skills_fts_{event.lower()}
+            AFTER {event} ON project_skills
+            BEGIN
+                UPDATE projects_fts SET skills={_FTS_SKILLS.format(pid=ref + ".project_id")}
+                WHERE rowid={ref}.project_id;
+            END
+        ''')
+    conn.execute(f'''
+        CREATE TRIGGER skills_fts_rename AFTER UPDATE OF skill_name ON skills
+        BEGIN
+            UPDATE projects_fts SET skills={_FTS_SKILLS.format(pid="projects_fts.rowid")}
+            WHERE rowid IN (SELECT project_id FROM project_skills
+                            WHERE skill_id=NEW.skill_id);
+        END
+    ''')
+
+def _schema_v8(conn: sqlite3.Connection):
+    """
+    Вставка в projects сразу индексирует навыки: импорт пишет навыки нового
+    проекта раньше него самого, и строка FTS создаётся один раз.
+    """
+    conn.execute("DROP TRIGGER projects_fts_insert")
+    conn.execute(f'''
+        CREATE TRIGGER projects_fts_insert AFTER INSERT ON projects
+        BEGIN
+            INSERT INTO projects_fts (rowid, owner, project_name, description, url, skills)
+            VALUES (NEW.project_id, 'u' || NEW.user_id, NEW.project_name,
+                    NEW.description, NEW.url, {_FTS_SKILLS.format(pid="NEW.project_id")});
+        END
+    ''')
+
+_BUMP_VERSION = '''
+    INSERT INTO portfolio_versions (user_id, version) SELECT {uid}, 1 WHERE {uid} IS NOT NULL
+    ON CONFLICT(user_id) DO UPDATE SET version=version + 1;
+'''
+
+def _schema_v9(conn: sqlite3.Connection):
+    """
+    Публичные ссылки на портфолио (/share) и версия содержимого каждого
+    портфолио: триггеры увеличивают её при любом изменении проектов и их
+    навыков, по ней share.py понимает, что снимок устарел.
+    """
+    conn.execute('''
+        CREATE TABLE portfolio_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE shares (
+            token   TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL UNIQUE
+        )
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER portfolio_version_insert AFTER INSERT ON projects
+        BEGIN {_BUMP_VERSION.format(uid="NEW.user_id")} END
+    ''')
+    # photo_file_id в снимок не попадает — его обновление версию не меняет
+    conn.execute(f'''
+        CREATE TRIGGER portfolio_version_update
+        AFTER UPDATE OF user_id, project_name, description, url, status_id, photo ON projects
+        BEGIN
+            {_BUMP_VERSION.format(uid="NEW.user_id")}
+            {_BUMP_VERSION.format(uid="IIF(OLD.user_id <> NEW.user_id, OLD.user_id, NULL)")}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER portfolio_version_delete AFTER DELETE ON projects
+        BEGIN {_BUMP_VERSION.format(uid="OLD.user_id")} END
+    ''')
+    for event, ref in (("INSERT", "NEW"), ("DELETE", "OLD")):
+        owner = f"(SELECT user_id FROM projects WHERE project_id={ref}.project_id)"
+        conn.execute(f'''
+            CREATE TRIGGER project_skills_version_{event.lower()}
+            AFTER {event} ON project_skills
+            BEGIN {_BUMP_VERSION.format(uid=owner)} END
+        ''')
+
+_COUNT = '''
+    INSERT INTO {table} SELECT {values}, {delta} {source}
+    ON CONFLICT DO UPDATE SET n=n + excluded.n;
+'''
+
+def _schema_v10(conn: sqlite3.Connection):
+    """
+    Сводки для /stats: проекты по статусам и навыки каждого пользователя,
+    частота навыков и пар навыков в одном проекте. Их ведут триггеры на
+    каждую вставку, правку и удаление, поэтому чтение — выборка по ключу,
+    а не GROUP BY по всей базе. Строки с n=0 не удаляются: справочники
+    малы, а чтение отбрасывает их условием n > 0.
+    """
+    # навыки удалённого проекта больше ничего не значат: без этого
+    # их пришлось бы вычитать из сводок отдельно от project_skills
+    conn.execute('''
+        DELETE FROM project_skills
+        WHERE project_id NOT IN (SELECT project_id FROM projects)
+    ''')
+    # проект без статуса учитывается под status_id = 0
+    conn.execute('''
+        CREATE TABLE user_status_counts (
+            user_id   INTEGER NOT NULL,
+            status_id INTEGER NOT NULL,
+            n         INTEGER NOT NULL,
+            PRIMARY KEY (user_id, status_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE user_skill_counts (
+            user_id  INTEGER NOT NULL,
+            skill_id INTEGER NOT NULL,
+            n        INTEGER NOT NULL,
+            PRIMARY KEY (user_id, skill_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE skill_counts (
+            skill_id INTEGER PRIMARY KEY,
+            n        INTEGER NOT NULL
+        )
+    ''')
+    # пара хранится в обе стороны: навыки, встречающиеся с данным, —
+    # выборка по префиксу ключа
+    conn.execute('''
+        CREATE TABLE skill_pairs (
+            skill_id INTEGER NOT NULL,
+            other_id INTEGER NOT NULL,
+            n        INTEGER NOT NULL,
+            PRIMARY KEY (skill_id, other_id)
+        ) WITHOUT ROWID
+    ''')
+    # самые частые навыки и пары — обход индекса с конца, без сортировки
+    conn.execute("CREATE INDEX ix_skill_counts_top ON skill_counts(n)")
+    conn.execute('''
+        CREATE INDEX ix_skill_pairs_top ON skill_pairs(n) WHERE skill_id < other_id
+    ''')
+
+    conn.execute('''
+        INSERT INTO user_status_counts
+        SELECT user_id, COALESCE(status_id, 0), COUNT(*) FROM projects GROUP BY 1, 2
+    ''')
+    conn.execute('''
+        INSERT INTO user_skill_counts
+        SELECT p.user_id, ps.skill_id, COUNT(*)
+        FROM project_skills ps JOIN projects p ON ps.project_id=p.project_id
+        GROUP BY 1, 2
+    ''')
+    conn.execute('''
+        INSERT INTO skill_counts SELECT skill_id, COUNT(*) FROM project_skills GROUP BY 1
+    ''')
+    conn.execute('''
+        INSERT INTO skill_pairs
+        SELECT a.skill_id, b.skill_id, COUNT(*)
+        FROM project_skills a JOIN project_skills b
+          ON a.project_id=b.project_id AND a.skill_id<>b.skill_id
+        GROUP BY 1, 2
+    ''')
+
+    conn.execute(f'''
+        CREATE TRIGGER stats_project_insert AFTER INSERT ON projects
+        BEGIN
+            {_COUNT.format(table="user_status_counts", delta=1, source="",
+                           values="NEW.user_id, COALESCE(NEW.status_id, 0)")}
+            {_COUNT.format(table="user_skill_counts", delta=1, values="NEW.user_id, skill_id",
+                           source="FROM project_skills WHERE project_id=NEW.project_id")}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER stats_project_update AFTER UPDATE OF user_id, status_id ON projects
+        WHEN OLD.user_id IS NOT NEW.user_id OR OLD.status_id IS NOT NEW.status_id
+        BEGIN
+            {_COUNT.format(table="user_status_counts", delta=-1, source="",
+                           values="OLD.user_id, COALESCE(OLD.status_id, 0)")}
+            {_COUNT.format(table="user_status_counts", delta=1, source="",
+                           values="NEW.user_id, COALESCE(NEW.status_id, 0)")}
+            {_COUNT.format(table="user_skill_counts", delta=-1, values="OLD.user_id, skill_id",
+                           source="FROM project_skills WHERE project_id=OLD.project_id"
+                                  " AND OLD.user_id IS NOT NEW.user_id")}
+            {_COUNT.format(table="user_skill_counts", delta=1, values="NEW.user_id, skill_id",
+                           source="FROM project_skills WHERE project_id=NEW.project_id"
+                                  " AND OLD.user_id IS NOT NEW.user_id")}
+        END
+    ''')
+    # навыки снимаются до удаления проекта: их триггеры ещё видят владельца
+    conn.execute('''
+        CREATE TRIGGER stats_project_delete BEFORE DELETE ON projects
+        BEGIN
+            DELETE FROM project_skills WHERE project_id=OLD.project_id;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER stats_project_deleted AFTER DELETE ON projects
+        BEGIN
+            {_COUNT.format(table="user_status_counts", delta=-1, source="",
+                           values="OLD.user_id, COALESCE(OLD.status_id, 0)")}
+        END
+    ''')
+    # импорт пишет навыки раньше проекта: владельца ещё нет, и его
+    # счётчики добавит stats_project_insert
+    for event, ref, delta in (("INSERT", "NEW", 1), ("DELETE", "OLD", -1)):
+        others = f"FROM project_skills WHERE project_id={ref}.project_id AND skill_id<>{ref}.skill_id"
+        conn.execute(f'''
+            CREATE TRIGGER stats_skill_{event.lower()} AFTER {event} ON project_skills
+            BEGIN
+                {_COUNT.format(table="skill_counts", delta=delta, source="",
+                               values=f"{ref}.skill_id")}
+                {_COUNT.format(table="user_skill_counts", delta=delta,
+                               values=f"user_id, {ref}.skill_id",
+                               source=f"FROM projects WHERE project_id={ref}.project_id")}
+                {_COUNT.format(table="skill_pairs", delta=delta, source=others,
+                               values=f"{ref}.skill_id, skill_id")}
+                {_COUNT.format(table="skill_pairs", delta=delta, source=others,
+                               values=f"skill_id, {ref}.skill_id")}
+            END
+        ''')
+
+def _schema_v11(conn: sqlite3.Connection):
+    """
+    Внешние ключи project_skills с каскадным удалением. Проверка отложена
+    до коммита: импорт пишет навыки раньше проекта. Ограничения у таблицы
+    в SQLite не меняются — она пересоздаётся, индексы и триггеры переносятся.
+    Навыки удаляемого проекта по-прежнему снимает stats_project_delete
+    (сводкам нужен владелец), каскад — гарантия на любой другой путь.
+    """
+    triggers = [r[0] for r in conn.execute(
+        "SELECT sql FROM sqlite_schema WHERE type='trigger' AND tbl_name='project_skills'"
+    )]
+    conn.execute('''
+        CREATE TABLE project_skills_new (
+            project_id INTEGER NOT NULL REFERENCES projects(project_id)
+                ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+            skill_id   INTEGER NOT NULL REFERENCES skills(skill_id)
+                ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO project_skills_new
+        SELECT project_id, skill_id FROM project_skills
+        WHERE project_id IN (SELECT project_id FROM projects)
+          AND skill_id IN (SELECT skill_id FROM skills)
+    ''')
+    conn.execute("DROP TABLE project_skills")
+    # триггеры projects и skills ссылаются на project_skills: пока её нет,
+    # обычный RENAME счёл бы схему ошибочной
+    conn.execute("PRAGMA legacy_alter_table=ON")
+    conn.execute("ALTER TABLE project_skills_new RENAME TO project_skills")
+    conn.execute("PRAGMA legacy_alter_table=OFF")
+    conn.execute('''
+        CREATE UNIQUE INDEX ux_project_skills ON project_skills(project_id, skill_id)
+    ''')
+    conn.execute('''
+        CREATE INDEX ix_project_skills_skill ON project_skills(skill_id, project_id)
+    ''')
+    for sql in triggers:
+        conn.execute(sql)
+
+MIGRATIONS = [
+    _schema_v1,
+    _schema_v2,
+    _schema_v3,
+    _schema_v4,
+    _schema_v5,
+    _schema_v6,
+    _schema_v7,
+    _schema_v8,
+    _schema_v9,
+    _schema_v10,
+    _schema_v11,
+]
+
+# Карточка проекта: навыки собираются подзапросом по индексу project_skills
+CARD_COLUMNS = '''
+    SELECT p.project_id, p.project_name, p.description, p.url, st.status_name,
+           (SELECT GROUP_CONCAT(s.skill_name, ', ')
+            FROM project_skills ps
+            JOIN skills s ON ps.skill_id=s.skill_id
+            WHERE ps.project_id=p.project_id) AS skills,
+           p.photo, p.photo_file_id
+'''
+CARD_SQL = CARD_COLUMNS + '''
+    FROM projects p
+    LEFT JOIN status st ON p.status_id=st.status_id
+'''
+# Поиск: владелец — отдельный токен u<user_id>, поэтому MATCH сразу
+# пересекает список документов пользователя со словами запроса.
+# CROSS JOIN фиксирует порядок: иначе планировщик идёт от ix_projects_user
+# и выполняет MATCH заново для каждого проекта.
+# bm25 здесь не используем: для IDF он проходит весь список документов
+# по каждому префиксу, а у одного пользователя совпадений немного.
+SEARCH_SQL = CARD_COLUMNS + '''
+    FROM projects_fts f
+    CROSS JOIN projects p ON p.project_id=f.rowid
+    LEFT JOIN status st ON p.status_id=st.status_id
+    WHERE projects_fts MATCH ? AND p.user_id=?
+    LIMIT ?
+'''
+SEARCH_CANDIDATES = 100
+# Вес совпадения по полям карточки: имя, описание, ссылка, навыки
+SEARCH_WEIGHTS = ((1, 10), (2, 2), (3, 1), (5, 5))
+
+def _search_score(card: tuple, patterns: list) -> int:
+    return sum(weight
+               for index, weight in SEARCH_WEIGHTS if card[index]
+               for pattern in patterns if pattern.search(card[index]))
+
+# Экспорт: навыки JSON-массивом, чтобы запятая в имени навыка не ломала разбор
+EXPORT_SQL = '''
+    SELECT p.project_id, p.project_name, p.description, p.url, st.status_name,
+           (SELECT json_group_array(s.skill_name)
+            FROM project_skills ps
+            JOIN skills s ON ps.skill_id=s.skill_id
+            WHERE ps.project_id=p.project_id) AS skills,
+           p.photo, p.photo_file_id
+    FROM projects p
+    LEFT JOIN status st ON p.status_id=st.status_id
+    WHERE p.user_id=? AND p.project_id>?
+    ORDER BY p.project_id
+    LIMIT ?
+'''
+# Импорт: повторная загрузка того же файла обновляет проекты, а не задваивает.
+# Пустые поля записи не затирают то, что уже есть в проекте
+UPSERT_PROJECT_SQL = '''
+    INSERT INTO projects (project_id, user_id, project_name, description, url,
+                          status_id, photo, photo_file_id)
+    VALUES(?,?,?,?,?,?,?,?)
+    ON CONFLICT(user_id, project_name) DO UPDATE SET
+        description=COALESCE(excluded.description, description),
+        url=COALESCE(excluded.url, url),
+        status_id=COALESCE(excluded.status_id, status_id),
+        photo=COALESCE(excluded.photo, photo),
+        photo_file_id=IIF(excluded.photo IS NULL, photo_file_id, excluded.photo_file_id)
+'''
+
+# Внешние ключи project_skills отложены до коммита (_schema_v11), а в режиме
+# group_commit коммит у пачки общий. Соединение писателя запоминает ссылки,
+# записанные текущим изменением (временные триггеры видит только оно), и
+# _check_links проверяет их до RELEASE его точки сохранения.
+TRACK_LINKS_SQL = (
+    "CREATE TEMP TABLE IF NOT EXISTS new_links (project_id, skill_id)",
+    '''
+    CREATE TEMP TRIGGER IF NOT EXISTS new_links_insert AFTER INSERT ON main.project_skills
+    BEGIN INSERT INTO new_links VALUES (NEW.project_id, NEW.skill_id); END
+    ''',
+    '''
+    CREATE TEMP TRIGGER IF NOT EXISTS new_links_update AFTER UPDATE ON main.project_skills
+    BEGIN INSERT INTO new_links VALUES (NEW.project_id, NEW.skill_id); END
+    ''',
+)
+BROKEN_LINK_SQL = '''
+    SELECT 1 FROM new_links n
+    WHERE NOT EXISTS (SELECT 1 FROM projects p WHERE p.project_id=n.project_id)
+       OR NOT EXISTS (SELECT 1 FROM skills s WHERE s.skill_id=n.skill_id)
+    LIMIT 1
+'''
+
+def _check_links(conn: sqlite3.Connection):
+    """Ссылки из этого изменения ведут в существующие проект и навык."""
+    broken = conn.execute(BROKEN_LINK_SQL).fetchone()
+    conn.execute("DELETE FROM new_links")
+    if broken:
+        raise sqlite3.IntegrityError("FOREIGN KEY constraint failed")
+
+# Запросы, с которых начинается почти каждое обновление: warm_up готовит
+# их заранее (разбор схемы, кэш выражений соединения) на несуществующем id
+WARM_UP_QUERIES = (
+    ("SELECT record, expires FROM wizard_state WHERE chat_id=?", (-1,)),
+    ("SELECT * FROM projects WHERE user_id=?", (-1,)),
+    (CARD_SQL + " WHERE p.user_id=? AND p.project_id>? ORDER BY p.project_id LIMIT ?",
+     (-1, 0, 1)),
+)
+
+
+class ProjectExists(Exception):
+    """У пользователя уже есть проект с таким именем."""
+
+
+class _ThreadMark:
+    """Лежит в threading.local рядом с соединением и удаляется вместе с потоком."""
+
 
 class DB_Manager:
-    def __init__(self, database: str):
+    def __init__(self, database: str, group_commit: bool=False, metrics=None,
+                 bootstrap: bool=True):
         self.database = database
-        # при первом запуске:
-        # self.create_tables()
-        # self.default_insert()
+        self._metrics = metrics
+        # по одному долгоживущему соединению на поток: объект можно
+        # использовать из рабочих потоков бота без общей блокировки
+        self._local = threading.local()
+        self._conns: set[sqlite3.Connection] = set()
+        self._conns_lock = threading.Lock()
+        # отдельное соединение для проб готовности: каждая проба health.py
+        # приходит в новом потоке, соединение потока на неё не заводим
+        self._probe = None
+        self._probe_lock = threading.Lock()
+        # справочники (статусы, навыки) и списки проектов по user_id;
+        # справочник могут пополнить и другие процессы (supervisor.py) — отсюда TTL
+        self._reference = LRUCache(maxsize=1, ttl=PROJECTS_CACHE_TTL)
+        self._user_cache = LRUCache(PROJECTS_CACHE_SIZE, PROJECTS_CACHE_TTL)
+        self._writer = None
+        # bootstrap=False — схему готовит bootstrap(), вызванный позже
+        # (main.startup: пока идут миграции, проба готовности отвечает 503)
+        if bootstrap:
+            self.bootstrap()
+        # изменения из всех потоков пишет один поток пачками (writer.py)
+        if group_commit:
+            self._writer = GroupCommitWriter(self._writer_connect, check=_check_links)
+        # время каждого публичного метода (metrics.Metrics)
+        if metrics is not None:
+            metrics.instrument(self, "db")
 
-    def create_tables(self):
-        conn = sqlite3.connect(self.database)
-        with conn:
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS status (
-                    status_id   INTEGER PRIMARY KEY,
-                    status_name TEXT UNIQUE
-                )
-            ''')
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS skills (
-                    skill_id   INTEGER PRIMARY KEY,
-                    skill_name TEXT UNIQUE
-                )
-            ''')
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS projects (
-                    project_id   INTEGER PRIMARY KEY,
-                    user_id      INTEGER,
-                    project_name TEXT,
-                    description  TEXT,
-                    url          TEXT,
-                    status_id    INTEGER,
-                    photo        TEXT,
-                    FOREIGN KEY(status_id) REFERENCES status(status_id)
-                )
-            ''')
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS project_skills (
-                    project_id INTEGER,
-                    skill_id   INTEGER,
-                    UNIQUE(project_id, skill_id),
-                    FOREIGN KEY(project_id) REFERENCES projects(project_id),
-                    FOREIGN KEY(skill_id)   REFERENCES skills(skill_id)
-                )
-            ''')
-            conn.commit()
+    # ------ Соединения ------
+
+    def _connect(self) -> sqlite3.Connection:
+        """Соединение текущего потока; создаётся при первом обращении."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.database,
+                timeout=BUSY_TIMEOUT,
+                check_same_thread=False,
+                cached_statements=STATEMENT_CACHE_SIZE
+            )
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.add(conn)
+            # поток завершился (например, поток запроса ThreadingHTTPServer в
+            # share.py и health.py) — его соединение закрывается, а не копится
+            self._local.mark = _ThreadMark()
+            weakref.finalize(self._local.mark, self._release, conn)
+        return conn
+
+    def _writer_connect(self) -> sqlite3.Connection:
+        """Соединение потока-писателя: ещё и запоминает новые ссылки (_check_links)."""
+        conn = self._connect()
+        for sql in TRACK_LINKS_SQL:
+            conn.execute(sql)
+        return conn
+
+    def _release(self, conn: sqlite3.Connection):
+        with self._conns_lock:
+            if conn not in self._conns:
+                return  # уже закрыто в close()
+            self._conns.discard(conn)
+        conn.close()
+
+    def close(self):
+        """Закрыть все соединения (вызывать при остановке бота)."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        with self._conns_lock:
+            conns, self._conns = self._conns, set()
+        # вне блокировки: со старым local срабатывает _release текущего потока
+        self._local = threading.local()
+        for conn in conns:
+            conn.close()
+        with self._probe_lock:
+            if self._probe is not None:
+                self._probe.close()
+                self._probe = None
+
+    def migrate(self):
+        """Довести схему до последней версии (PRAGMA user_version)."""
+        conn = self._connect()
+        # миграции пересоздают таблицы и чинят ссылки — без проверки ключей
+        # (внутри транзакции PRAGMA foreign_keys не действует)
+        conn.execute("PRAGMA foreign_keys=OFF")
+        while (version := conn.execute("PRAGMA user_version").fetchone()[0]) < len(MIGRATIONS):
+            # каждая миграция — отдельная транзакция вместе с номером версии
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                # шарды supervisor.py стартуют разом: номер перечитывается
+                # под блокировкой записи, и миграцию применяет только один
+                if conn.execute("PRAGMA user_version").fetchone()[0] == version:
+                    MIGRATIONS[version](conn)
+                    conn.execute(f"PRAGMA user_version={version + 1}")
+        conn.execute("PRAGMA foreign_keys=ON")
+
+    def bootstrap(self):
+        """
+        Подготовка базы при старте; повторный вызов ничего не меняет.
+        Справочники заполняются, только если они пусты: переименованные
+        статусы и навыки не возвращаются, а обычный старт обходится без записи.
+        """
+        self.migrate()
+        empty = self.__select(
+            "SELECT NOT EXISTS(SELECT 1 FROM status) OR NOT EXISTS(SELECT 1 FROM skills)"
+        )[0][0]
+        if empty:
+            self.default_insert()
+        self._ref("statuses")
+
+    def schema_ready(self) -> bool:
+        """Схема базы последней версии (проверка готовности)."""
+        with self._probe_lock:
+            if self._probe is None:
+                self._probe = sqlite3.connect(self.database, timeout=BUSY_TIMEOUT,
+                                              check_same_thread=False)
+            version = self._probe.execute("PRAGMA user_version").fetchone()[0]
+        return version == len(MIGRATIONS)
+
+    def warm_up(self):
+        """Открыть соединение текущего потока и подготовить горячие запросы."""
+        conn = self._connect()
+        for sql, params in WARM_UP_QUERIES:
+            conn.execute(sql, params).fetchall()
 
-    def __executemany(self, sql: str, data: list[tuple]):
-        conn = sqlite3.connect(self.database)
+    # ------ Кэш ------
+
+    def _load_reference(self) -> dict:
+        statuses = self.__select("SELECT status_id, status_name FROM status")
+        return {
+            "statuses": [(name,) for _, name in statuses],
+            "status_ids": {name: sid for sid, name in statuses},
+            "skills": self.__select("SELECT * FROM skills"),
+            "skill_ids": dict(self.__select("SELECT skill_name, skill_id FROM skills")),
+        }
+
+    def _ref(self, key: str):
+        return self._reference.get_or_load("reference", self._load_reference)[key]
+
+    def _user_cached(self, kind: str, user_id: int, loader):
+        return self._user_cache.get_or_load((kind, user_id), loader)
+
+    def _invalidate_user(self, *user_ids: int):
+        self._user_cache.invalidate(
+            *[(kind, uid) for uid in user_ids for kind in ("projects", "cards")]
+        )
+
+    def cache_stats(self) -> dict:
+        """Счётчики попаданий/промахов кэшей."""
+        return {
+            "reference": self._reference.stats(),
+            "projects": self._user_cache.stats(),
+        }
+
+    def _write(self, func):
+        """
+        func(conn) в транзакции записи: в своём соединении или, в режиме
+        group_commit, в общей транзакции потока-писателя. Возвращает
+        результат func после коммита.
+        """
+        if self._writer is not None:
+            return self._writer.submit(func).result()
+        conn = self._connect()
         with conn:
-            conn.executemany(sql, data)
+            conn.execute("BEGIN IMMEDIATE")
+            return func(conn)
+
+    def __executemany(self, sql: str, data: list[tuple]) -> int:
+        """Выполнить запрос для каждой строки data; сколько строк изменено."""
+        def write(conn):
+            return conn.executemany(sql, data).rowcount  # курсор наружу не отдаём
+
+        if self._metrics is None:
+            return self._write(write)
+        start = time.perf_counter()
+        changed = self._write(write)
+        self._metrics.query(sql, data, time.perf_counter() - start)
+        return changed
 
     def __select(self, sql: str, params: tuple=()) -> list[tuple]:
-        conn = sqlite3.connect(self.database)
-        with conn:
-            cur = conn.cursor()
-            cur.execute(sql, params)
-            return cur.fetchall()
+        if self._metrics is None:
+            return self._connect().execute(sql, params).fetchall()
+        start = time.perf_counter()
+        res = self._connect().execute(sql, params).fetchall()
+        self._metrics.query(sql, params, time.perf_counter() - start)
+        return res
 
     def default_insert(self):
         """Заполнить справочники статусов и навыков."""
@@ -79,41 +853,187 @@ class DB_Manager:
             "INSERT OR IGNORE INTO skills (skill_name) VALUES(?)",
             skills
         )
+        self._reference.clear()
 
     # ------ Insert / Update ------
 
-    def insert_project(self, data: list[tuple]):
-        self.__executemany(
+    def insert_project(self, data: list[tuple]) -> int:
+        """
+        Сколько проектов добавлено: проект с уже занятым у пользователя
+        именем пропускается.
+        """
+        added = self.__executemany(
             "INSERT OR IGNORE INTO projects (user_id, project_name, url, status_id) VALUES(?,?,?,?)",
             data
         )
+        self._invalidate_user(*{row[0] for row in data})
+        return added
 
     def insert_skill(self, user_id: int, project_name: str, skill: str):
         pid = self.get_project_id(project_name, user_id)
-        sid = self.__select(
-            "SELECT skill_id FROM skills WHERE skill_name=?", (skill,)
-        )[0][0]
+        sid = self._ref("skill_ids")[skill]
         self.__executemany(
             "INSERT OR IGNORE INTO project_skills VALUES(?,?)",
             [(pid, sid)]
         )
+        self._invalidate_user(user_id)
+
+    def set_project_skills(self, user_id: int, project_id: int,
+                           skill_names: list[str]) -> tuple[list[str], list[str]] | None:
+        """
+        Оставить у проекта ровно skill_names. Имена переводятся в id одним
+        запросом, неизвестные навыки создаются; добавления и удаления —
+        одной транзакцией. Возвращает (добавленные, удалённые) или None,
+        если у пользователя нет такого проекта.
+        """
+        names = json.dumps(list(dict.fromkeys(skill_names)))
+
+        def write(conn):
+            if not conn.execute(
+                "SELECT 1 FROM projects WHERE project_id=? AND user_id=?",
+                (project_id, user_id)
+            ).fetchone():
+                return None
+            created = conn.execute(
+                "INSERT OR IGNORE INTO skills (skill_name) SELECT value FROM json_each(?)",
+                (names,)
+            ).rowcount
+            wanted = dict(conn.execute(
+                "SELECT skill_id, skill_name FROM skills "
+                "WHERE skill_name IN (SELECT value FROM json_each(?))", (names,)
+            ))
+            current = dict(conn.execute('''
+                SELECT s.skill_id, s.skill_name
+                FROM project_skills ps JOIN skills s ON ps.skill_id=s.skill_id
+                WHERE ps.project_id=?
+            ''', (project_id,)))
+            added = [sid for sid in wanted if sid not in current]
+            removed = [sid for sid in current if sid not in wanted]
+            conn.executemany("INSERT OR IGNORE INTO project_skills VALUES(?,?)",
+                             [(project_id, sid) for sid in added])
+            conn.executemany("DELETE FROM project_skills WHERE project_id=? AND skill_id=?",
+                             [(project_id, sid) for sid in removed])
+            return created, [wanted[sid] for sid in added], [current[sid] for sid in removed]
+
+        result = self._write(write)
+        if result is None:
+            return None
+        created, added, removed = result
+        if created:
+            self._reference.clear()
+        self._invalidate_user(user_id)
+        return added, removed
 
     def update_projects(self, column: str, data: tuple):
         """
         data = (new_value, project_name, user_id)
+        Переименование в уже занятое имя — ProjectExists.
         """
         sql = f"UPDATE projects SET {column}=? WHERE project_name=? AND user_id=?"
-        self.__executemany(sql, [data])
+        try:
+            self.__executemany(sql, [data])
+        except sqlite3.IntegrityError:
+            if column != "project_name":
+                raise
+            raise ProjectExists(data[0]) from None
+        self._invalidate_user(data[2])
+
+    def set_project_photo(self, user_id: int, project_name: str,
+                          photo: str, file_id: str | None):
+        """Новое фото проекта вместе с его file_id в Telegram."""
+        self.__executemany(
+            "UPDATE projects SET photo=?, photo_file_id=? WHERE project_name=? AND user_id=?",
+            [(photo, file_id, project_name, user_id)]
+        )
+        self._invalidate_user(user_id)
+
+    def set_photo_file_id(self, user_id: int, project_id: int, file_id: str):
+        self.__executemany(
+            "UPDATE projects SET photo_file_id=? WHERE project_id=? AND user_id=?",
+            [(file_id, project_id, user_id)]
+        )
+        self._invalidate_user(user_id)
 
     def update_skill(self, old: str, new: str):
         self.__executemany(
             "UPDATE skills SET skill_name=? WHERE skill_name=?", [(new, old)]
         )
+        # имя навыка есть в закэшированных карточках всех пользователей
+        self._reference.clear()
+        self._user_cache.clear()
 
     def update_status(self, old: str, new: str):
         self.__executemany(
             "UPDATE status SET status_name=? WHERE status_name=?", [(new, old)]
         )
+        self._reference.clear()
+        self._user_cache.clear()
+
+    def import_projects(self, user_id: int, records: list[dict],
+                        create_refs: bool=False) -> int:
+        """
+        Пачка проектов одной транзакцией (формат записи — transfer.FIELDS).
+        Имена статусов и навыков переводятся в id разом на всю пачку;
+        неизвестные создаются при create_refs, иначе пропускаются.
+        """
+        statuses = json.dumps(list({r["status"] for r in records if r["status"]}))
+        skills = json.dumps(list({s for r in records for s in r["skills"]}))
+        names = json.dumps([r["name"] for r in records])
+
+        def write(conn):
+            if create_refs:
+                conn.execute(
+                    "INSERT OR IGNORE INTO status (status_name) SELECT value FROM json_each(?)",
+                    (statuses,)
+                )
+                conn.execute(
+                    "INSERT OR IGNORE INTO skills (skill_name) SELECT value FROM json_each(?)",
+                    (skills,)
+                )
+            status_ids = dict(conn.execute(
+                "SELECT status_name, status_id FROM status "
+                "WHERE status_name IN (SELECT value FROM json_each(?))", (statuses,)
+            ))
+            skill_ids = dict(conn.execute(
+                "SELECT skill_name, skill_id FROM skills "
+                "WHERE skill_name IN (SELECT value FROM json_each(?))", (skills,)
+            ))
+            project_ids = dict(conn.execute(
+                "SELECT project_name, project_id FROM projects "
+                "WHERE user_id=? AND project_name IN (SELECT value FROM json_each(?))",
+                (user_id, names)
+            ))
+            # новым проектам id раздаём сами и пишем их навыки до проектов:
+            # иначе триггер FTS переписывал бы строку индекса на каждый навык
+            last_id = conn.execute(
+                "SELECT COALESCE(MAX(project_id), 0) FROM projects"
+            ).fetchone()[0]
+            new = {}
+            for r in records:
+                if r["name"] not in project_ids:
+                    last_id += 1
+                    project_ids[r["name"]] = new[r["name"]] = last_id
+
+            def links(rows):
+                return [(project_ids[r["name"]], skill_ids[s])
+                        for r in rows for s in r["skills"] if s in skill_ids]
+
+            conn.executemany("INSERT OR IGNORE INTO project_skills VALUES(?,?)",
+                             links(r for r in records if r["name"] in new))
+            conn.executemany(UPSERT_PROJECT_SQL, [
+                # id задаём только первой записи с таким именем, повтор — upsert
+                (new.pop(r["name"], None), user_id, r["name"], r["description"], r["url"],
+                 status_ids.get(r["status"]), r["photo"], r["photo_file_id"])
+                for r in records
+            ])
+            conn.executemany("INSERT OR IGNORE INTO project_skills VALUES(?,?)",
+                             links(records))
+
+        self._write(write)
+        if create_refs:
+            self._reference.clear()
+        self._invalidate_user(user_id)
+        return len(records)
 
     # ------ Delete ------
 
@@ -122,32 +1042,180 @@ class DB_Manager:
             "DELETE FROM projects WHERE user_id=? AND project_id=?",
             [(user_id, project_id)]
         )
+        self._invalidate_user(user_id)
 
     def delete_skill(self, project_id: int, skill_id: int):
         self.__executemany(
             "DELETE FROM project_skills WHERE project_id=? AND skill_id=?",
             [(project_id, skill_id)]
         )
+        owner = self.__select(
+            "SELECT user_id FROM projects WHERE project_id=?", (project_id,)
+        )
+        if owner:
+            self._invalidate_user(owner[0][0])
+
+    def forget_photos(self, names: list[str]):
+        """Удалить записи о файлах, которые так и остались без ссылок."""
+        self.__executemany(
+            "DELETE FROM photo_files WHERE name=? AND refs <= 0",
+            [(n,) for n in names]
+        )
+
+    # ------ Состояние мастеров ------
+
+    def set_state(self, chat_id: int, record: str, expires: float):
+        self.__executemany(
+            "INSERT OR REPLACE INTO wizard_state VALUES(?,?,?)",
+            [(chat_id, record, expires)]
+        )
+
+    def pop_state(self, chat_id: int) -> str | None:
+        """Забрать запись шага чата (просроченные не возвращаются)."""
+        # pop_state вызывается на каждое сообщение: у большинства чатов
+        # записи нет, и транзакция записи им не нужна
+        res = self.__select(
+            "SELECT record, expires FROM wizard_state WHERE chat_id=?", (chat_id,)
+        )
+        if not res:
+            return None
+        record, expires = res[0]
+        deleted = self._write(lambda conn: conn.execute(
+            "DELETE FROM wizard_state WHERE chat_id=? AND record=?", (chat_id, record)
+        ).rowcount)
+        if not deleted or expires < time.time():
+            return None
+        return record
+
+    def purge_states(self, now: float) -> int:
+        return self._write(
+            lambda conn: conn.execute("DELETE FROM wizard_state WHERE expires < ?", (now,)).rowcount
+        )
+
+    # ------ Обслуживание (maintenance.py) ------
+
+    def get_project_names(self, after_user: int, users: int) -> list[tuple]:
+        """(user_id, project_id, project_name) следующих users пользователей после after_user."""
+        return self.__select('''
+            SELECT user_id, project_id, project_name FROM projects
+            WHERE user_id > ? AND user_id <= (
+                SELECT MAX(user_id) FROM (
+                    SELECT DISTINCT user_id FROM projects WHERE user_id > ?
+                    ORDER BY user_id LIMIT ?
+                )
+            )
+            ORDER BY user_id, project_id
+        ''', (after_user, after_user, users))
+
+    def merge_projects(self, user_id: int, keep_id: int, duplicate_ids: list[int]):
+        """
+        Слить дубли в проект keep_id одной транзакцией: пустые поля
+        заполняются из дублей, навыки объединяются, дубли удаляются.
+        """
+        def write(conn):
+            for dup in duplicate_ids:
+                conn.execute('''
+                    UPDATE projects SET
+                        description=COALESCE(NULLIF(projects.description, ''), d.description),
+                        url=COALESCE(NULLIF(projects.url, ''), d.url),
+                        status_id=COALESCE(projects.status_id, d.status_id),
+                        photo=COALESCE(projects.photo, d.photo),
+                        photo_file_id=IIF(projects.photo IS NULL, d.photo_file_id,
+                                          projects.photo_file_id)
+                    FROM (SELECT * FROM projects WHERE project_id=? AND user_id=?) AS d
+                    WHERE projects.project_id=? AND projects.user_id=?
+                ''', (dup, user_id, keep_id, user_id))
+                conn.execute(
+                    "INSERT OR IGNORE INTO project_skills "
+                    "SELECT ?, skill_id FROM project_skills WHERE project_id=?", (keep_id, dup)
+                )
+                conn.execute(
+                    "DELETE FROM projects WHERE project_id=? AND user_id=?", (dup, user_id)
+                )
+        self._write(write)
+        self._invalidate_user(user_id)
+
+    def get_orphan_links(self, after_rowid: int, limit: int) -> tuple[int | None, list[int]]:
+        """
+        Порция project_skills после after_rowid: (последний rowid порции
+        или None, если таблица пройдена; rowid строк без проекта или навыка).
+        """
+        rows = self.__select('''
+            SELECT ps.rowid,
+                   EXISTS(SELECT 1 FROM projects p WHERE p.project_id=ps.project_id)
+                   AND EXISTS(SELECT 1 FROM skills s WHERE s.skill_id=ps.skill_id)
+            FROM project_skills ps WHERE ps.rowid > ? ORDER BY ps.rowid LIMIT ?
+        ''', (after_rowid, limit))
+        if not rows:
+            return None, []
+        return rows[-1][0], [rowid for rowid, ok in rows if not ok]
+
+    def delete_links(self, rowids: list[int]):
+        self.__executemany("DELETE FROM project_skills WHERE rowid=?", [(r,) for r in rowids])
+        # чьи это были проекты, неизвестно: списки проектов перечитаются
+        self._user_cache.clear()
+
+    def get_known_photos(self, names: list[str]) -> set[str]:
+        """Какие из файлов фото записаны в photo_files."""
+        return {r[0] for r in self.__select(
+            "SELECT name FROM photo_files WHERE name IN (SELECT value FROM json_each(?))",
+            (json.dumps(names),)
+        )}
+
+    def optimize(self, analysis_limit: int):
+        """
+        ANALYZE там, где статистика устарела (PRAGMA optimize), не больше
+        analysis_limit строк на индекс — время ограничено и на большой базе.
+        """
+        def write(conn):
+            conn.execute(f"PRAGMA analysis_limit={int(analysis_limit)}")
+            # 0x10002: проверить все таблицы, а не только прочитанные этим соединением
+            conn.execute("PRAGMA optimize=0x10002").fetchall()
+        self._write(write)
+
+    def vacuum_mode(self) -> int:
+        """PRAGMA auto_vacuum: 0 — нет, 1 — полный, 2 — инкрементальный."""
+        return self.__select("PRAGMA auto_vacuum")[0][0]
+
+    def incremental_vacuum(self, pages: int) -> tuple[int, int]:
+        """
+        Вернуть системе до pages свободных страниц (pages > 0: при нуле
+        SQLite освобождает всё разом). Возвращает (освобождено, осталось).
+        """
+        def write(conn):
+            before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            conn.execute(f"PRAGMA incremental_vacuum({max(1, int(pages))})").fetchall()
+            left = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            return before - left, left
+        return self._write(write)
+
+    def full_vacuum(self):
+        """
+        Полный VACUUM: переупаковать полупустые страницы (incremental_vacuum
+        отдаёт только целиком свободные) и перевести базу на
+        auto_vacuum=INCREMENTAL. База заблокирована на всё время —
+        только при остановленном боте.
+        """
+        conn = self._connect()
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
 
     # ------ Select ------
 
     def get_statuses(self) -> list[tuple]:
-        return self.__select("SELECT status_name FROM status")
+        return self._ref("statuses")
 
     def get_status_id(self, name: str) -> int:
-        res = self.__select(
-            "SELECT status_id FROM status WHERE status_name=?", (name,)
-        )
-        return res[0][0] if res else None
+        return self._ref("status_ids").get(name)
 
     def get_skills(self) -> list[tuple]:
-        return self.__select("SELECT * FROM skills")
+        return self._ref("skills")
 
     def get_projects(self, user_id: int) -> list[tuple]:
-        return self.__select(
+        return self._user_cached("projects", user_id, lambda: self.__select(
             "SELECT * FROM projects WHERE user_id=?",
             (user_id,)
-        )
+        ))
 
     def get_project_id(self, project_name: str, user_id: int) -> int:
         return self.__select(
@@ -155,16 +1223,21 @@ class DB_Manager:
             (project_name, user_id)
         )[0][0]
 
-    def get_project_skills(self, project_name: str) -> str:
+    def get_project_skills(self, project_name: str, user_id: int) -> str:
         rows = self.__select('''
             SELECT s.skill_name
             FROM project_skills ps
             JOIN skills s ON ps.skill_id=s.skill_id
             JOIN projects p ON ps.project_id=p.project_id
-            WHERE p.project_name=?
-        ''', (project_name,))
+            WHERE p.user_id=? AND p.project_name=?
+        ''', (user_id, project_name))
         return ", ".join(r[0] for r in rows)
 
+    def get_project_skill_ids(self, project_id: int) -> set[int]:
+        return {r[0] for r in self.__select(
+            "SELECT skill_id FROM project_skills WHERE project_id=?", (project_id,)
+        )}
+
     def get_project_photo(self, project_name: str, user_id: int) -> str | None:
         res = self.__select(
             "SELECT photo FROM projects WHERE project_name=? AND user_id=?",
@@ -172,6 +1245,157 @@ class DB_Manager:
         )
         return res[0][0] if res and res[0][0] else None
 
+    def get_project_page(self, user_id: int, cursor: int=0, backward: bool=False,
+                         limit: int=10) -> tuple[list[tuple], bool, bool]:
+        """
+        Страница карточек по project_id (keyset): после cursor,
+        а при backward=True — перед ним. Возвращает (cards, has_prev, has_next).
+        """
+        if backward:
+            cards = self.__select(
+                CARD_SQL + " WHERE p.user_id=? AND p.project_id<?"
+                " ORDER BY p.project_id DESC LIMIT ?", (user_id, cursor, limit)
+            )[::-1]
+        else:
+            cards = self.__select(
+                CARD_SQL + " WHERE p.user_id=? AND p.project_id>?"
+                " ORDER BY p.project_id LIMIT ?", (user_id, cursor, limit)
+            )
+        if not cards:
+            return [], False, False
+        has_prev, has_next = self.__select('''
+            SELECT EXISTS(SELECT 1 FROM projects WHERE user_id=? AND project_id<?),
+                   EXISTS(SELECT 1 FROM projects WHERE user_id=? AND project_id>?)
+        ''', (user_id, cards[0][0], user_id, cards[-1][0]))[0]
+        return cards, bool(has_prev), bool(has_next)
+
+    def search_projects(self, user_id: int, query: str, limit: int=10) -> list[tuple]:
+        """
+        Поиск по имени, описанию, ссылке и навыкам проектов пользователя.
+        Каждое слово запроса ищется как префикс; результат — карточки
+        (формат get_project_card), самые подходящие первыми: ранжируются
+        первые SEARCH_CANDIDATES совпадений по весам SEARCH_WEIGHTS.
+        Кандидаты набираются сначала из совпадений по имени — у них
+        самый большой вес, — и только потом по остальным полям.
+        """
+        words = re.findall(r"\w+", query.lower())
+        if not words:
+            return []
+        terms = " ".join(f'"{w}"*' for w in words)
+        owner = f'owner:"u{user_id}"'
+        cards = self.__select(SEARCH_SQL, (f"{owner} AND project_name:({terms})",
+                                           user_id, SEARCH_CANDIDATES))
+        if len(cards) < SEARCH_CANDIDATES:
+            seen = {card[0] for card in cards}
+            match = f"{owner} AND {{project_name description url skills}}:({terms})"
+            cards += [card for card in self.__select(SEARCH_SQL, (match, user_id, SEARCH_CANDIDATES))
+                      if card[0] not in seen][:SEARCH_CANDIDATES - len(cards)]
+        patterns = [re.compile(r"(?<!\w)" + re.escape(w), re.IGNORECASE) for w in words]
+        cards.sort(key=lambda card: -_search_score(card, patterns))
+        return cards[:limit]
+
+    def iter_export(self, user_id: int, batch: int=1000):
+        """
+        Все проекты пользователя для выгрузки, пачками по project_id:
+        память не растёт с размером портфолио.
+        """
+        last_id = 0
+        while True:
+            rows = self.__select(EXPORT_SQL, (user_id, last_id, batch))
+            yield from rows
+            if len(rows) < batch:
+                return
+            last_id = rows[-1][0]
+
+    def share_portfolio(self, user_id: int, token: str) -> str:
+        """Публичная ссылка на портфолио: уже выданный токен или token."""
+        def write(conn):
+            conn.execute(
+                "INSERT OR IGNORE INTO shares (token, user_id) VALUES(?, ?)",
+                (token, user_id)
+            )
+            return conn.execute(
+                "SELECT token FROM shares WHERE user_id=?", (user_id,)
+            ).fetchone()[0]
+        return self._write(write)
+
+    def unshare_portfolio(self, user_id: int) -> str | None:
+        """Отозвать ссылку; вернуть её токен (None, если ссылки не было)."""
+        def write(conn):
+            row = conn.execute("SELECT token FROM shares WHERE user_id=?", (user_id,)).fetchone()
+            conn.execute("DELETE FROM shares WHERE user_id=?", (user_id,))
+            return row[0] if row else None
+        return self._write(write)
+
+    def get_shared_portfolio(self, token: str) -> tuple[int, int] | None:
+        """(user_id, версия портфолио) по токену ссылки."""
+        rows = self.__select('''
+            SELECT s.user_id, COALESCE(v.version, 0)
+            FROM shares s LEFT JOIN portfolio_versions v USING (user_id)
+            WHERE s.token=?
+        ''', (token,))
+        return rows[0] if rows else None
+
+    def get_portfolio_version(self, user_id: int) -> int:
+        rows = self.__select(
+            "SELECT version FROM portfolio_versions WHERE user_id=?", (user_id,)
+        )
+        return rows[0][0] if rows else 0
+
+    def get_status_stats(self, user_id: int) -> list[tuple[str | None, int]]:
+        """Число проектов пользователя по статусам (None — без статуса), по убыванию."""
+        return self.__select('''
+            SELECT st.status_name, c.n
+            FROM user_status_counts c LEFT JOIN status st ON c.status_id=st.status_id
+            WHERE c.user_id=? AND c.n > 0
+            ORDER BY c.n DESC
+        ''', (user_id,))
+
+    def get_top_skills(self, user_id: int=None, limit: int=5) -> list[tuple[str, int]]:
+        """Самые частые навыки в проектах пользователя, а без user_id — у всех."""
+        if user_id is None:
+            return self.__select('''
+                SELECT s.skill_name, c.n
+                FROM skill_counts c JOIN skills s ON c.skill_id=s.skill_id
+                WHERE c.n > 0
+                ORDER BY c.n DESC LIMIT ?
+            ''', (limit,))
+        return self.__select('''
+            SELECT s.skill_name, c.n
+            FROM user_skill_counts c JOIN skills s ON c.skill_id=s.skill_id
+            WHERE c.user_id=? AND c.n > 0
+            ORDER BY c.n DESC LIMIT ?
+        ''', (user_id, limit))
+
+    def get_skill_pairs(self, skill: str=None, limit: int=5) -> list[tuple[str, str, int]]:
+        """
+        Навыки, которые чаще всего указаны в одном проекте: пары
+        (навык, навык, число проектов); со skill — только пары с ним.
+        """
+        if skill is None:
+            return self.__select('''
+                SELECT a.skill_name, b.skill_name, c.n
+                FROM skill_pairs c
+                JOIN skills a ON c.skill_id=a.skill_id
+                JOIN skills b ON c.other_id=b.skill_id
+                WHERE c.skill_id < c.other_id AND c.n > 0
+                ORDER BY c.n DESC LIMIT ?
+            ''', (limit,))
+        return self.__select('''
+            SELECT a.skill_name, b.skill_name, c.n
+            FROM skills a
+            JOIN skill_pairs c ON c.skill_id=a.skill_id
+            JOIN skills b ON c.other_id=b.skill_id
+            WHERE a.skill_name=? AND c.n > 0
+            ORDER BY c.n DESC LIMIT ?
+        ''', (skill, limit))
+
+    def get_orphan_photos(self) -> list[str]:
+        """Файлы фото, на которые не ссылается ни один проект."""
+        return [r[0] for r in self.__select(
+            "SELECT name FROM photo_files WHERE refs <= 0"
+        )]
+
     def get_project_info(self, user_id: int, project_name: str) -> list[tuple]:
         return self.__select('''
             SELECT p.project_name, p.description, p.url, s.status_name
@@ -179,3 +1403,23 @@ class DB_Manager:
             LEFT JOIN status s ON p.status_id=s.status_id
             WHERE p.user_id=? AND p.project_name=?
         ''', (user_id, project_name))
+
+    def get_project_card(self, user_id: int, project_name: str=None,
+                         project_id: int=None) -> tuple | None:
+        """
+        Карточка проекта одним запросом:
+        (project_id, project_name, description, url, status_name, skills,
+         photo, photo_file_id)
+        """
+        if project_id is not None:
+            where, params = "p.user_id=? AND p.project_id=?", (user_id, project_id)
+        else:
+            where, params = "p.user_id=? AND p.project_name=?", (user_id, project_name)
+        res = self.__select(CARD_SQL + f" WHERE {where}", params)
+        return res[0] if res else None
+
+    def get_project_cards(self, user_id: int) -> list[tuple]:
+        """Карточки всех проектов пользователя (формат как у get_project_card)."""
+        return self._user_cached("cards", user_id, lambda: self.__select(
+            CARD_SQL + " WHERE p.user_id=? ORDER BY p.project_id", (user_id,)
+        ))
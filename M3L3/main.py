@@ -1,21 +1,107 @@
 # main.py
-import os
-from telebot import TeleBot, types
-from telebot.types import (
-    InlineKeyboardButton, InlineKeyboardMarkup,
-    ReplyKeyboardMarkup, KeyboardButton
+import logging
+from contextlib import nullcontext
+from functools import partial
+
+import requests
+from telebot import TeleBot, apihelper, types
+from telebot.apihelper import ApiTelegramException
+
+from health import Health
+from logic import DB_Manager, ProjectExists
+from maintenance import Maintenance
+from metrics import Metrics
+from sender import SendLimiter
+from share import SnapshotStore, new_token
+from dispatcher import ChatDispatcher, chat_id_of
+from photos import PhotoStore, PhotoTooLarge
+from state import make_state_backend
+from transfer import (
+    BadRecord, detect_format, export_file, import_records, iter_lines, read_records
+)
+from config import (
+    TOKEN, DATABASE, WORKERS, PHOTOS_DIR, MAX_PHOTO_SIZE, PHOTO_WORKERS,
+    STATE_BACKEND, STATE_TTL, REDIS_URL, PROJECTS_PAGE_SIZE, SEARCH_LIMIT,
+    SKILL_NAME_MAX, GROUP_COMMIT, METRICS_ENABLED, METRICS_HOST, METRICS_PORT,
+    METRICS_LOG_INTERVAL, SLOW_QUERY_SECONDS, SEND_RATE,
+    WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT,
+    SHARE_DIR, SHARE_URL, SHARE_HOST, SHARE_PORT, HEALTH_HOST, HEALTH_PORT,
+    MAINTENANCE_INTERVAL, MAINTENANCE_MERGE_DUPLICATES
+)
+from ui import (
+    hide_board, cancel_button, INFO_TEXT, attributes,
+    gen_reply_markup, gen_page_markup, gen_skills_markup, toggle_skill,
+    picked_skills, card_text, projects_text, stats_text
 )
 
-from logic import DB_Manager
-from config import TOKEN, DATABASE
+class DispatchingTeleBot(TeleBot):
+    """
+    TeleBot, раздающий обновления по ChatDispatcher вместо своего пула:
+    разные чаты обрабатываются параллельно, один чат — по порядку.
+    С limiter чат, исчерпавший лимит отправки, ждёт в диспетчере,
+    а не в рабочем потоке.
+    """
+    def __init__(self, token: str, workers: int, metrics: Metrics=None,
+                 limiter: SendLimiter=None, **kwargs):
+        super().__init__(token, threaded=False, **kwargs)
+        self.limiter = limiter
+        self.dispatcher = ChatDispatcher(
+            workers, delay=limiter.chat_delay if limiter is not None else None
+        )
+        self.metrics = metrics
+
+    def process_new_updates(self, updates):
+        for update in updates:
+            # offset сдвигаем сразу, иначе поллинг запросит те же обновления снова
+            if update.update_id > self.last_update_id:
+                self.last_update_id = update.update_id
+            self.dispatcher.submit(chat_id_of(update), self._process_update, update)
+
+    def _process_update(self, update):
+        with self.limiter.pacing() if self.limiter is not None else nullcontext():
+            super().process_new_updates([update])
+
+    def _exec_task(self, task, *args, **kwargs):
+        # так TeleBot вызывает шаги мастеров; хэндлеры команд и кнопок
+        # оборачивает instrument_handlers, их диспетчер (метод бота) не считаем
+        if self.metrics is not None and getattr(task, "__self__", None) is not self:
+            args = (task.__name__, task) + args
+            task = partial(self.metrics.call, "handler")
+        super()._exec_task(task, *args, **kwargs)
 
 # ========== Инициализация ==========
-bot = TeleBot(TOKEN)
-manager = DB_Manager(DATABASE)
-os.makedirs("project_photos", exist_ok=True)
+metrics = Metrics(SLOW_QUERY_SECONDS) if METRICS_ENABLED else None
+limiter = SendLimiter(SEND_RATE) if SEND_RATE else None
+if metrics is not None or limiter is not None:
+    # своя сессия: keep-alive к api.telegram.org, как у apihelper по умолчанию
+    send = requests.Session().request
+    if metrics is not None:
+        send = metrics.request_sender(send)  # время каждой попытки, без ожидания лимита
+    if limiter is not None:
+        send = limiter.request_sender(send)
+    apihelper.CUSTOM_REQUEST_SENDER = send
+# при импорте только объекты; база, соединения и кэши — в startup()
+manager = DB_Manager(DATABASE, GROUP_COMMIT, metrics, bootstrap=False)
+# шаги мастеров хранятся компактными записями и переживают перезапуск
+bot = DispatchingTeleBot(
+    TOKEN, WORKERS, metrics, limiter,
+    next_step_backend=make_state_backend(STATE_BACKEND, manager, STATE_TTL, REDIS_URL)
+)
+photo_store = PhotoStore(PHOTOS_DIR, MAX_PHOTO_SIZE, PHOTO_WORKERS)
+snapshots = SnapshotStore(SHARE_DIR, photo_store)
+health = Health()
+maintenance = Maintenance(manager, photo_store, merge=MAINTENANCE_MERGE_DUPLICATES)
 
-hide_board = types.ReplyKeyboardRemove()
-cancel_button = "Отмена 🚫"
+def startup():
+    """
+    Подготовка к приёму обновлений: схема и справочники, затем соединения
+    SQLite и горячие запросы в каждом рабочем потоке — чтобы первые
+    обновления не платили за это. По завершении /readyz отвечает 200.
+    """
+    manager.bootstrap()
+    bot.dispatcher.run_on_workers(manager.warm_up)
+    health.add_check("database", manager.schema_ready)
+    health.set_ready()
 
 # ========== Вспомогательные функции ==========
 
@@ -27,6 +113,28 @@ def cancel(message):
         reply_markup=hide_board
     )
 
+def bulk():
+    """Массовый вывод: пропускает ответы другим пользователям вперёд."""
+    return limiter.bulk() if limiter is not None else nullcontext()
+
+def project_names(user_id: int) -> list[str]:
+    """Имена проектов пользователя (берутся из кэша DB_Manager)."""
+    return [p[2] for p in manager.get_projects(user_id)]
+
+def status_names() -> list[str]:
+    return [s[0] for s in manager.get_statuses()]
+
+def skill_names() -> list[str]:
+    return [s[1] for s in manager.get_skills()]
+
+def download_chunks(file_path: str, chunk_size: int = 64 * 1024):
+    """Скачать файл с серверов Telegram потоком, не держа его целиком в памяти."""
+    url = (apihelper.FILE_URL or "https://api.telegram.org/file/bot{0}/{1}")
+    with requests.get(url.format(TOKEN, file_path), stream=True,
+                      timeout=30, proxies=apihelper.proxy) as resp:
+        resp.raise_for_status()
+        yield from resp.iter_content(chunk_size)
+
 def no_projects(message):
     """Сообщение, если проектов нет."""
     bot.send_message(
@@ -34,92 +142,52 @@ def no_projects(message):
         "У тебя пока нет проектов!\nДобавь их командой /new_project"
     )
 
-def gen_reply_markup(options: list[str]) -> ReplyKeyboardMarkup:
-    """
-    Reply-клавиатура:
-    - one_time_keyboard=True → исчезает после первого нажатия
-    - resize_keyboard=True → оптимальный размер
-    """
-    markup = ReplyKeyboardMarkup(
-        one_time_keyboard=True,
-        resize_keyboard=True
-    )
-    for o in options:
-        markup.add(KeyboardButton(o))
-    markup.add(KeyboardButton(cancel_button))
-    return markup
-
-def gen_inline_markup(options: list[str]) -> InlineKeyboardMarkup:
-    """Inline-кнопки (для списка проектов)."""
-    markup = InlineKeyboardMarkup(row_width=1)
-    for o in options:
-        markup.add(InlineKeyboardButton(o, callback_data=o))
-    return markup
-
-# Для обновления конкретного поля
-attributes = {
-    'Имя проекта':    ("Введите новое имя проекта:",   "project_name"),
-    'Описание':       ("Введите новое описание:",      "description"),
-    'Ссылка':         ("Введите новую ссылку:",         "url"),
-    'Статус':         ("Выберите новый статус:",        "status_id"),
-}
-
 # ========== Вывод информации о проекте ==========
-def info_project(message, user_id: int, project_name: str):
-    rec = manager.get_project_info(user_id, project_name)
-    if not rec:
+def info_project(message, user_id: int, project_name: str=None, project_id: int=None):
+    card = manager.get_project_card(user_id, project_name, project_id)
+    if not card:
         bot.send_message(message.chat.id, "❌ Проект не найден.")
         return
-    name, desc, url, status = rec[0]
-    skills = manager.get_project_skills(project_name) or "—"
-    photo = manager.get_project_photo(project_name, user_id)
+    photo, file_id = card[6], card[7]
 
-    text = (
-        f"📁 <b>{name}</b>\n"
-        f"📝 Описание: {desc or '—'}\n"
-        f"🔗 Ссылка: {url or '—'}\n"
-        f"📊 Статус: {status}\n"
-        f"🛠️ Навыки: {skills}"
-    )
     bot.send_message(
         message.chat.id,
-        text,
+        card_text(card),
         parse_mode='HTML',
         reply_markup=hide_board
     )
 
-    if photo:
-        with open(f"project_photos/{photo}", "rb") as f:
-            bot.send_photo(message.chat.id, f)
+    # фото уже лежит у Telegram — отправляем по file_id, без выгрузки байтов
+    if file_id:
+        try:
+            bot.send_photo(message.chat.id, file_id)
+            return
+        except ApiTelegramException:
+            pass  # file_id больше не действует, отправим файл с диска
+    # уменьшенная копия, если готова: меньше байтов на выгрузку;
+    # файла может не быть на диске — тогда карточка без фото
+    path = photo_store.send_path(photo) if photo else None
+    if path:
+        with open(path, "rb") as f:
+            sent = bot.send_photo(message.chat.id, f)
+        manager.set_photo_file_id(user_id, card[0], sent.photo[-1].file_id)
 
 # ========== Хэндлеры команд ==========
 
 @bot.message_handler(commands=['start'])
 def start_handler(message):
-    """Запуск — приветствие и подсказка."""
+    """Запуск — приветствие и подсказка (одним сообщением: лимит на чат)."""
     bot.send_message(
         message.chat.id,
         "👋 Привет! Я бот‑портфолио 🤖\n"
-        "Сохраняй и просматривай свои проекты!"
+        "Сохраняй и просматривай свои проекты!\n\n" + INFO_TEXT,
+        parse_mode='HTML'
     )
-    info_handler(message)
 
 @bot.message_handler(commands=['info'])
 def info_handler(message):
     """Справка по всем командам."""
-    bot.send_message(
-        message.chat.id,
-        "📌 <b>Доступные команды:</b>\n\n"
-        "/new_project – создать новый проект 🆕\n"
-        "/projects – список проектов 📋\n"
-        "/skills – добавить навык 🛠️\n"
-        "/update_projects – изменить проект ✏️\n"
-        "/delete – удалить проект ❌\n"
-        "/add_description – добавить описание 📄\n"
-        "/add_photo – прикрепить фото 📷\n"
-        "/info – показать эту справку ℹ️",
-        parse_mode='HTML'
-    )
+    bot.send_message(message.chat.id, INFO_TEXT, parse_mode='HTML')
 
 # ----- /new_project -----
 @bot.message_handler(commands=['new_project'])
@@ -135,18 +203,18 @@ def new_project_step2(message):
 
 def new_project_step3(message, user_id, name):
     url = message.text.strip()
-    statuses = [s[0] for s in manager.get_statuses()]
     bot.send_message(
         message.chat.id,
         "📊 Выберите текущий статус проекта:",
-        reply_markup=gen_reply_markup(statuses)
+        reply_markup=gen_reply_markup(status_names())
     )
     bot.register_next_step_handler(
-        message, new_project_step4, user_id, name, url, statuses
+        message, new_project_step4, user_id, name, url
     )
 
-def new_project_step4(message, user_id, name, url, statuses):
+def new_project_step4(message, user_id, name, url):
     choice = message.text
+    statuses = status_names()
     if choice == cancel_button:
         return cancel(message)
     if choice not in statuses:
@@ -155,57 +223,119 @@ def new_project_step4(message, user_id, name, url, statuses):
             reply_markup=gen_reply_markup(statuses)
         )
         return bot.register_next_step_handler(
-            message, new_project_step4, user_id, name, url, statuses
+            message, new_project_step4, user_id, name, url
         )
     status_id = manager.get_status_id(choice)
-    manager.insert_project([(user_id, name, url, status_id)])
+    save_project(message, user_id, name, url, status_id)
+
+def save_project(message, user_id, name, url, status_id):
+    if not manager.insert_project([(user_id, name, url, status_id)]):
+        bot.send_message(
+            message.chat.id,
+            f"⚠️ Проект «{name}» уже есть. Введите другое название:",
+            reply_markup=hide_board
+        )
+        return bot.register_next_step_handler(
+            message, new_project_rename, user_id, url, status_id
+        )
     bot.send_message(
         message.chat.id,
         "✅ Проект сохранён!",
         reply_markup=hide_board
     )
 
+def new_project_rename(message, user_id, url, status_id):
+    if message.text == cancel_button:
+        return cancel(message)
+    save_project(message, user_id, message.text.strip(), url, status_id)
+
 # ----- /projects -----
 @bot.message_handler(commands=['projects'])
 def projects_handler(message):
-    user_id = message.from_user.id
-    projs = manager.get_projects(user_id)
-    if not projs:
+    cards, has_prev, has_next = manager.get_project_page(
+        message.from_user.id, limit=PROJECTS_PAGE_SIZE
+    )
+    if not cards:
         return no_projects(message)
 
-    names = [p[2] for p in projs]
-    text = ""
-    for _, _, pname, _, url, _ in projs:
-        text += f"📁 <b>{pname}</b>\n🔗 {url or '—'}\n\n"
     bot.send_message(
         message.chat.id,
-        text,
+        projects_text(cards),
         parse_mode='HTML',
-        reply_markup=gen_inline_markup(names)
+        reply_markup=gen_page_markup(cards, has_prev, has_next)
     )
 
-@bot.callback_query_handler(func=lambda call: True)
+@bot.callback_query_handler(func=lambda call: call.data.startswith("pg:"))
+def projects_page_callback(call):
+    """Листание /projects: редактируем то же сообщение."""
+    bot.answer_callback_query(call.id)
+    backward, cursor = call.data[3] == "<", int(call.data[4:])
+    cards, has_prev, has_next = manager.get_project_page(
+        call.from_user.id, cursor, backward, PROJECTS_PAGE_SIZE
+    )
+    if not cards:  # проекты на той странице успели удалить — начнём сначала
+        cards, has_prev, has_next = manager.get_project_page(
+            call.from_user.id, limit=PROJECTS_PAGE_SIZE
+        )
+    if not cards:
+        return no_projects(call.message)
+    bot.edit_message_text(
+        projects_text(cards),
+        call.message.chat.id,
+        call.message.message_id,
+        parse_mode='HTML',
+        reply_markup=gen_page_markup(cards, has_prev, has_next)
+    )
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("p:"))
 def project_inline_callback(call):
-    info_project(call.message, call.from_user.id, call.data)
+    bot.answer_callback_query(call.id)
+    info_project(call.message, call.from_user.id, project_id=int(call.data[2:]))
+
+# ----- /search -----
+@bot.message_handler(commands=['search'])
+def search_handler(message):
+    query = message.text.partition(" ")[2].strip()
+    if query:
+        return search_step2(message, query)
+    bot.send_message(message.chat.id, "🔍 Что ищем? Введите слова из названия, описания или навыков:")
+    bot.register_next_step_handler(message, search_step2)
+
+def search_step2(message, query: str=None):
+    if not search_results(message, query or message.text or ""):
+        bot.send_message(message.chat.id, "Ничего не нашлось 🤷")
+
+def search_results(message, query: str) -> bool:
+    """Показать найденные проекты; False, если ничего не нашлось."""
+    cards = manager.search_projects(message.from_user.id, query, SEARCH_LIMIT)
+    if not cards:
+        return False
+    bot.send_message(
+        message.chat.id,
+        projects_text(cards),
+        parse_mode='HTML',
+        reply_markup=gen_page_markup(cards, False, False)
+    )
+    return True
 
 # ----- /skills -----
 @bot.message_handler(commands=['skills'])
 def skills_handler(message):
-    user_id = message.from_user.id
-    projs = manager.get_projects(user_id)
-    if not projs:
+    names = project_names(message.from_user.id)
+    if not names:
         return no_projects(message)
 
-    names = [p[2] for p in projs]
     bot.send_message(
         message.chat.id,
-        "🛠️ Выберите проект для добавления навыка:",
+        "🛠️ Выберите проект, чтобы отметить его навыки:",
         reply_markup=gen_reply_markup(names)
     )
-    bot.register_next_step_handler(message, skills_step2, names)
+    bot.register_next_step_handler(message, skills_step2)
 
-def skills_step2(message, names):
+def skills_step2(message):
     proj = message.text
+    uid = message.from_user.id
+    names = project_names(uid)
     if proj == cancel_button:
         return cancel(message)
     if proj not in names:
@@ -213,54 +343,95 @@ def skills_step2(message, names):
             message.chat.id, "❌ Проект не найден, повторите:",
             reply_markup=gen_reply_markup(names)
         )
-        return bot.register_next_step_handler(message, skills_step2, names)
+        return bot.register_next_step_handler(message, skills_step2)
 
-    all_skills = [s[1] for s in manager.get_skills()]
-    bot.send_message(
-        message.chat.id,
-        "🔧 Выберите навык:",
-        reply_markup=gen_reply_markup(all_skills)
+    bot.send_message(message.chat.id, f"Проект «{proj}»", reply_markup=hide_board)
+    skill_picker(message.chat.id, manager.get_project_id(proj, uid))
+
+def skill_picker(chat_id: int, project_id: int):
+    """Сообщение с мультивыбором навыков; новые навыки можно дописать текстом."""
+    markup = gen_skills_markup(
+        project_id, manager.get_skills(), manager.get_project_skill_ids(project_id)
+    )
+    sent = bot.send_message(
+        chat_id,
+        "🔧 Отметьте навыки и нажмите «Готово».\n"
+        "Нужного нет в списке — напишите его (несколько — через запятую).",
+        reply_markup=markup
+    )
+    bot.register_next_step_handler_by_chat_id(
+        chat_id, skills_typed, project_id, sent.message_id, picked_skills(markup)
     )
-    bot.register_next_step_handler(message, skills_step3, proj, all_skills)
 
-def skills_step3(message, proj, all_skills):
-    choice = message.text
-    uid = message.from_user.id
-    if choice == cancel_button:
+@bot.callback_query_handler(func=lambda call: call.data.startswith("sk:"))
+def skills_picker_callback(call):
+    """Отметка навыка меняет только клавиатуру; в БД всё пишется по «Готово»."""
+    chat_id, message_id = call.message.chat.id, call.message.message_id
+    _, project_id, action = call.data.split(":")
+    markup = call.message.reply_markup
+    if action != "ok":
+        bot.answer_callback_query(call.id)
+        toggle_skill(markup, call.data)
+        bot.edit_message_reply_markup(chat_id, message_id, reply_markup=markup)
+        # написанные текстом навыки добавятся к текущим отметкам
+        return bot.register_next_step_handler_by_chat_id(
+            chat_id, skills_typed, int(project_id), message_id, picked_skills(markup)
+        )
+
+    bot.clear_step_handler_by_chat_id(chat_id)
+    selected = picked_skills(markup)
+    result = manager.set_project_skills(call.from_user.id, int(project_id), selected)
+    bot.answer_callback_query(call.id)
+    if result is None:
+        return bot.edit_message_text("❌ Проект не найден.", chat_id, message_id)
+    added, removed = result
+    bot.edit_message_text(
+        f"✅ Навыки сохранены: {', '.join(selected) or '—'}\n"
+        f"Добавлено: {len(added)}, убрано: {len(removed)}",
+        chat_id, message_id
+    )
+
+def skills_typed(message, project_id, picker_id, selected):
+    # команда вместо названия — пользователь ушёл из мастера
+    if message.text == cancel_button or (message.text or "").startswith("/"):
         return cancel(message)
-    if choice not in all_skills:
+    names = [n.strip() for n in (message.text or "").split(",") if n.strip()]
+    if not names or any(len(n) > SKILL_NAME_MAX for n in names):
         bot.send_message(
-            message.chat.id, "❌ Навык не распознан, повторите:",
-            reply_markup=gen_reply_markup(all_skills)
+            message.chat.id,
+            f"❌ Напишите названия навыков через запятую (до {SKILL_NAME_MAX} символов):"
+        )
+        return bot.register_next_step_handler(
+            message, skills_typed, project_id, picker_id, selected
         )
-        return bot.register_next_step_handler(message, skills_step3, proj, all_skills)
 
-    manager.insert_skill(uid, proj, choice)
-    bot.send_message(
-        message.chat.id,
-        f"✅ Навык «{choice}» добавлен к «{proj}».",
-        reply_markup=hide_board
-    )
+    if manager.set_project_skills(message.from_user.id, project_id, selected + names) is None:
+        return bot.send_message(message.chat.id, "❌ Проект не найден.")
+    # старый выбор устарел — показываем новый, уже с добавленными навыками
+    try:
+        bot.edit_message_reply_markup(message.chat.id, picker_id, reply_markup=None)
+    except ApiTelegramException:
+        pass  # сообщение слишком старое или уже изменено
+    skill_picker(message.chat.id, project_id)
 
 # ----- /delete -----
 @bot.message_handler(commands=['delete'])
 def delete_handler(message):
-    user_id = message.from_user.id
-    projs = manager.get_projects(user_id)
-    if not projs:
+    names = project_names(message.from_user.id)
+    if not names:
         return no_projects(message)
 
-    names = [p[2] for p in projs]
     bot.send_message(
         message.chat.id,
         "❌ Выберите проект для удаления:",
         reply_markup=gen_reply_markup(names)
     )
-    bot.register_next_step_handler(message, delete_step2, names)
+    bot.register_next_step_handler(message, delete_step2)
 
-def delete_step2(message, names):
+def delete_step2(message):
     choice = message.text
     uid = message.from_user.id
+    names = project_names(uid)
     if choice == cancel_button:
         return cancel(message)
     if choice not in names:
@@ -268,10 +439,11 @@ def delete_step2(message, names):
             message.chat.id, "❌ Неверный выбор, повторите:",
             reply_markup=gen_reply_markup(names)
         )
-        return bot.register_next_step_handler(message, delete_step2, names)
+        return bot.register_next_step_handler(message, delete_step2)
 
     pid = manager.get_project_id(choice, uid)
     manager.delete_project(uid, pid)
+    photo_store.collect_garbage(manager)
     bot.send_message(
         message.chat.id,
         f"✅ Проект «{choice}» удалён.",
@@ -281,21 +453,20 @@ def delete_step2(message, names):
 # ----- /update_projects -----
 @bot.message_handler(commands=['update_projects'])
 def upd_handler1(message):
-    user_id = message.from_user.id
-    projs = manager.get_projects(user_id)
-    if not projs:
+    names = project_names(message.from_user.id)
+    if not names:
         return no_projects(message)
 
-    names = [p[2] for p in projs]
     bot.send_message(
         message.chat.id,
         "✏️ Выберите проект для редактирования:",
         reply_markup=gen_reply_markup(names)
     )
-    bot.register_next_step_handler(message, upd_handler2, names)
+    bot.register_next_step_handler(message, upd_handler2)
 
-def upd_handler2(message, names):
+def upd_handler2(message):
     proj = message.text
+    names = project_names(message.from_user.id)
     if proj == cancel_button:
         return cancel(message)
     if proj not in names:
@@ -303,7 +474,7 @@ def upd_handler2(message, names):
             message.chat.id, "❌ Проект не найден, повторите:",
             reply_markup=gen_reply_markup(names)
         )
-        return bot.register_next_step_handler(message, upd_handler2, names)
+        return bot.register_next_step_handler(message, upd_handler2)
 
     opts = list(attributes.keys())
     bot.send_message(
@@ -327,8 +498,7 @@ def upd_handler3(message, proj):
     prompt, col = attributes[choice]
     markup = None
     if col == "status_id":
-        statuses = [s[0] for s in manager.get_statuses()]
-        markup = gen_reply_markup(statuses)
+        markup = gen_reply_markup(status_names())
 
     bot.send_message(
         message.chat.id,
@@ -345,7 +515,7 @@ def upd_handler4(message, proj, col):
 
     # если статус — переводим в id
     if col == "status_id":
-        sts = [s[0] for s in manager.get_statuses()]
+        sts = status_names()
         if val not in sts:
             bot.send_message(
                 message.chat.id,
@@ -355,7 +525,15 @@ def upd_handler4(message, proj, col):
             return bot.register_next_step_handler(message, upd_handler4, proj, col)
         val = manager.get_status_id(val)
 
-    manager.update_projects(col, (val, proj, uid))
+    try:
+        manager.update_projects(col, (val, proj, uid))
+    except ProjectExists:
+        bot.send_message(
+            message.chat.id,
+            f"⚠️ Проект «{val}» уже есть. Введите другое название:",
+            reply_markup=hide_board
+        )
+        return bot.register_next_step_handler(message, upd_handler4, proj, col)
     bot.send_message(
         message.chat.id,
         "✅ Обновлено!",
@@ -365,21 +543,20 @@ def upd_handler4(message, proj, col):
 # ----- /add_description -----
 @bot.message_handler(commands=['add_description'])
 def add_desc1(message):
-    uid = message.from_user.id
-    projs = manager.get_projects(uid)
-    if not projs:
+    names = project_names(message.from_user.id)
+    if not names:
         return no_projects(message)
 
-    names = [p[2] for p in projs]
     bot.send_message(
         message.chat.id,
         "📄 Выберите проект для описания:",
         reply_markup=gen_reply_markup(names)
     )
-    bot.register_next_step_handler(message, add_desc2, names)
+    bot.register_next_step_handler(message, add_desc2)
 
-def add_desc2(message, names):
+def add_desc2(message):
     proj = message.text
+    names = project_names(message.from_user.id)
     if proj == cancel_button:
         return cancel(message)
     if proj not in names:
@@ -387,7 +564,7 @@ def add_desc2(message, names):
             message.chat.id, "❌ Проект не найден, повторите:",
             reply_markup=gen_reply_markup(names)
         )
-        return bot.register_next_step_handler(message, add_desc2, names)
+        return bot.register_next_step_handler(message, add_desc2)
 
     bot.send_message(
         message.chat.id,
@@ -409,21 +586,20 @@ def add_desc3(message, proj):
 # ----- /add_photo -----
 @bot.message_handler(commands=['add_photo'])
 def add_photo1(message):
-    uid = message.from_user.id
-    projs = manager.get_projects(uid)
-    if not projs:
+    names = project_names(message.from_user.id)
+    if not names:
         return no_projects(message)
 
-    names = [p[2] for p in projs]
     bot.send_message(
         message.chat.id,
         "📷 Выберите проект для фото:",
         reply_markup=gen_reply_markup(names)
     )
-    bot.register_next_step_handler(message, add_photo2, names)
+    bot.register_next_step_handler(message, add_photo2)
 
-def add_photo2(message, names):
+def add_photo2(message):
     proj = message.text
+    names = project_names(message.from_user.id)
     if proj == cancel_button:
         return cancel(message)
     if proj not in names:
@@ -431,7 +607,7 @@ def add_photo2(message, names):
             message.chat.id, "❌ Проект не найден, повторите:",
             reply_markup=gen_reply_markup(names)
         )
-        return bot.register_next_step_handler(message, add_photo2, names)
+        return bot.register_next_step_handler(message, add_photo2)
 
     bot.send_message(
         message.chat.id,
@@ -446,32 +622,178 @@ def add_photo3(message, proj):
         return bot.register_next_step_handler(message, add_photo3, proj)
 
     uid = message.from_user.id
-    file_id = message.photo[-1].file_id
-    file_info = bot.get_file(file_id)
-    data = bot.download_file(file_info.file_path)
-
-    filename = f"{uid}_{proj}.jpg"
-    path = f"project_photos/{filename}"
-    with open(path, 'wb') as f:
-        f.write(data)
+    photo = message.photo[-1]
+    try:
+        if photo.file_size and photo.file_size > MAX_PHOTO_SIZE:
+            raise PhotoTooLarge(photo.file_size)
+        file_info = bot.get_file(photo.file_id)
+        filename = photo_store.save(download_chunks(file_info.file_path))
+    except PhotoTooLarge:
+        bot.send_message(
+            message.chat.id,
+            f"❌ Фото больше {MAX_PHOTO_SIZE // (1024 * 1024)} МБ, пришлите поменьше."
+        )
+        return bot.register_next_step_handler(message, add_photo3, proj)
 
-    manager.update_projects("photo", (filename, proj, uid))
+    manager.set_project_photo(uid, proj, filename, photo.file_id)
+    photo_store.schedule_variants(filename)
+    # старое фото проекта могло остаться без ссылок
+    photo_store.collect_garbage(manager)
     bot.send_message(
         message.chat.id,
         "✅ Фото сохранено!",
         reply_markup=hide_board
     )
 
+# ----- /export, /import -----
+@bot.message_handler(commands=['export'])
+def export_handler(message):
+    """Выгрузить все проекты файлом: /export или /export csv."""
+    uid = message.from_user.id
+    if not project_names(uid):
+        return no_projects(message)
+    fmt = "csv" if message.text.partition(" ")[2].strip().lower() == "csv" else "jsonl"
+    with export_file(manager, uid, fmt) as f, bulk():
+        bot.send_document(message.chat.id, f, visible_file_name=f"portfolio.{fmt}")
+
+@bot.message_handler(commands=['import'])
+def import_handler(message):
+    bot.send_message(
+        message.chat.id,
+        "📥 Отправьте файл .jsonl или .csv (как из /export).\n"
+        "Проекты с теми же названиями будут обновлены."
+    )
+    bot.register_next_step_handler(message, import_step2)
+
+def import_step2(message):
+    if message.text == cancel_button:
+        return cancel(message)
+    if message.content_type != 'document':
+        bot.send_message(message.chat.id, "❌ Это не файл, попробуйте ещё раз.")
+        return bot.register_next_step_handler(message, import_step2)
+
+    uid = message.from_user.id
+    doc = message.document
+    file_info = bot.get_file(doc.file_id)
+    records = read_records(
+        iter_lines(download_chunks(file_info.file_path)),
+        detect_format(doc.file_name or "")
+    )
+    try:
+        count = import_records(manager, uid, records, photo_store=photo_store)
+    except BadRecord as e:
+        bot.send_message(
+            message.chat.id,
+            f"❌ Ошибка в файле: {e}.\nИсправьте и отправьте снова через /import — "
+            "уже загруженные проекты обновятся, а не задвоятся."
+        )
+        return
+    finally:
+        # у обновлённых проектов могли смениться фото
+        photo_store.collect_garbage(manager)
+    bot.send_message(message.chat.id, f"✅ Загружено проектов: {count}")
+
+# ----- /share -----
+@bot.message_handler(commands=['share'])
+def share_handler(message):
+    """Публичный снимок портфолио: ссылка или HTML-файл; /share off — отозвать."""
+    uid = message.from_user.id
+    if message.text.partition(" ")[2].strip().lower() == "off":
+        token = manager.unshare_portfolio(uid)
+        if token:
+            snapshots.forget(token)
+        return bot.send_message(
+            message.chat.id, "🔒 Ссылка закрыта." if token else "Публичной ссылки не было."
+        )
+    if not project_names(uid):
+        return no_projects(message)
+    token = manager.share_portfolio(uid, new_token())
+    if SHARE_URL:
+        return bot.send_message(
+            message.chat.id,
+            f"🌐 Портфолио по ссылке (обновляется само):\n{SHARE_URL.rstrip('/')}/p/{token}\n"
+            "Закрыть доступ: /share off"
+        )
+    # снимок уже собран, если портфолио не менялось
+    with open(snapshots.get(manager, token).html_path, "rb") as f:
+        bot.send_document(message.chat.id, f, visible_file_name="portfolio.html")
+
+# ----- /stats -----
+@bot.message_handler(commands=['stats'])
+def stats_handler(message):
+    """Проекты по статусам, свои и общие частые навыки — из сводок БД."""
+    uid = message.from_user.id
+    statuses = manager.get_status_stats(uid)
+    if not statuses:
+        return no_projects(message)
+    bot.send_message(message.chat.id, stats_text(
+        statuses, manager.get_top_skills(uid), manager.get_top_skills(),
+        manager.get_skill_pairs()
+    ), parse_mode='HTML')
+
 # ----- Ловим всё остальное -----
+# регистрируется последним: ловит любые callback_data
+@bot.callback_query_handler(func=lambda call: True)
+def legacy_inline_callback(call):
+    """Кнопки старых сообщений: в callback_data лежит имя проекта."""
+    bot.answer_callback_query(call.id)
+    info_project(call.message, call.from_user.id, call.data)
+
 @bot.message_handler(func=lambda m: True)
 def fallback_handler(message):
     uid = message.from_user.id
-    names = [p[2] for p in manager.get_projects(uid)]
-    if message.text in names:
-        return info_project(message, uid, message.text)
-    bot.reply_to(message, "Нужна помощь?")
-    info_handler(message)
+    text = message.text or ""
+    # точное имя — по индексу (user_id, project_name), не среди кандидатов поиска
+    card = manager.get_project_card(uid, project_name=text)
+    if card:
+        return info_project(message, uid, project_id=card[0])
+    if search_results(message, text):
+        return
+    bot.reply_to(message, "Нужна помощь?\n\n" + INFO_TEXT, parse_mode='HTML')
+
+# ========== Старт ==========
+if metrics is not None:
+    metrics.instrument_handlers(bot)  # все хэндлеры уже зарегистрированы
+
+def run_webhook():
+    """Принимать обновления по HTTP: Telegram сам присылает их на WEBHOOK_URL."""
+    from urllib.parse import urlparse
+
+    from webhook import WebhookServer, check_secret
+
+    check_secret(WEBHOOK_SECRET)
+    bot.remove_webhook()
+    bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+    server = WebhookServer(
+        bot.process_new_updates, types.Update.de_json, WEBHOOK_SECRET,
+        path=urlparse(WEBHOOK_URL).path or "/",
+        host=WEBHOOK_HOST, port=WEBHOOK_PORT
+    )
+    server.serve_forever()
 
-# ========== Старт поллинга ==========
 if __name__ == '__main__':
-    bot.infinity_polling()
+    logging.basicConfig(level=logging.INFO)
+    # пробы поднимаются до миграций: пока идёт старт, /readyz отвечает 503
+    if HEALTH_PORT:
+        health.serve(HEALTH_HOST, HEALTH_PORT)
+    startup()
+    if MAINTENANCE_INTERVAL:
+        maintenance.start(MAINTENANCE_INTERVAL)
+    if metrics is not None:
+        metrics.serve(METRICS_HOST, METRICS_PORT)
+        metrics.start_reporter(METRICS_LOG_INTERVAL)
+    if SHARE_URL:
+        from share import ShareServer
+
+        ShareServer(snapshots, manager, SHARE_HOST, SHARE_PORT).serve_background()
+    try:
+        if WEBHOOK_URL:
+            run_webhook()
+        else:
+            bot.remove_webhook()
+            bot.infinity_polling()
+    finally:
+        maintenance.stop()
+        bot.dispatcher.shutdown()
+        photo_store.close()
+        manager.close()
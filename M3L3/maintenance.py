@@ -0,0 +1,173 @@
+# maintenance.py
+# Фоновое обслуживание базы и хранилища фото: чистка осиротевших навыков
+# и файлов, ANALYZE и возврат свободного места; похожие имена проектов
+# только подсчитываются (сливаются по явному merge=True / --merge-duplicates).
+# Всё идёт короткими порциями — каждая своей транзакцией, между ними
+# пауза, — поэтому обработчики бота ждут блокировку записи не дольше
+# одной порции.
+#
+# Разовый прогон:  python maintenance.py [--vacuum] [--merge-duplicates]
+import argparse
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Пользователей, строк project_skills или файлов за порцию
+CHUNK = 500
+# Пауза между порциями, секунд
+PAUSE = 0.05
+# Строк на индекс для ANALYZE (PRAGMA analysis_limit)
+ANALYSIS_LIMIT = 1000
+# Свободных страниц, возвращаемых системе за порцию incremental_vacuum
+VACUUM_PAGES = 256
+# Первый прогон — через столько секунд после запуска
+START_DELAY = 60
+
+
+def normalize_name(name: str) -> str:
+    """Имя проекта для поиска дублей: без различий в регистре и пробелах."""
+    return " ".join(name.split()).casefold()
+
+
+class Maintenance:
+    """
+    Прогон обслуживания (run) и поток, повторяющий его раз в interval
+    секунд (start). Шаги можно вызывать и по отдельности.
+    """
+
+    def __init__(self, manager, photo_store=None, chunk: int = CHUNK, pause: float = PAUSE,
+                 merge: bool = False):
+        self.manager = manager
+        self.photo_store = photo_store
+        self.merge = merge
+        self.chunk = chunk
+        self.pause = pause
+        self._stop = threading.Event()
+        self._vacuum_hint = False
+
+    def _rest(self) -> bool:
+        """Пауза между порциями; False — обслуживание останавливают."""
+        return not self._stop.wait(self.pause)
+
+    def merge_duplicates(self) -> int:
+        """
+        Проекты одного пользователя, чьи имена отличаются только регистром
+        и пробелами («Бот» и «бот »). Такие имена пользователь мог дать
+        намеренно, поэтому без self.merge они только подсчитываются;
+        с ним сливаются в самый старый. Возвращает число лишних проектов.
+        """
+        merged = 0
+        after_user = -2 ** 63
+        while rows := self.manager.get_project_names(after_user, self.chunk):
+            groups: dict[tuple, list[int]] = {}
+            for user_id, project_id, name in rows:
+                groups.setdefault((user_id, normalize_name(name)), []).append(project_id)
+            for (user_id, _), ids in groups.items():
+                if len(ids) > 1:
+                    if self.merge:
+                        self.manager.merge_projects(user_id, ids[0], ids[1:])
+                    merged += len(ids) - 1
+            after_user = rows[-1][0]
+            if not self._rest():
+                break
+        return merged
+
+    def purge_orphan_links(self) -> int:
+        """
+        Удалить project_skills без проекта или навыка. При включённых
+        внешних ключах их не бывает; остаются от записи в обход DB_Manager.
+        """
+        deleted = 0
+        after_rowid = 0
+        while True:
+            after_rowid, orphans = self.manager.get_orphan_links(after_rowid, self.chunk)
+            if orphans:
+                self.manager.delete_links(orphans)
+                deleted += len(orphans)
+            if after_rowid is None or not self._rest():
+                return deleted
+
+    def purge_photos(self) -> int:
+        """Файлы без ссылок из проектов и файлы, о которых БД не знает."""
+        if self.photo_store is None:
+            return 0
+        removed = self.photo_store.collect_garbage(self.manager)
+        return removed + self.photo_store.sweep(self.manager, batch=self.chunk, pause=self.pause)
+
+    def vacuum(self) -> int:
+        """Вернуть системе свободные страницы порциями по VACUUM_PAGES; сколько вернули."""
+        if self.manager.vacuum_mode() != 2:
+            if not self._vacuum_hint:
+                self._vacuum_hint = True
+                logger.info("auto_vacuum не INCREMENTAL: место не возвращается; "
+                            "перевести базу — python maintenance.py --vacuum при остановленном боте")
+            return 0
+        freed = 0
+        while self._rest():
+            pages, left = self.manager.incremental_vacuum(VACUUM_PAGES)
+            freed += pages
+            if not pages or not left:
+                break
+        return freed
+
+    def run(self) -> dict:
+        """Один полный прогон; возвращает, сколько сделано (дублей — найдено) на каждом шаге."""
+        start = time.perf_counter()
+        report = {
+            "duplicates": self.merge_duplicates(),
+            "orphan_links": self.purge_orphan_links(),
+            "photos": self.purge_photos(),
+        }
+        self.manager.optimize(ANALYSIS_LIMIT)
+        report["vacuum_pages"] = self.vacuum()
+        logger.info("Обслуживание за %.1f с: %s", time.perf_counter() - start, report)
+        return report
+
+    def start(self, interval: float, delay: float = START_DELAY) -> threading.Thread:
+        """Поток, выполняющий run() через delay секунд и затем раз в interval."""
+        def loop():
+            wait = delay
+            while not self._stop.wait(wait):
+                try:
+                    self.run()
+                except Exception:
+                    logger.exception("Ошибка обслуживания")
+                wait = interval
+        thread = threading.Thread(target=loop, name="maintenance", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        """Прервать прогон после текущей порции и не начинать новых."""
+        self._stop.set()
+
+
+def main(argv=None):
+    from config import DATABASE, PHOTOS_DIR, MAX_PHOTO_SIZE
+    from logic import DB_Manager
+    from photos import PhotoStore
+
+    parser = argparse.ArgumentParser(description="Обслуживание базы и хранилища фото")
+    parser.add_argument("--database", default=DATABASE)
+    parser.add_argument("--photos", default=PHOTOS_DIR)
+    parser.add_argument("--vacuum", action="store_true",
+                        help="полный VACUUM и перевод на auto_vacuum=INCREMENTAL (бот остановлен)")
+    parser.add_argument("--merge-duplicates", action="store_true",
+                        help="слить проекты, чьи имена отличаются только регистром и пробелами")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    manager = DB_Manager(args.database)
+    try:
+        if args.vacuum:
+            manager.full_vacuum()
+        Maintenance(manager, PhotoStore(args.photos, MAX_PHOTO_SIZE), pause=0,
+                    merge=args.merge_duplicates).run()
+    finally:
+        manager.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+# metrics.py
+# Замеры времени обработчиков, запросов к БД и вызовов Telegram API.
+# Гистограммы копятся в памяти процесса и отдаются в формате Prometheus
+# (GET /metrics) и периодической сводкой в лог.
+# Выключено — значит объект Metrics не создан: обёртки не ставятся,
+# в горячем пути остаётся одна проверка "is None".
+import bisect
+import functools
+import inspect
+import logging
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Верхние границы корзин гистограммы, секунды
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Сколько последних медленных запросов держать для сводки
+SLOW_QUERIES_KEPT = 100
+
+
+def params_shape(params) -> str:
+    """Форма параметров запроса без значений: (int, str) или 500 x (int, str)."""
+    if isinstance(params, list) and params and isinstance(params[0], (tuple, list)):
+        return f"{len(params)} x {params_shape(params[0])}"
+    return "(" + ", ".join(type(p).__name__ for p in params) + ")"
+
+
+class Metrics:
+    """Гистограммы времени и счётчики ошибок по (вид, имя)."""
+
+    def __init__(self, slow_query: float = 0.05, prefix: str = "portfolio"):
+        self.slow_query = slow_query
+        self.prefix = prefix
+        # (kind, name) -> [счётчики по корзинам + переполнение, сумма, число]
+        self._hist: dict[tuple[str, str], list] = {}
+        self._errors: dict[tuple[str, str, str], int] = {}
+        self.slow_queries: deque = deque(maxlen=SLOW_QUERIES_KEPT)
+        self._lock = threading.Lock()
+
+    # ------ Сбор ------
+
+    def observe(self, kind: str, name: str, seconds: float, error: str | None = None):
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            hist = self._hist.get((kind, name))
+            if hist is None:
+                hist = self._hist[(kind, name)] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+            hist[0][index] += 1
+            hist[1] += seconds
+            hist[2] += 1
+            if error is not None:
+                key = (kind, name, error)
+                self._errors[key] = self._errors.get(key, 0) + 1
+
+    def query(self, sql: str, params, seconds: float):
+        """Запрос к SQLite: в лог медленных, если дольше slow_query."""
+        if seconds >= self.slow_query:
+            sql = " ".join(sql.split())
+            shape = params_shape(params)
+            self.slow_queries.append((time.time(), seconds, sql, shape))
+            logger.warning("Медленный запрос %.1f мс: %s %s", seconds * 1000, sql, shape)
+
+    def call(self, kind: str, name: str, func, *args, **kwargs):
+        """Вызвать func с замером времени; исключение учитывается и пробрасывается."""
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self.observe(kind, name, time.perf_counter() - start, type(e).__name__)
+            raise
+        self.observe(kind, name, time.perf_counter() - start)
+        return result
+
+    def wrap(self, kind: str, func, name: str = None):
+        """Обёртка с замером времени; корутины оборачиваются корутиной."""
+        name = name or getattr(func, "__name__", repr(func))
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def timed_async(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception as e:
+                    self.observe(kind, name, time.perf_counter() - start, type(e).__name__)
+                    raise
+                self.observe(kind, name, time.perf_counter() - start)
+                return result
+            return timed_async
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            return self.call(kind, name, func, *args, **kwargs)
+        return timed
+
+    def instrument(self, obj, kind: str):
+        """Обернуть публичные методы объекта (генераторы не трогаем)."""
+        for name in dir(type(obj)):
+            attr = getattr(type(obj), name)
+            if name.startswith("_") or not inspect.isfunction(attr) \
+                    or inspect.isgeneratorfunction(attr):
+                continue
+            setattr(obj, name, self.wrap(kind, getattr(obj, name), name))
+
+    def instrument_handlers(self, bot):
+        """Обернуть уже зарегистрированные обработчики сообщений и кнопок."""
+        for handlers in (bot.message_handlers, bot.callback_query_handlers):
+            for handler in handlers:
+                handler["function"] = self.wrap("handler", handler["function"])
+
+    def request_sender(self, send):
+        """
+        Замер вызовов Telegram API для apihelper.CUSTOM_REQUEST_SENDER:
+        send — функция как requests.request, имя метода берётся из URL.
+        """
+        def timed_send(method, url, **kwargs):
+            return self.call("telegram", url.rsplit("/", 1)[-1], send, method, url, **kwargs)
+        return timed_send
+
+    # ------ Вывод ------
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus."""
+        with self._lock:
+            hists = {k: (list(v[0]), v[1], v[2]) for k, v in self._hist.items()}
+            errors = dict(self._errors)
+        lines = []
+        for kind in sorted({k for k, _ in hists}):
+            metric = f"{self.prefix}_{kind}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for (k, name), (counts, total, count) in sorted(hists.items()):
+                if k != kind:
+                    continue
+                cumulative = 0
+                for bound, n in zip(BUCKETS + (float("inf"),), counts):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{metric}_bucket{{name="{name}",le="{le}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{name="{name}"}} {total}')
+                lines.append(f'{metric}_count{{name="{name}"}} {count}')
+        if errors:
+            metric = f"{self.prefix}_errors_total"
+            lines.append(f"# TYPE {metric} counter")
+            for (kind, name, error), n in sorted(errors.items()):
+                lines.append(f'{metric}{{kind="{kind}",name="{name}",error="{error}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _quantile(counts: list[int], count: int, q: float) -> float:
+        """Верхняя граница корзины, в которую попадает квантиль q."""
+        rank, cumulative = q * count, 0
+        for bound, n in zip(BUCKETS, counts):
+            cumulative += n
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+    def summary(self, top: int = 10) -> str:
+        """Сводка для лога: самые затратные по суммарному времени."""
+        with self._lock:
+            items = [(k, list(v[0]), v[1], v[2]) for k, v in self._hist.items()]
+            errors = sum(self._errors.values())
+        items.sort(key=lambda item: item[2], reverse=True)
+        lines = [f"{'':<10} {'имя':<28} {'вызовов':>8} {'сред.':>9} {'p95 ≤':>9}"]
+        for (kind, name), counts, total, count in items[:top]:
+            lines.append(
+                f"{kind:<10} {name:<28} {count:>8} {total / count * 1000:>7.3f}мс "
+                f"{self._quantile(counts, count, 0.95) * 1000:>7.1f}мс"
+            )
+        lines.append(f"ошибок: {errors}, медленных запросов: {len(self.slow_queries)}")
+        return "\n".join(lines)
+
+    def start_reporter(self, interval: float):
+        """Поток, пишущий summary() в лог раз в interval секунд."""
+        def report():
+            while True:
+                time.sleep(interval)
+                logger.info("Метрики:\n%s", self.summary())
+        threading.Thread(target=report, name="metrics-reporter", daemon=True).start()
+
+    def serve(self, host: str, port: int) -> ThreadingHTTPServer:
+        """HTTP-сервер с GET /metrics в отдельном потоке."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        httpd = ThreadingHTTPServer((host, port), Handler)
+        httpd.daemon_threads = True
+        threading.Thread(target=httpd.serve_forever, name="metrics-http", daemon=True).start()
+        return httpd
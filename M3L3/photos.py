@@ -0,0 +1,231 @@
+# photos.py
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from importlib.util import find_spec
+
+logger = logging.getLogger(__name__)
+
+# Файлы без ссылок удаляются не сразу: только что сохранённое фото
+# ещё может ждать записи в projects
+GC_GRACE_SECONDS = 600
+# Уменьшенные копии фото: вид -> (наибольшая сторона, качество JPEG).
+# preview уходит в карточку проекта, thumb — для списков
+VARIANTS = {"preview": (1280, 80), "thumb": (320, 75)}
+
+
+def variant_name(name: str, kind: str) -> str:
+    """ab/abcdef….jpg -> ab/abcdef….preview.jpg"""
+    root, ext = os.path.splitext(name)
+    return f"{root}.{kind}{ext}"
+
+
+def make_variants(root: str, name: str) -> dict[str, int]:
+    """
+    Сделать все VARIANTS для фото (выполняется в процессе пула).
+    Поворот из EXIF применяется к пикселям, сами метаданные не сохраняются.
+    Возвращает размеры получившихся файлов.
+    """
+    from PIL import Image, ImageOps
+
+    sizes = {}
+    with Image.open(os.path.join(root, name)) as original:
+        image = ImageOps.exif_transpose(original).convert("RGB")
+    for kind, (side, quality) in VARIANTS.items():
+        variant = image.copy()
+        variant.thumbnail((side, side), Image.LANCZOS)
+        target = os.path.join(root, variant_name(name, kind))
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                variant.save(f, "JPEG", quality=quality, optimize=True, progressive=True)
+            os.replace(tmp, target)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        sizes[kind] = os.path.getsize(target)
+    return sizes
+
+
+class PhotoTooLarge(Exception):
+    """Фото больше допустимого размера."""
+
+
+class PhotoStore:
+    """
+    Хранилище фото по содержимому: файл называется sha256 своих байтов,
+    одинаковые фото разных пользователей лежат на диске один раз.
+    В projects.photo пишется имя относительно root ("ab/abcdef….jpg"),
+    счётчики ссылок ведёт БД (таблица photo_files, см. миграции).
+    Рядом с оригиналом в фоновом пуле процессов готовятся уменьшенные
+    копии (VARIANTS); без Pillow их нет и везде отдаётся оригинал.
+    """
+
+    def __init__(self, root: str, max_size: int, workers: int = 1):
+        self.root = root
+        self.max_size = max_size
+        self.workers = workers
+        self.variants_enabled = find_spec("PIL") is not None
+        if not self.variants_enabled:
+            logger.warning("Pillow не установлен: уменьшенные копии фото не создаются")
+        self._pool = None
+        self._pending: set[str] = set()
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def exists(self, name: str) -> bool:
+        """Оригинал фото есть на диске."""
+        return os.path.exists(self.path(name))
+
+    # ------ Уменьшенные копии ------
+
+    def schedule_variants(self, name: str):
+        """Заказать копии фото в фоновом пуле, если их ещё нет."""
+        if not self.variants_enabled or all(
+            os.path.exists(self.path(variant_name(name, kind))) for kind in VARIANTS
+        ):
+            return
+        with self._lock:
+            if name in self._pending:
+                return
+            if self._pool is None:
+                # spawn: fork процесса с потоками бота и соединениями SQLite небезопасен
+                self._pool = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            self._pending.add(name)
+            future = self._pool.submit(make_variants, self.root, name)
+        future.add_done_callback(lambda f: self._variants_done(name, f))
+
+    def _variants_done(self, name: str, future):
+        with self._lock:
+            self._pending.discard(name)
+        if future.exception() is not None:
+            logger.error("Не удалось уменьшить фото %s: %r", name, future.exception())
+
+    def send_path(self, name: str, kind: str = "preview") -> str | None:
+        """
+        Файл для отправки: готовая копия kind, иначе оригинал (копия
+        заказывается). None — нет и оригинала.
+        """
+        path = self.path(variant_name(name, kind))
+        if os.path.exists(path):
+            return path
+        if not self.exists(name):
+            return None
+        self.schedule_variants(name)
+        return self.path(name)
+
+    def close(self):
+        """Дождаться заказанных копий и остановить пул."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def save(self, chunks) -> str:
+        """
+        Записать фото из итератора байтовых кусков, не держа его целиком
+        в памяти. Возвращает имя для projects.photo.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_size:
+                        raise PhotoTooLarge(size)
+                    digest.update(chunk)
+                    f.write(chunk)
+            hexdigest = digest.hexdigest()
+            name = f"{hexdigest[:2]}/{hexdigest}.jpg"
+            target = self.path(name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if os.path.exists(target):
+                # такое фото уже есть — продлеваем ему жизнь для GC
+                os.utime(target)
+                os.remove(tmp)
+            else:
+                os.replace(tmp, target)
+            return name
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def collect_garbage(self, manager, grace: float = GC_GRACE_SECONDS) -> int:
+        """Удалить файлы, на которые больше не ссылается ни один проект."""
+        removed = []
+        deadline = time.time() - grace
+        for name in manager.get_orphan_photos():
+            path = self.path(name)
+            try:
+                if os.path.getmtime(path) > deadline:
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            for kind in VARIANTS:
+                try:
+                    os.remove(self.path(variant_name(name, kind)))
+                except FileNotFoundError:
+                    pass
+            removed.append(name)
+        manager.forget_photos(removed)
+        return len(removed)
+
+    def sweep(self, manager, grace: float = GC_GRACE_SECONDS, batch: int = 500,
+              pause: float = 0.0) -> int:
+        """
+        Удалить файлы, о которых БД не знает: фото, так и не записанные в
+        проект (сбой между save и записью в БД), копии без оригинала,
+        брошенные .part. Каталоги проверяются порциями по batch файлов
+        с паузой между ними; файлы моложе grace не трогаются.
+        """
+        removed = 0
+        deadline = time.time() - grace
+
+        def remove(path):
+            nonlocal removed
+            try:
+                if os.path.getmtime(path) <= deadline:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+
+        folders = []
+        with os.scandir(self.root) as top:
+            for entry in top:
+                if entry.is_dir():
+                    folders.append(entry.name)
+                elif entry.name.endswith(".part"):
+                    remove(entry.path)
+        for folder in folders:
+            names = sorted(os.listdir(self.path(folder)))
+            for start in range(0, len(names), batch):
+                chunk = [f"{folder}/{n}" for n in names[start:start + batch]]
+                originals = [n for n in chunk
+                             if n.endswith(".jpg") and "." not in os.path.basename(n)[:-4]]
+                known = manager.get_known_photos(originals)
+                for name in chunk:
+                    if name.endswith(".part"):
+                        remove(self.path(name))
+                    elif name in originals:
+                        if name not in known:
+                            remove(self.path(name))
+                    elif not os.path.exists(self.path(name.split(".", 1)[0] + ".jpg")):
+                        # копия (….preview.jpg), оригинала которой уже нет
+                        remove(self.path(name))
+                if pause:
+                    time.sleep(pause)
+        return removed
@@ -0,0 +1,532 @@
+# replay.py
+# Нагрузочный прогон настоящих хэндлеров main.py или async_main.py без
+# сети: локальный сервер изображает Bot API, база заполняется заранее,
+# поток обновлений генерируется для тысяч пользователей или читается
+# из файла (JSON Lines, по обновлению Telegram на строку).
+#
+# Запуск:
+#   python replay.py --users 2000 --out result.json
+#   python replay.py --bot async --users 2000 --out result.json
+#   python replay.py --updates recorded.jsonl --out result.json
+#   python replay.py --users 2000 --baseline result.json   (сравнить с прошлым прогоном)
+import argparse
+import asyncio
+import email
+import itertools
+import json
+import os
+import resource
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+SAMPLE_PHOTO = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "project_photos", "1507452899_Renwene.jpg")
+# Первый user_id синтетических пользователей
+FIRST_USER = 100_000
+# Операторы управления транзакцией в число запросов не входят
+TX_CONTROL = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "--")
+
+
+# ========== Bot API ==========
+
+class LocalBotAPI:
+    """
+    Bot API на 127.0.0.1: отвечает на вызовы, которые делают хэндлеры,
+    правдоподобными объектами (Message, File). latency — пауза на вызов,
+    как сетевой круг до api.telegram.org.
+    """
+
+    def __init__(self, latency: float = 0.0, photo: bytes = b""):
+        self.latency = latency
+        self.photo = photo
+        self.calls = 0
+        self._ids = itertools.count(1)
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                self._handle()
+
+            def do_POST(self):
+                self._handle()
+
+            def _handle(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                url = urlsplit(self.path)
+                if api.latency:
+                    time.sleep(api.latency)
+                if url.path.startswith("/file/"):
+                    return self._reply(api.photo, "image/jpeg")
+                # TeleBot шлёт параметры в строке запроса, AsyncTeleBot — в теле
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                params.update(form_params(self.headers.get("Content-Type", ""), body))
+                result = api.result(url.path.rsplit("/", 1)[-1], params)
+                body = json.dumps({"ok": True, "result": result}).encode()
+                self._reply(body, "application/json")
+
+            def _reply(self, body: bytes, content_type: str):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            request_queue_size = 128
+
+        self.httpd = Server(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, name="local-bot-api", daemon=True).start()
+        port = self.httpd.server_address[1]
+        self.api_url = f"http://127.0.0.1:{port}/bot{{0}}/{{1}}"
+        self.file_url = f"http://127.0.0.1:{port}/file/bot{{0}}/{{1}}"
+
+    def result(self, method: str, params: dict):
+        self.calls += 1
+        if method == "getFile":
+            return {"file_id": params["file_id"], "file_unique_id": params["file_id"],
+                    "file_size": len(self.photo), "file_path": "photos/file.jpg"}
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "replay", "username": "replay_bot"}
+        if not method.startswith(("send", "edit")):
+            return True
+        message = {
+            "message_id": int(params.get("message_id") or next(self._ids)),
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+        }
+        if "text" in params:
+            message["text"] = params["text"]
+        if method == "sendPhoto":
+            file_id = f"photo{message['message_id']}"
+            message["photo"] = [{"file_id": file_id, "file_unique_id": file_id,
+                                 "width": 1280, "height": 591}]
+        elif method == "sendDocument":
+            message["document"] = {"file_id": "doc", "file_unique_id": "doc"}
+        markup = json.loads(params.get("reply_markup") or "null")
+        if isinstance(markup, dict) and "inline_keyboard" in markup:
+            message["reply_markup"] = markup
+        return message
+
+    def shutdown(self):
+        self.httpd.shutdown()
+
+
+def form_params(content_type: str, body: bytes) -> dict:
+    """Поля формы из тела запроса: urlencoded или multipart (файлы пропускаются)."""
+    if content_type.startswith("application/x-www-form-urlencoded"):
+        return {k: v[0] for k, v in parse_qs(body.decode(), keep_blank_values=True).items()}
+    if content_type.startswith("multipart/form-data"):
+        form = email.message_from_bytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        return {part.get_param("name", header="content-disposition"):
+                part.get_payload(decode=True).decode()
+                for part in form.get_payload() if not part.get_filename()}
+    return {}
+
+
+# ========== Поток обновлений ==========
+
+def seed(database: str, users: int, per_user: int) -> dict[int, list[tuple]]:
+    """Заполнить базу проектами; вернуть user_id -> [(project_id, name)]."""
+    from logic import DB_Manager
+
+    manager = DB_Manager(database)
+    skills = [s[1] for s in manager.get_skills()]
+    statuses = [s[0] for s in manager.get_statuses()]
+    projects = {}
+    for i in range(users):
+        uid = FIRST_USER + i
+        manager.import_projects(uid, [
+            {"name": f"Проект {uid}-{k}", "description": f"Описание {k}",
+             "url": f"https://example.com/{uid}/{k}", "status": statuses[k % len(statuses)],
+             "skills": skills[:k % len(skills) + 1], "photo": None, "photo_file_id": None}
+            for k in range(per_user)
+        ])
+        projects[uid] = [(p[0], p[2]) for p in manager.get_projects(uid)]
+    manager.close()
+    return projects
+
+
+class StreamBuilder:
+    """Обновления в формате Telegram с метками для отчёта."""
+
+    def __init__(self):
+        self.ids = itertools.count(1)
+        self.labels: dict[int, str] = {}
+
+    def _user(self, uid: int) -> dict:
+        return {"id": uid, "is_bot": False, "first_name": f"u{uid}"}
+
+    def message(self, uid: int, label: str, text: str = None, **extra) -> dict:
+        update_id = next(self.ids)
+        self.labels[update_id] = label
+        message = {"message_id": update_id, "date": int(time.time()),
+                   "chat": {"id": uid, "type": "private"}, "from": self._user(uid), **extra}
+        if text is not None:
+            message["text"] = text
+            if text.startswith("/"):
+                command = text.split()[0]
+                message["entities"] = [{"type": "bot_command", "offset": 0,
+                                        "length": len(command)}]
+        return {"update_id": update_id, "message": message}
+
+    def callback(self, uid: int, label: str, data: str, reply_markup: dict = None) -> dict:
+        update_id = next(self.ids)
+        self.labels[update_id] = label
+        message = {"message_id": update_id, "date": int(time.time()),
+                   "chat": {"id": uid, "type": "private"}, "from": self._user(1)}
+        if reply_markup is not None:
+            message["reply_markup"] = reply_markup
+        return {"update_id": update_id, "callback_query": {
+            "id": str(update_id), "from": self._user(uid), "chat_instance": str(uid),
+            "data": data, "message": message,
+        }}
+
+
+def user_script(b: StreamBuilder, uid: int, projects: list[tuple], statuses: list[str],
+                skills: list[tuple], page_size: int) -> list[dict]:
+    """Сессия одного пользователя по основным командам бота."""
+    pid, name = projects[0]
+    sid = skills[0][0]
+    picker = {"inline_keyboard": [
+        [{"text": ("✅ " if i == 0 else "") + s[1], "callback_data": f"sk:{pid}:{s[0]}"}]
+        for i, s in enumerate(skills)
+    ] + [[{"text": "Готово ✔️", "callback_data": f"sk:{pid}:ok"}]]}
+    script = [
+        b.message(uid, "/start", "/start"),
+        b.message(uid, "/new_project", "/new_project"),
+        b.message(uid, "/new_project шаг", f"Новый проект {uid}"),
+        b.message(uid, "/new_project шаг", f"https://example.com/{uid}"),
+        b.message(uid, "/new_project шаг", statuses[0]),
+        b.message(uid, "/projects", "/projects"),
+        b.callback(uid, "кнопка проекта", f"p:{pid}"),
+    ]
+    if len(projects) > page_size:
+        script.append(b.callback(uid, "листание", f"pg:>{projects[page_size - 1][0]}"))
+    script += [
+        b.message(uid, "/skills", "/skills"),
+        b.message(uid, "/skills шаг", name),
+        b.callback(uid, "отметка навыка", f"sk:{pid}:{sid}", picker),
+        b.message(uid, "/skills шаг", "Docker, FastAPI"),
+        b.callback(uid, "навыки готово", f"sk:{pid}:ok", picker),
+        b.message(uid, "/update_projects", "/update_projects"),
+        b.message(uid, "/update_projects шаг", name),
+        b.message(uid, "/update_projects шаг", "Описание"),
+        b.message(uid, "/update_projects шаг", f"Новое описание {uid}"),
+        b.message(uid, "/add_photo", "/add_photo"),
+        b.message(uid, "/add_photo шаг", name),
+        b.message(uid, "фото", photo=[{"file_id": f"up{uid}", "file_unique_id": f"up{uid}",
+                                       "width": 1280, "height": 591, "file_size": 62434}]),
+        b.message(uid, "текст без команды", name),
+        b.message(uid, "текст без команды", "привет"),
+    ]
+    return script
+
+
+def synthetic_stream(b: StreamBuilder, projects: dict, statuses, skills,
+                     page_size: int) -> list[dict]:
+    """Сессии всех пользователей вперемешку: шаг k каждого, затем шаг k+1."""
+    scripts = [user_script(b, uid, p, statuses, skills, page_size)
+               for uid, p in projects.items()]
+    return [u for step in itertools.zip_longest(*scripts) for u in step if u is not None]
+
+
+def label_of(update: dict) -> str:
+    """Метка записанного обновления: команда, префикс кнопки или тип сообщения."""
+    if "callback_query" in update:
+        return "кнопка " + update["callback_query"].get("data", "").split(":")[0]
+    message = update.get("message") or {}
+    text = message.get("text") or ""
+    if text.startswith("/"):
+        return text.split()[0].split("@")[0]
+    return "текст" if text else next(
+        (k for k in ("photo", "document") if k in message), "другое")
+
+
+# ========== Прогон ==========
+
+def _percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+                              ).stdout.strip()
+    except OSError:
+        return ""
+
+
+class Stats:
+    """Задержки, запросы SQL и ошибки по меткам обновлений."""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.queries: dict[str, int] = {}
+        self.errors = 0
+        self.first_done = None
+        # запросы текущего потока (для метки) и всего процесса
+        self.local = threading.local()
+        self.total_queries = itertools.count()
+        self._lock = threading.Lock()
+
+    def trace(self, manager):
+        """Считать запросы на каждом соединении DB_Manager, нынешнем и будущих."""
+        def trace(sql: str):
+            if not sql.lstrip().upper().startswith(TX_CONTROL):
+                self.local.queries = getattr(self.local, "queries", 0) + 1
+                next(self.total_queries)
+
+        connect = manager._connect
+
+        def traced_connect():
+            conn = connect()
+            conn.set_trace_callback(trace)
+            return conn
+
+        manager._connect = traced_connect
+        for conn in manager._conns:
+            conn.set_trace_callback(trace)
+
+    def add(self, label: str, queued: float, queries: int = None, error: bool = False):
+        with self._lock:
+            done = time.perf_counter()
+            self.first_done = self.first_done or done
+            self.latencies.setdefault(label, []).append(done - queued)
+            if queries is not None:
+                self.queries[label] = self.queries.get(label, 0) + queries
+            self.errors += error
+
+    def handle(self, exception) -> bool:
+        """exception_handler для AsyncTeleBot: посчитать ошибку, в лог её пишет бот."""
+        with self._lock:
+            self.errors += 1
+        return False
+
+
+def replay_sync(stream: list[dict], labels: dict, stats: Stats) -> tuple:
+    """
+    main.py: обновления пачками по 100 уходят в ChatDispatcher.
+    Возвращает (импорт, готов, прогон) в секундах и момент начала старта.
+    """
+    from telebot import types
+
+    # холодный старт: импорт main (telebot уже загружен выше), startup()
+    # и первое обработанное обновление
+    started = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+    main.startup()
+    ready = time.perf_counter()
+    stats.trace(main.manager)
+    submit = main.bot.dispatcher.submit
+
+    def timed_submit(chat_id, func, update):
+        label, queued = labels.get(update.update_id, "другое"), time.perf_counter()
+
+        def timed(update):
+            before, error = getattr(stats.local, "queries", 0), False
+            try:
+                func(update)
+            except Exception:
+                error = True
+                raise
+            finally:
+                stats.add(label, queued, getattr(stats.local, "queries", 0) - before, error)
+        submit(chat_id, timed, update)
+
+    main.bot.dispatcher.submit = timed_submit
+
+    start = time.perf_counter()
+    for i in range(0, len(stream), 100):
+        main.bot.process_new_updates([types.Update.de_json(u) for u in stream[i:i + 100]])
+    main.bot.dispatcher.shutdown()
+    elapsed = time.perf_counter() - start
+    main.photo_store.close()
+    main.manager.close()
+    return imported - started, ready - started, elapsed, started
+
+
+async def replay_async(stream: list[dict], labels: dict, stats: Stats) -> tuple:
+    """
+    async_main.py: пачки по 100 отдаются боту отдельными задачами, как
+    это делает поллинг AsyncTeleBot; порядок внутри чата держит сам бот.
+    Запросы SQL идут в пуле потоков AsyncDB_Manager, поэтому считаются
+    только на весь прогон. Возвращает то же, что replay_sync.
+    """
+    from telebot import types
+
+    started = time.perf_counter()
+    import async_main
+    imported = time.perf_counter()
+    await async_main.startup()
+    ready = time.perf_counter()
+    stats.trace(async_main.manager.sync)
+    async_main.bot.exception_handler = stats
+    process = async_main.bot._process_in_order
+
+    async def timed(update):
+        await process(update)
+        stats.add(labels.get(update.update_id, "другое"), start)
+
+    async_main.bot._process_in_order = timed
+
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        asyncio.create_task(async_main.bot.process_new_updates(
+            [types.Update.de_json(u) for u in stream[i:i + 100]]
+        ))
+        for i in range(0, len(stream), 100)
+    ))
+    elapsed = time.perf_counter() - start
+    async_main.photo_store.close()
+    await async_main.manager.close()
+    await async_main.bot.close_session()
+    return imported - started, ready - started, elapsed, started
+
+
+def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="replay-")
+    database = os.path.join(workdir, "replay.db")
+    with open(SAMPLE_PHOTO, "rb") as f:
+        api = LocalBotAPI(args.latency, f.read())
+
+    # настройки подменяются до импорта main: бот создаётся при импорте
+    import config
+    config.TOKEN = "1:REPLAY"
+    config.DATABASE = database
+    config.PHOTOS_DIR = os.path.join(workdir, "photos")
+    config.WORKERS = args.workers
+    config.SEND_RATE = 0
+    config.WEBHOOK_URL = ""
+    if args.bot == "async":
+        from telebot import asyncio_helper as apihelper
+    else:
+        from telebot import apihelper
+    apihelper.API_URL = api.api_url
+    apihelper.FILE_URL = api.file_url
+
+    builder = StreamBuilder()
+    if args.database:
+        shutil.copyfile(args.database, database)
+    if args.updates:
+        with open(args.updates, encoding="utf-8") as f:
+            stream = [json.loads(line) for line in f if line.strip()]
+        labels = {u["update_id"]: label_of(u) for u in stream}
+    else:
+        projects = seed(database, args.users, args.projects)
+        from logic import DB_Manager
+        manager = DB_Manager(database)
+        statuses = [s[0] for s in manager.get_statuses()]
+        skills = manager.get_skills()
+        manager.close()
+        stream = synthetic_stream(builder, projects, statuses, skills, config.PROJECTS_PAGE_SIZE)
+        labels = builder.labels
+
+    stats = Stats()
+    if args.bot == "async":
+        import_s, ready_s, elapsed, started = asyncio.run(replay_async(stream, labels, stats))
+    else:
+        import_s, ready_s, elapsed, started = replay_sync(stream, labels, stats)
+    api.shutdown()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    total = sum(len(v) for v in stats.latencies.values())
+    return {
+        "commit": _commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": {"bot": args.bot, "users": args.users, "projects": args.projects,
+                   "workers": args.workers, "latency": args.latency,
+                   "updates_file": args.updates, "database": args.database},
+        "updates": total,
+        "errors": stats.errors,
+        "seconds": round(elapsed, 3),
+        "throughput": round(total / elapsed, 1),
+        "api_calls": api.calls,
+        "queries_per_update": round(next(stats.total_queries) / max(total, 1), 2),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "startup": {
+            "import_s": round(import_s, 3),
+            "ready_s": round(ready_s, 3),
+            "first_update_s": round((stats.first_done or started + ready_s) - started, 3),
+        },
+        "commands": {
+            label: {
+                "count": len(values),
+                "p50_ms": round(_percentile(values, 0.5) * 1000, 2),
+                "p95_ms": round(_percentile(values, 0.95) * 1000, 2),
+                "p99_ms": round(_percentile(values, 0.99) * 1000, 2),
+                # у async_main запросы по командам не разделить
+                "queries": (round(stats.queries[label] / len(values), 2)
+                            if label in stats.queries else None),
+            }
+            for label, values in sorted(stats.latencies.items())
+        },
+    }
+
+
+def report(result: dict, baseline: dict = None):
+    print(f"{result['updates']:,} обновлений за {result['seconds']} с: "
+          f"{result['throughput']:,.0f} upd/с, ошибок {result['errors']}, "
+          f"SQL на обновление {result['queries_per_update']}, "
+          f"пик RSS {result['peak_rss_mb']} МБ")
+    startup = result["startup"]
+    print(f"старт: импорт {startup['import_s']} с, готов через {startup['ready_s']} с, "
+          f"первое обновление через {startup['first_update_s']} с")
+    if baseline:
+        print(f"было ({baseline['commit'] or '?'}): {baseline['throughput']:,.0f} upd/с, "
+              f"SQL на обновление {baseline['queries_per_update']}, "
+              f"пик RSS {baseline['peak_rss_mb']} МБ")
+    print(f"{'':<24} {'число':>7} {'p50 мс':>8} {'p95 мс':>8} {'p99 мс':>8} {'SQL':>5}")
+    for label, c in result["commands"].items():
+        queries = "—" if c["queries"] is None else c["queries"]
+        line = (f"{label:<24} {c['count']:>7} {c['p50_ms']:>8} {c['p95_ms']:>8} "
+                f"{c['p99_ms']:>8} {queries:>5}")
+        old = (baseline or {}).get("commands", {}).get(label)
+        if old:
+            line += f"   было p95 {old['p95_ms']} мс, SQL {old['queries']}"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Прогон хэндлеров бота на локальном Bot API")
+    parser.add_argument("--bot", choices=("sync", "async"), default="sync",
+                        help="main.py или async_main.py")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--projects", type=int, default=12, help="проектов у пользователя в базе")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="задержка Bot API на вызов, секунд")
+    parser.add_argument("--updates", help="записанные обновления, JSON Lines")
+    parser.add_argument("--database", help="копия этой базы вместо сгенерированной")
+    parser.add_argument("--out", help="куда записать результат (JSON)")
+    parser.add_argument("--baseline", help="результат прошлого прогона для сравнения")
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    report(result, baseline)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
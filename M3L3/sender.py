@@ -0,0 +1,218 @@
+# sender.py
+# Ограничение скорости исходящих вызовов Telegram API.
+# Telegram пропускает около 30 сообщений в секунду на бота, около одного
+# в секунду в личный чат (с короткими всплесками) и 20 в минуту в группу;
+# сверх этого отвечает 429 с retry_after. Лимитер ставится в
+# apihelper.CUSTOM_REQUEST_SENDER: вызывающий поток ждёт своей очереди
+# и сам делает запрос, поэтому запросы разных чатов идут параллельно.
+# В общих рабочих потоках (ChatDispatcher) лимит чата не ждут: обработчик
+# отправляет в долг, а следующее обновление чата диспетчер откладывает
+# по chat_delay, пока долг не погашен.
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_RATE = 30.0
+CHAT_RATE = 1.0
+CHAT_BURST = 3
+GROUP_RATE = 20 / 60
+# Сколько раз повторять запрос после 429
+MAX_RETRIES = 5
+# Вызовы API, которые считаются сообщениями (answerCallbackQuery и т.п. — нет)
+LIMITED_PREFIXES = ("send", "forward", "copy", "edit")
+# Приоритеты: ответы на действия пользователя идут раньше массового вывода
+INTERACTIVE = 0
+BULK = 1
+# Корзины чатов, которые полностью восстановились, забываются,
+# когда их становится больше этого числа
+CHAT_BUCKETS_KEPT = 10_000
+
+
+class TokenBucket:
+    """
+    Корзина токенов в виде GCRA: хранится только момент tat, когда
+    корзина снова будет полной. Пропускает burst запросов подряд,
+    дальше — rate в секунду.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.interval = 1 / rate
+        self.burst = burst
+        self.tat = 0.0
+
+    def delay(self, now: float) -> float:
+        """Сколько ждать до свободного токена (0 — можно сейчас)."""
+        return max(0.0, self.tat - now - (self.burst - 1) * self.interval)
+
+    def take(self, now: float):
+        self.tat = max(self.tat, now) + self.interval
+
+    def reserve(self, now: float) -> float:
+        """Занять ближайший токен; вернуть, сколько до него ждать."""
+        wait = self.delay(now)
+        self.take(now + wait)
+        return wait
+
+    def pause(self, until: float):
+        """Ничего не пропускать до until (ответ 429)."""
+        self.tat = max(self.tat, until + (self.burst - 1) * self.interval)
+
+
+def retry_after(response) -> float | None:
+    """Пауза из ответа 429 (секунд) или None, если это не 429."""
+    if response.status_code != 429:
+        return None
+    try:
+        return float(response.json()["parameters"]["retry_after"])
+    except (ValueError, KeyError, TypeError):
+        return 1.0
+
+
+def _rewind(files):
+    """Файлы уже прочитаны прошлой попыткой — вернуть их в начало."""
+    for value in (files or {}).values():
+        f = value[1] if isinstance(value, tuple) else value
+        if hasattr(f, "seek"):
+            f.seek(0)
+
+
+class SendLimiter:
+    """
+    Общий лимит бота и лимиты по чатам. Сначала запрос ждёт токен своего
+    чата (чаты друг другу не мешают), затем — общий токен; за общим
+    токеном ожидающие выстраиваются по приоритету, внутри него — по порядку.
+    """
+
+    def __init__(self, rate: float = GLOBAL_RATE, chat_rate: float = CHAT_RATE,
+                 chat_burst: int = CHAT_BURST, group_rate: float = GROUP_RATE,
+                 max_retries: int = MAX_RETRIES):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.retries = 0
+        self._global = TokenBucket(rate)
+        self._chats: dict[int, TokenBucket] = {}
+        self._waiting: list[tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._local = threading.local()
+
+    def _chat(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= CHAT_BUCKETS_KEPT:
+                self._chats = {k: b for k, b in self._chats.items() if b.tat > now}
+            # отрицательные id — группы и каналы
+            rate = self.group_rate if chat_id < 0 else self.chat_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate, self.chat_burst)
+        return bucket
+
+    @property
+    def priority(self) -> int:
+        return getattr(self._local, "priority", INTERACTIVE)
+
+    @property
+    def paced(self) -> bool:
+        return getattr(self._local, "paced", False)
+
+    @contextmanager
+    def pacing(self):
+        """
+        Лимит чата соблюдает вызывающий (диспетчер по chat_delay): запросы
+        этого потока внутри блока не спят на токене чата, а берут его в долг —
+        не больше одного всплеска сверх нормы.
+        """
+        previous = self.paced
+        self._local.paced = True
+        try:
+            yield
+        finally:
+            self._local.paced = previous
+
+    def chat_delay(self, chat_id: int) -> float:
+        """Сколько чату ждать свободного токена (0 — можно отправлять)."""
+        with self._cond:
+            bucket = self._chats.get(chat_id)
+            return bucket.delay(time.monotonic()) if bucket is not None else 0.0
+
+    @contextmanager
+    def bulk(self):
+        """Запросы этого потока внутри блока — массовый вывод: пропускают ответы вперёд."""
+        previous = self.priority
+        self._local.priority = BULK
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+
+    def acquire(self, chat_id: int | None, priority: int = None, credit: bool = None):
+        """
+        Дождаться права отправить сообщение в chat_id. С credit (по умолчанию —
+        внутри pacing) токен чата берётся в долг, ждать приходится только сверх него.
+        """
+        priority = self.priority if priority is None else priority
+        credit = self.paced if credit is None else credit
+        wait = 0.0
+        if chat_id is not None:
+            with self._cond:
+                now = time.monotonic()
+                bucket = self._chat(chat_id, now)
+                wait = bucket.reserve(now)
+                if credit:
+                    wait = max(0.0, wait - bucket.burst * bucket.interval)
+        if wait:
+            time.sleep(wait)
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiting, ticket)
+            while True:
+                now = time.monotonic()
+                if self._waiting[0] == ticket:
+                    wait = self._global.delay(now)
+                    if not wait:
+                        self._global.take(now)
+                        heapq.heappop(self._waiting)
+                        self._cond.notify_all()
+                        return
+                    self._cond.wait(wait)
+                else:
+                    self._cond.wait()
+
+    def pause(self, chat_id: int | None, seconds: float):
+        """Telegram ответил 429: придержать чат (или всех, если чат неизвестен)."""
+        with self._cond:
+            now = time.monotonic()
+            if chat_id is None:
+                self._global.pause(now + seconds)
+            else:
+                self._chat(chat_id, now).pause(now + seconds)
+
+    def request_sender(self, send):
+        """
+        Обёртка для apihelper.CUSTOM_REQUEST_SENDER: send — функция как
+        requests.request. Сообщения ждут лимитов, ответ 429 повторяется
+        после retry_after; остальные вызовы API проходят сразу.
+        """
+        def limited_send(method, url, params=None, files=None, **kwargs):
+            if not url.rsplit("/", 1)[-1].startswith(LIMITED_PREFIXES):
+                return send(method, url, params=params, files=files, **kwargs)
+            chat_id = (params or {}).get("chat_id")
+            chat_id = int(chat_id) if str(chat_id).lstrip("-").isdigit() else None
+            for attempt in range(self.max_retries + 1):
+                # повтор после 429 ждёт retry_after целиком, и в долг его не взять
+                self.acquire(chat_id, credit=False if attempt else None)
+                response = send(method, url, params=params, files=files, **kwargs)
+                pause = retry_after(response)
+                if pause is None or attempt == self.max_retries:
+                    return response
+                self.retries += 1
+                logger.warning("429 от Telegram, повтор через %s с", pause)
+                self.pause(chat_id, pause)
+                _rewind(files)
+        return limited_send
@@ -0,0 +1,241 @@
+# share.py
+# Публичные снимки портфолио (/share): HTML-страница и JSON, собранные
+# один раз на версию содержимого и лежащие на диске. Версию ведут
+# триггеры БД (portfolio_versions), поэтому просмотр — один запрос по
+# токену и чтение файла, а не выборка проектов на каждого зрителя.
+import base64
+import html
+import json
+import os
+import re
+import secrets
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from photos import variant_name
+
+# Меняется вместе с разметкой снимка: старые снимки и ETag становятся недействительны
+RENDER_VERSION = 1
+TOKEN_BYTES = 12
+# токен — только символы token_urlsafe: он же имя каталога снимков
+TOKEN_RE = re.compile(r"[A-Za-z0-9_-]+")
+
+PAGE = """<!DOCTYPE html>
+<html lang="ru">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Портфолио</title>
+<style>
+body {{ font-family: sans-serif; max-width: 760px; margin: 2em auto; padding: 0 1em; }}
+.project {{ display: flex; gap: 1em; border-bottom: 1px solid #ddd; padding: 1em 0; }}
+.project img {{ width: 160px; height: auto; border-radius: 6px; }}
+.meta {{ color: #666; }}
+</style>
+</head>
+<body>
+<h1>Портфолио</h1>
+<p class="meta">Проектов: {count}</p>
+{projects}
+</body>
+</html>
+"""
+
+PROJECT = """<div class="project">
+{photo}<div>
+<h2>{name}</h2>
+<p>{description}</p>
+<p class="meta">📊 {status} · 🛠️ {skills}</p>
+{url}</div>
+</div>"""
+
+
+def new_token() -> str:
+    return secrets.token_urlsafe(TOKEN_BYTES)
+
+
+class Snapshot:
+    """Готовый снимок: пути к файлам и ETag."""
+
+    def __init__(self, html_path: str, json_path: str, etag: str):
+        self.html_path = html_path
+        self.json_path = json_path
+        self.etag = etag
+
+
+class SnapshotStore:
+    """
+    Снимки по токену ссылки: root/<token>/<версия>.html и .json.
+    Снимок собирается, только если для текущей версии портфолио его ещё нет;
+    прежние версии при этом удаляются.
+    """
+
+    def __init__(self, root: str, photo_store=None):
+        self.root = root
+        self.photo_store = photo_store
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def etag(version: int) -> str:
+        return f'"{RENDER_VERSION}.{version}"'
+
+    def get(self, manager, token: str) -> Snapshot | None:
+        """Снимок по токену или None, если ссылки нет (отозвана)."""
+        shared = manager.get_shared_portfolio(token)
+        if shared is None:
+            return None
+        user_id, version = shared
+        folder = os.path.join(self.root, token)
+        base = os.path.join(folder, f"{RENDER_VERSION}.{version}")
+        snapshot = Snapshot(base + ".html", base + ".json", self.etag(version))
+        if not self._ready(base):
+            # один поток собирает, остальные ждут и берут готовый файл
+            with self._lock:
+                if not self._ready(base):
+                    self._render(manager, user_id, version, folder, base, snapshot)
+        return snapshot
+
+    @staticmethod
+    def _ready(base: str) -> bool:
+        # .pending — миниатюры ещё готовятся: снимок пересоберётся, когда они будут
+        return os.path.exists(base + ".json") and not os.path.exists(base + ".pending")
+
+    def _thumbnail(self, photo: str | None) -> str | None:
+        """
+        Миниатюра фото как data: URI — страница самодостаточна и уходит
+        одним файлом. None — миниатюра ещё не готова.
+        """
+        if (not photo or self.photo_store is None or not self.photo_store.variants_enabled
+                or not self.photo_store.exists(photo)):
+            return ""
+        path = self.photo_store.path(variant_name(photo, "thumb"))
+        if not os.path.exists(path):
+            self.photo_store.schedule_variants(photo)
+            return None
+        with open(path, "rb") as f:
+            data = base64.b64encode(f.read()).decode()
+        return f'<img src="data:image/jpeg;base64,{data}" alt="">\n'
+
+    def build(self, manager, user_id: int, version: int) -> tuple[str, str, bool]:
+        """Страница, JSON и признак «миниатюры ещё готовятся» — прямо из БД."""
+        records, blocks = [], []
+        pending = False
+        for _, name, description, url, status, skills, photo, _ in manager.iter_export(user_id):
+            skills = json.loads(skills)
+            records.append({"name": name, "description": description, "url": url,
+                            "status": status, "skills": skills})
+            link = ""
+            if url and url.startswith(("http://", "https://")):
+                link = f'<p><a href="{html.escape(url)}" rel="nofollow">{html.escape(url)}</a></p>\n'
+            thumbnail = self._thumbnail(photo)
+            pending = pending or thumbnail is None
+            blocks.append(PROJECT.format(
+                photo=thumbnail or "", name=html.escape(name),
+                description=html.escape(description or "—"),
+                status=html.escape(status or "—"),
+                skills=html.escape(", ".join(skills) or "—"), url=link,
+            ))
+        page = PAGE.format(count=len(records), projects="\n".join(blocks))
+        data = json.dumps({"version": version, "projects": records}, ensure_ascii=False)
+        return page, data, pending
+
+    def _render(self, manager, user_id: int, version: int, folder: str, base: str,
+                snapshot: Snapshot):
+        page, data, pending = self.build(manager, user_id, version)
+        os.makedirs(folder, exist_ok=True)
+        # .json пишется последним: по нему get() решает, что снимок готов
+        for path, content in ((snapshot.html_path, page), (snapshot.json_path, data)):
+            fd, tmp = tempfile.mkstemp(dir=folder, suffix=".part")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(tmp, path)
+        keep = {os.path.basename(snapshot.html_path), os.path.basename(snapshot.json_path)}
+        if pending:
+            open(base + ".pending", "w").close()
+            keep.add(os.path.basename(base + ".pending"))
+        for name in os.listdir(folder):
+            # .part — снимок, который в этот момент пишет другой процесс
+            if name not in keep and not name.endswith(".part"):
+                try:
+                    os.remove(os.path.join(folder, name))
+                except FileNotFoundError:
+                    pass
+
+    def forget(self, token: str):
+        """Удалить снимки отозванной ссылки."""
+        folder = os.path.join(self.root, token)
+        if os.path.isdir(folder):
+            for name in os.listdir(folder):
+                os.remove(os.path.join(folder, name))
+            os.rmdir(folder)
+
+
+class ShareServer:
+    """
+    HTTP-сервер снимков: GET /p/<token> — страница, /p/<token>.json — данные.
+    Отвечает 304 на If-None-Match с текущим ETag, иначе отдаёт файл.
+    """
+
+    def __init__(self, store: SnapshotStore, manager, host: str = "0.0.0.0", port: int = 8080):
+        self.store = store
+        self.manager = manager
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if not path.startswith("/p/"):
+                    return self._reply(404)
+                token, is_json = path[3:], path.endswith(".json")
+                if is_json:
+                    token = token[:-len(".json")]
+                if not TOKEN_RE.fullmatch(token):
+                    return self._reply(404)
+                snapshot = server.store.get(server.manager, token)
+                if snapshot is None:
+                    return self._reply(404)
+                if self.headers.get("If-None-Match") == snapshot.etag:
+                    return self._reply(304, etag=snapshot.etag)
+                if is_json:
+                    path, content_type = snapshot.json_path, "application/json; charset=utf-8"
+                else:
+                    path, content_type = snapshot.html_path, "text/html; charset=utf-8"
+                with open(path, "rb") as f:
+                    body = f.read()
+                self._reply(200, body, content_type, snapshot.etag)
+
+            def _reply(self, code: int, body: bytes = b"", content_type: str = None,
+                       etag: str = None):
+                self.send_response(code)
+                if content_type:
+                    self.send_header("Content-Type", content_type)
+                if etag:
+                    self.send_header("ETag", etag)
+                    # браузер и прокси каждый раз сверяют ETag: правки видны сразу
+                    self.send_header("Cache-Control", "no-cache")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def serve_background(self):
+        threading.Thread(target=self.httpd.serve_forever, name="share-http", daemon=True).start()
+
+    def shutdown(self):
+        self.httpd.shutdown()
@@ -0,0 +1,193 @@
+# state.py
+# Хранилища шагов мастеров (next_step_backend для TeleBot).
+# Вместо замыканий с целыми списками храним компактную запись на чат:
+#   {"step": "main:upd_handler3", "args": ["Мой проект"]}
+# Записи переживают перезапуск (SQLite/Redis) и живут не дольше ttl.
+import importlib
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def encode_step(handler) -> str:
+    """Handler TeleBot -> JSON-запись. Аргументы шага должны быть JSON-типами."""
+    func = handler["callback"]
+    return json.dumps(
+        {"step": f"{func.__module__}:{func.__qualname__}", "args": list(handler["args"])},
+        ensure_ascii=False, separators=(",", ":")
+    )
+
+
+def decode_step(record: str) -> dict:
+    """JSON-запись -> handler в том виде, в каком его ждёт TeleBot."""
+    data = json.loads(record)
+    module_name, name = data["step"].split(":")
+    module = sys.modules.get(module_name) or importlib.import_module(module_name)
+    return {"callback": getattr(module, name), "args": data["args"], "kwargs": {}}
+
+
+class MemoryStateBackend:
+    """В памяти процесса: не больше maxsize чатов, запись живёт ttl секунд."""
+
+    def __init__(self, ttl: float, maxsize: int = 100_000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: OrderedDict[int, tuple[str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register_handler(self, chat_id: int, handler):
+        record = encode_step(handler)
+        with self._lock:
+            self._data[chat_id] = (record, time.monotonic() + self.ttl)
+            self._data.move_to_end(chat_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear_handlers(self, chat_id: int):
+        with self._lock:
+            self._data.pop(chat_id, None)
+
+    def get_handlers(self, chat_id: int) -> list | None:
+        with self._lock:
+            item = self._data.pop(chat_id, None)
+        if item is None or item[1] < time.monotonic():
+            return None
+        return [decode_step(item[0])]
+
+    def purge(self) -> int:
+        """Удалить просроченные записи."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [k for k, (_, exp) in self._data.items() if exp < now]
+            for k in expired:
+                del self._data[k]
+        return len(expired)
+
+
+class SqliteStateBackend:
+    """В таблице wizard_state основной базы (через DB_Manager)."""
+
+    def __init__(self, manager, ttl: float):
+        self.manager = manager
+        self.ttl = ttl
+
+    def register_handler(self, chat_id: int, handler):
+        self.manager.set_state(chat_id, encode_step(handler), time.time() + self.ttl)
+
+    def clear_handlers(self, chat_id: int):
+        self.manager.pop_state(chat_id)
+
+    def get_handlers(self, chat_id: int) -> list | None:
+        record = self.manager.pop_state(chat_id)
+        return [decode_step(record)] if record else None
+
+    def purge(self) -> int:
+        return self.manager.purge_states(time.time())
+
+
+class LocalRedis:
+    """
+    Замена Redis в памяти процесса для локального запуска и замеров:
+    только то из API redis-py, что нужно RedisStateBackend, — set с ex,
+    get, delete и pipeline. Значения хранятся байтами, как в Redis.
+    """
+
+    def __init__(self):
+        self._data: dict[str, tuple[bytes, float]] = {}
+        # RLock: pipeline держит блокировку на всё execute()
+        self._lock = threading.RLock()
+
+    def set(self, key: str, value, ex: int = None) -> bool:
+        if isinstance(value, str):
+            value = value.encode()
+        expires = time.monotonic() + ex if ex else float("inf")
+        with self._lock:
+            self._data[key] = (value, expires)
+        return True
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[1] <= time.monotonic():
+                del self._data[key]
+                item = None
+        return item[0] if item else None
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def pipeline(self) -> "_LocalPipeline":
+        return _LocalPipeline(self)
+
+
+class _LocalPipeline:
+    """Команды копятся и выполняются в execute() под одной блокировкой, как MULTI/EXEC."""
+
+    def __init__(self, client: LocalRedis):
+        self.client = client
+        self._commands = []
+
+    def get(self, key: str):
+        self._commands.append((self.client.get, (key,)))
+        return self
+
+    def delete(self, *keys: str):
+        self._commands.append((self.client.delete, keys))
+        return self
+
+    def execute(self) -> list:
+        commands, self._commands = self._commands, []
+        with self.client._lock:
+            return [func(*args) for func, args in commands]
+
+
+class RedisStateBackend:
+    """
+    В Redis (или совместимом сервере). client — объект с API redis-py;
+    для локального запуска подходит LocalRedis().
+    """
+
+    def __init__(self, client, ttl: float, prefix: str = "wizard:"):
+        self.client = client
+        self.ttl = int(ttl)
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, ttl: float):
+        import redis  # нужен только для этого хранилища
+        return cls(redis.Redis.from_url(url), ttl)
+
+    def register_handler(self, chat_id: int, handler):
+        self.client.set(f"{self.prefix}{chat_id}", encode_step(handler), ex=self.ttl)
+
+    def clear_handlers(self, chat_id: int):
+        self.client.delete(f"{self.prefix}{chat_id}")
+
+    def get_handlers(self, chat_id: int) -> list | None:
+        key = f"{self.prefix}{chat_id}"
+        pipe = self.client.pipeline()
+        pipe.get(key)
+        pipe.delete(key)
+        record, _ = pipe.execute()
+        if not record:
+            return None
+        if isinstance(record, bytes):
+            record = record.decode()
+        return [decode_step(record)]
+
+    def purge(self) -> int:
+        return 0  # Redis сам удаляет ключи по ex
+
+
+def make_state_backend(kind: str, manager, ttl: float, redis_url: str = ""):
+    """Хранилище по имени из конфига: memory, sqlite или redis."""
+    if kind == "memory":
+        return MemoryStateBackend(ttl)
+    if kind == "sqlite":
+        return SqliteStateBackend(manager, ttl)
+    if kind == "redis":
+        return RedisStateBackend.from_url(redis_url, ttl)
+    raise ValueError(f"Неизвестное хранилище состояний: {kind}")
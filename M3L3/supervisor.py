@@ -0,0 +1,205 @@
+# supervisor.py
+# Несколько процессов-обработчиков вместо одного: обновления принимает
+# этот процесс (поллинг или webhook) и раздаёт их шардам по chat_id,
+# поэтому шаги мастеров одного чата идут в одном процессе и по порядку.
+# Каждый шард — отдельный процесс со своим ботом, DB_Manager и соединениями;
+# база общая (WAL) или своя у каждого шарда (SHARD_DATABASES).
+#
+# Запуск:  python supervisor.py
+import logging
+import multiprocessing
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Обновлений в очереди одного шарда; при переполнении приём ждёт
+SHARD_QUEUE_SIZE = 10_000
+
+
+def route_key(update: dict) -> int:
+    """Чат, к которому относится обновление (как dispatcher.chat_id_of, но по JSON)."""
+    call = update.get("callback_query")
+    if call:
+        message = call.get("message")
+        return message["chat"]["id"] if message else call["from"]["id"]
+    for kind in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        if kind in update:
+            return update[kind]["chat"]["id"]
+    return 0
+
+
+def shard_database(database: str, shard: int) -> str:
+    """Файл базы шарда: my_database.db -> my_database.2.db."""
+    root, ext = os.path.splitext(database)
+    return f"{root}.{shard}{ext}"
+
+
+def _run_shard(init, init_args, shard: int, shards: int, updates, ready):
+    process_updates, close = init(shard, shards, *init_args)
+    ready.put(shard)
+    try:
+        while (batch := updates.get()) is not None:
+            try:
+                process_updates(batch)
+            except Exception:
+                logger.exception("Шард %s: ошибка при обработке пачки обновлений", shard)
+    finally:
+        close()
+
+
+class Supervisor:
+    """
+    Процессы-шарды и раздача им обновлений.
+    init(shard, shards, *init_args) выполняется в процессе шарда и
+    возвращает (process_updates, close): process_updates получает список
+    обновлений в виде JSON-словарей. init должен быть функцией уровня
+    модуля — процессы запускаются через spawn, без копии памяти родителя
+    (соединения SQLite и потоки через fork не переносятся).
+    """
+
+    def __init__(self, shards: int, init, *init_args, queue_size: int = SHARD_QUEUE_SIZE):
+        ctx = multiprocessing.get_context("spawn")
+        self.shards = shards
+        self._queues = [ctx.Queue(queue_size) for _ in range(shards)]
+        self._ready = ctx.Queue()
+        self._processes = [
+            ctx.Process(target=_run_shard, name=f"shard-{i}", daemon=True,
+                        args=(init, init_args, i, shards, q, self._ready))
+            for i, q in enumerate(self._queues)
+        ]
+
+    def start(self):
+        """Запустить шарды и дождаться, пока каждый будет готов принимать обновления."""
+        for p in self._processes:
+            p.start()
+        for _ in self._processes:
+            self._ready.get()
+
+    def alive(self) -> bool:
+        """Все шарды работают (проверка готовности)."""
+        return all(p.is_alive() for p in self._processes)
+
+    def dispatch(self, updates: list[dict]):
+        """Разложить пачку обновлений по шардам, сохраняя порядок внутри чата."""
+        batches: dict[int, list] = {}
+        for update in updates:
+            batches.setdefault(route_key(update) % self.shards, []).append(update)
+        for shard, batch in batches.items():
+            self._queues[shard].put(batch)
+
+    def shutdown(self):
+        """Дообработать очереди и остановить шарды."""
+        for q in self._queues:
+            q.put(None)
+        for p in self._processes:
+            p.join()
+
+
+def bot_shard(shard: int, shards: int):
+    """init для Supervisor: бот из main.py в процессе шарда."""
+    import config
+    if config.SHARD_DATABASES:
+        config.DATABASE = shard_database(config.DATABASE, shard)
+        # сервер снимков видит одну базу, а токен не говорит, в какой
+        # шард идти, — /share присылает страницу файлом
+        config.SHARE_URL = ""
+    # лимит Telegram общий на бота — делим его между процессами
+    config.SEND_RATE = config.SEND_RATE / shards
+    import main
+    from telebot import types
+
+    main.startup()
+    # общую базу обслуживает один шард, свою — каждый
+    if config.MAINTENANCE_INTERVAL and (config.SHARD_DATABASES or shard == 0):
+        if config.SHARD_DATABASES:
+            # каталог фото общий, а база шарда знает только свои файлы
+            main.maintenance.photo_store = None
+        main.maintenance.start(config.MAINTENANCE_INTERVAL)
+    share_server = None
+    if config.SHARE_URL and shard == 0:
+        # база общая: ссылки всех шардов обслуживает сервер снимков шарда 0
+        from share import ShareServer
+
+        share_server = ShareServer(main.snapshots, main.manager,
+                                   config.SHARE_HOST, config.SHARE_PORT)
+        share_server.serve_background()
+
+    if main.metrics is not None:
+        # у каждого шарда свои метрики: порт METRICS_PORT + номер шарда
+        main.metrics.serve(config.METRICS_HOST, config.METRICS_PORT + shard)
+
+    def process_updates(updates):
+        main.bot.process_new_updates([types.Update.de_json(u) for u in updates])
+
+    def close():
+        if share_server is not None:
+            share_server.shutdown()
+        main.maintenance.stop()
+        main.bot.dispatcher.shutdown()
+        main.photo_store.close()
+        main.manager.close()
+
+    return process_updates, close
+
+
+def poll(supervisor: Supervisor, token: str, timeout: int = 20):
+    """Long polling в процессе-диспетчере: обновления не разбираются, только маршрутизируются."""
+    from telebot import apihelper
+
+    apihelper.delete_webhook(token)
+    offset = None
+    while True:
+        try:
+            updates = apihelper.get_updates(token, offset, timeout=timeout,
+                                            long_polling_timeout=timeout)
+        except Exception:
+            logger.exception("Ошибка getUpdates")
+            time.sleep(1)
+            continue
+        if updates:
+            offset = updates[-1]["update_id"] + 1
+            supervisor.dispatch(updates)
+
+
+def main():
+    from urllib.parse import urlparse
+
+    from health import Health
+    from webhook import WebhookServer, check_secret
+    from config import (
+        TOKEN, SHARDS, WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT,
+        HEALTH_HOST, HEALTH_PORT
+    )
+
+    logging.basicConfig(level=logging.INFO)
+    if WEBHOOK_URL:
+        check_secret(WEBHOOK_SECRET)  # до запуска шардов
+    # пробы — у процесса-диспетчера: готов, когда готовы все шарды
+    health = Health()
+    if HEALTH_PORT:
+        health.serve(HEALTH_HOST, HEALTH_PORT)
+    supervisor = Supervisor(SHARDS, bot_shard)
+    supervisor.start()
+    health.add_check("shards", supervisor.alive)
+    health.set_ready()
+    logger.info("Запущено шардов: %s", SHARDS)
+    try:
+        if WEBHOOK_URL:
+            from telebot import apihelper
+
+            apihelper.set_webhook(TOKEN, url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+            server = WebhookServer(
+                supervisor.dispatch, lambda u: u, WEBHOOK_SECRET,
+                path=urlparse(WEBHOOK_URL).path or "/",
+                host=WEBHOOK_HOST, port=WEBHOOK_PORT
+            )
+            server.serve_forever()
+        else:
+            poll(supervisor, TOKEN)
+    finally:
+        supervisor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# transfer.py
+# Выгрузка и загрузка портфолио потоком: JSON Lines (по записи на строку)
+# или CSV. Одна запись — один проект:
+#   {"name": "...", "description": "...", "url": "...", "status": "...",
+#    "skills": ["Python", "SQL"], "photo": "ab/abcdef….jpg", "photo_file_id": "..."}
+#
+# Запуск из консоли:
+#   python transfer.py export 123456 portfolio.jsonl
+#   python transfer.py import 123456 portfolio.csv
+import argparse
+import codecs
+import csv
+import io
+import json
+import re
+import sys
+import tempfile
+from functools import partial
+from itertools import islice
+
+FIELDS = ("name", "description", "url", "status", "skills", "photo", "photo_file_id")
+# Проектов в одной транзакции импорта
+IMPORT_BATCH = 5000
+# В CSV навыки пишутся одной ячейкой через этот разделитель
+CSV_SKILLS_SEP = "; "
+# Имя файла в PhotoStore; чужие пути в photo не пропускаем
+PHOTO_NAME = re.compile(r"[0-9a-f]{2}/[0-9a-f]{64}\.jpg")
+
+
+class BadRecord(ValueError):
+    """Запись файла импорта не удалось разобрать."""
+
+
+def detect_format(filename: str) -> str:
+    return "csv" if filename.lower().endswith(".csv") else "jsonl"
+
+
+# ========== Экспорт ==========
+
+def _record(row: tuple) -> dict:
+    """Строка DB_Manager.iter_export -> запись."""
+    _, name, description, url, status, skills, photo, file_id = row
+    return {
+        "name": name, "description": description, "url": url, "status": status,
+        "skills": json.loads(skills), "photo": photo, "photo_file_id": file_id,
+    }
+
+
+def export_lines(manager, user_id: int, fmt: str = "jsonl"):
+    """Строки файла выгрузки; проекты читаются из БД пачками."""
+    records = map(_record, manager.iter_export(user_id))
+    if fmt == "jsonl":
+        for record in records:
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+        return
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(FIELDS)
+    for record in records:
+        record["skills"] = CSV_SKILLS_SEP.join(record["skills"])
+        writer.writerow([record[f] for f in FIELDS])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+def export_file(manager, user_id: int, fmt: str = "jsonl"):
+    """Выгрузка во временный файл (для send_document); файл открыт на чтение с начала."""
+    f = tempfile.TemporaryFile()
+    for line in export_lines(manager, user_id, fmt):
+        f.write(line.encode())
+    f.seek(0)
+    return f
+
+
+# ========== Импорт ==========
+
+def iter_lines(chunks):
+    """
+    Байтовые куски (файл, ответ HTTP) -> строки текста с "\\n" на конце.
+    Файл не в UTF-8 — BadRecord с номером строки.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    tail = ""
+    number = 0
+    try:
+        for chunk in chunks:
+            *lines, tail = (tail + decoder.decode(chunk)).split("\n")
+            for line in lines:
+                number += 1
+                yield line + "\n"
+        tail += decoder.decode(b"", final=True)
+    except UnicodeDecodeError as e:
+        number += 1 + e.object[:e.start].count(b"\n")
+        raise BadRecord(f"строка {number}: текст не в кодировке UTF-8") from None
+    if tail:
+        yield tail
+
+
+def _normalize(data, where: str) -> dict:
+    if not isinstance(data, dict):
+        raise BadRecord(f"{where}: ожидается объект")
+    name = str(data.get("name") or "").strip()
+    if not name:
+        raise BadRecord(f"{where}: нет названия проекта")
+    skills = data.get("skills") or []
+    if isinstance(skills, str):
+        skills = skills.split(CSV_SKILLS_SEP.strip())
+    photo = data.get("photo") or None
+    if photo is not None and not PHOTO_NAME.fullmatch(str(photo)):
+        photo = None
+    return {
+        "name": name,
+        "description": data.get("description") or None,
+        "url": data.get("url") or None,
+        "status": data.get("status") or None,
+        "skills": [s for s in (str(s).strip() for s in skills) if s],
+        "photo": photo,
+        "photo_file_id": (data.get("photo_file_id") or None) if photo else None,
+    }
+
+
+def read_records(lines, fmt: str = "jsonl"):
+    """Строки файла -> записи проектов. Ошибка формата — BadRecord с номером строки."""
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        try:
+            for data in reader:
+                yield _normalize(data, f"строка {reader.line_num}")
+        except csv.Error as e:
+            # DictReader.line_num обновляется только после удачной строки
+            raise BadRecord(f"строка {reader.reader.line_num}: некорректный CSV ({e})") from None
+        return
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError:
+            raise BadRecord(f"строка {number}: некорректный JSON") from None
+        yield _normalize(data, f"строка {number}")
+
+
+def _local_photo(record: dict, photo_store) -> dict:
+    """Фото, которого нет в этом хранилище (выгрузка другого экземпляра), отбрасываем."""
+    if record["photo"] and (photo_store is None or not photo_store.exists(record["photo"])):
+        record["photo"] = record["photo_file_id"] = None
+    return record
+
+
+def import_records(manager, user_id: int, records, create_refs: bool = False,
+                   batch_size: int = IMPORT_BATCH, photo_store=None) -> int:
+    """
+    Загрузить записи пачками по batch_size (каждая — своя транзакция).
+    При BadRecord уже загруженные пачки остаются; повторный импорт
+    исправленного файла их просто обновит. Фото сохраняются, только если
+    файл есть в photo_store.
+    """
+    total = 0
+    records = (_local_photo(record, photo_store) for record in records)
+    while batch := list(islice(records, batch_size)):
+        total += manager.import_projects(user_id, batch, create_refs)
+    return total
+
+
+def main(argv=None):
+    from config import DATABASE, PHOTOS_DIR, MAX_PHOTO_SIZE
+    from logic import DB_Manager
+    from photos import PhotoStore
+
+    parser = argparse.ArgumentParser(description="Выгрузка и загрузка портфолио")
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("user_id", type=int)
+    parser.add_argument("file", nargs="?", default="-", help="по умолчанию stdin/stdout")
+    parser.add_argument("--format", choices=("jsonl", "csv"))
+    parser.add_argument("--database", default=DATABASE)
+    parser.add_argument("--photos", default=PHOTOS_DIR)
+    parser.add_argument("--skip-unknown", action="store_true",
+                        help="не создавать неизвестные статусы и навыки")
+    args = parser.parse_args(argv)
+    fmt = args.format or detect_format(args.file)
+
+    manager = DB_Manager(args.database)
+    try:
+        if args.command == "export":
+            out = (sys.stdout if args.file == "-"
+                   else open(args.file, "w", encoding="utf-8", newline=""))
+            with out:
+                out.writelines(export_lines(manager, args.user_id, fmt))
+            return
+        src = sys.stdin.buffer if args.file == "-" else open(args.file, "rb")
+        with src:
+            chunks = iter(partial(src.read, 64 * 1024), b"")
+            count = import_records(
+                manager, args.user_id, read_records(iter_lines(chunks), fmt),
+                create_refs=not args.skip_unknown,
+                photo_store=PhotoStore(args.photos, MAX_PHOTO_SIZE)
+            )
+        print(f"Загружено проектов: {count}", file=sys.stderr)
+    except BadRecord as e:
+        sys.exit(f"Ошибка в файле: {e}")
+    finally:
+        manager.close()
+
+
+if __name__ == "__main__":
+    main()
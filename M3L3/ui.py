@@ -0,0 +1,168 @@
+# ui.py
+# Общие элементы интерфейса: используются и main.py, и async_main.py
+from telebot import types
+from telebot.types import (
+    InlineKeyboardButton, InlineKeyboardMarkup,
+    ReplyKeyboardMarkup, KeyboardButton
+)
+
+from cache import LRUCache
+
+# Клавиатуры отдаются готовым JSON (reply_markup принимает и строку):
+# одинаковый набор кнопок собирается и сериализуется один раз.
+# Ключ — само содержимое, поэтому изменённый список проектов просто
+# попадает под другой ключ, а старый вытесняется LRU.
+MARKUP_CACHE_SIZE = 10_000
+markup_cache = LRUCache(MARKUP_CACHE_SIZE)
+
+hide_board = types.ReplyKeyboardRemove().to_json()
+cancel_button = "Отмена 🚫"
+
+INFO_TEXT = (
+    "📌 <b>Доступные команды:</b>\n\n"
+    "/new_project – создать новый проект 🆕\n"
+    "/projects – список проектов 📋\n"
+    "/search – найти проект 🔍\n"
+    "/skills – добавить навык 🛠️\n"
+    "/update_projects – изменить проект ✏️\n"
+    "/delete – удалить проект ❌\n"
+    "/add_description – добавить описание 📄\n"
+    "/add_photo – прикрепить фото 📷\n"
+    "/export – выгрузить проекты файлом 📤\n"
+    "/import – загрузить проекты из файла 📥\n"
+    "/share – публичная страница портфолио 🌐 (/share off — закрыть)\n"
+    "/stats – статистика по проектам и навыкам 📊\n"
+    "/info – показать эту справку ℹ️"
+)
+
+def build_reply_markup(options) -> ReplyKeyboardMarkup:
+    """
+    Reply-клавиатура:
+    - one_time_keyboard=True → исчезает после первого нажатия
+    - resize_keyboard=True → оптимальный размер
+    """
+    markup = ReplyKeyboardMarkup(
+        one_time_keyboard=True,
+        resize_keyboard=True
+    )
+    for o in options:
+        markup.add(KeyboardButton(o))
+    markup.add(KeyboardButton(cancel_button))
+    return markup
+
+def gen_reply_markup(options: list[str]) -> str:
+    """JSON reply-клавиатуры из кэша (см. build_reply_markup)."""
+    key = ("reply", tuple(options))
+    return markup_cache.get_or_load(key, lambda: build_reply_markup(key[1]).to_json())
+
+def build_page_markup(cards, has_prev: bool, has_next: bool) -> InlineKeyboardMarkup:
+    """
+    Inline-кнопки страницы проектов. callback_data короткие (лимит 64 байта):
+    p:<id> — карточка, pg:<id / pg:>id — предыдущая / следующая страница.
+    """
+    markup = InlineKeyboardMarkup()
+    for card in cards:
+        markup.row(InlineKeyboardButton(card[1], callback_data=f"p:{card[0]}"))
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton("⬅️", callback_data=f"pg:<{cards[0][0]}"))
+    if has_next:
+        nav.append(InlineKeyboardButton("➡️", callback_data=f"pg:>{cards[-1][0]}"))
+    if nav:
+        markup.row(*nav)
+    return markup
+
+def gen_page_markup(cards: list[tuple], has_prev: bool, has_next: bool) -> str:
+    """JSON inline-кнопок страницы из кэша: ключ — (id, имя) проектов и стрелки."""
+    key = ("page", tuple((card[0], card[1]) for card in cards), has_prev, has_next)
+    return markup_cache.get_or_load(
+        key, lambda: build_page_markup(key[1], has_prev, has_next).to_json()
+    )
+
+# Мультивыбор навыков: отметки хранятся в самой клавиатуре сообщения
+SKILL_MARK = "✅ "
+# Сколько неотмеченных навыков показывать (у Telegram лимит 100 кнопок)
+SKILLS_PICKER_SIZE = 40
+
+def gen_skills_markup(project_id: int, skills: list[tuple],
+                      selected: set[int]) -> InlineKeyboardMarkup:
+    """
+    Inline-кнопки выбора навыков (skills — пары (skill_id, skill_name)):
+    sk:<project>:<skill> переключает отметку, sk:<project>:ok — «Готово».
+    Не кэшируется: отметки у каждого сообщения свои, а объект нужен picked_skills.
+    """
+    unselected = [s[0] for s in skills if s[0] not in selected][:SKILLS_PICKER_SIZE]
+    shown = selected.union(unselected)
+    buttons = [
+        InlineKeyboardButton(
+            (SKILL_MARK if sid in selected else "") + name,
+            callback_data=f"sk:{project_id}:{sid}"
+        )
+        for sid, name in skills
+        if sid in shown
+    ]
+    markup = InlineKeyboardMarkup(row_width=2)
+    markup.add(*buttons)
+    markup.row(InlineKeyboardButton("Готово ✔️", callback_data=f"sk:{project_id}:ok"))
+    return markup
+
+def toggle_skill(markup: InlineKeyboardMarkup, callback_data: str):
+    """Переключить отметку на кнопке навыка."""
+    for row in markup.keyboard:
+        for button in row:
+            if button.callback_data == callback_data:
+                if button.text.startswith(SKILL_MARK):
+                    button.text = button.text[len(SKILL_MARK):]
+                else:
+                    button.text = SKILL_MARK + button.text
+
+def picked_skills(markup: InlineKeyboardMarkup) -> list[str]:
+    """Имена отмеченных навыков."""
+    return [
+        button.text[len(SKILL_MARK):]
+        for row in markup.keyboard for button in row
+        if button.text.startswith(SKILL_MARK)
+    ]
+
+# Для обновления конкретного поля
+attributes = {
+    'Имя проекта':    ("Введите новое имя проекта:",   "project_name"),
+    'Описание':       ("Введите новое описание:",      "description"),
+    'Ссылка':         ("Введите новую ссылку:",         "url"),
+    'Статус':         ("Выберите новый статус:",        "status_id"),
+}
+
+def card_text(card: tuple) -> str:
+    """Текст карточки проекта (формат DB_Manager.get_project_card)."""
+    _, name, desc, url, status, skills, *_ = card
+    return (
+        f"📁 <b>{name}</b>\n"
+        f"📝 Описание: {desc or '—'}\n"
+        f"🔗 Ссылка: {url or '—'}\n"
+        f"📊 Статус: {status}\n"
+        f"🛠️ Навыки: {skills or '—'}"
+    )
+
+def projects_text(cards: list[tuple]) -> str:
+    """Краткий список проектов для /projects."""
+    text = ""
+    for _, pname, _, url, status, skills, *_ in cards:
+        text += (
+            f"📁 <b>{pname}</b>\n🔗 {url or '—'}\n"
+            f"📊 {status or '—'}\n🛠️ {skills or '—'}\n\n"
+        )
+    return text
+
+def stats_text(statuses: list[tuple], skills: list[tuple],
+               top_skills: list[tuple], pairs: list[tuple]) -> str:
+    """Текст /stats (форматы DB_Manager.get_status_stats, get_top_skills, get_skill_pairs)."""
+    total = sum(n for _, n in statuses)
+    text = f"📊 <b>Проектов: {total}</b>\n"
+    text += "".join(f"• {status or 'Без статуса'}: {n}\n" for status, n in statuses)
+    text += "\n🛠️ <b>Твои навыки:</b> "
+    text += ", ".join(f"{name} ({n})" for name, n in skills) or "—"
+    text += "\n\n🌍 <b>Популярные навыки:</b> "
+    text += ", ".join(f"{name} ({n})" for name, n in top_skills) or "—"
+    text += "\n🤝 <b>Часто вместе:</b> "
+    text += ", ".join(f"{a} + {b} ({n})" for a, b, n in pairs) or "—"
+    return text
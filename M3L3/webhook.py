@@ -0,0 +1,137 @@
+# webhook.py
+import hmac
+import json
+import logging
+import queue
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Самое большое тело запроса; обновление Telegram много меньше
+MAX_BODY = 1024 * 1024
+# допустимый секрет по документации setWebhook
+SECRET_RE = re.compile(r"[A-Za-z0-9_-]{1,256}")
+
+
+def check_secret(secret: str):
+    """
+    Без секрета Telegram его не присылает, и принять обновление может
+    любой, кто знает адрес, — поэтому webhook без секрета не запускаем.
+    """
+    if not secret or not SECRET_RE.fullmatch(secret):
+        raise ValueError("WEBHOOK_SECRET должен быть задан: 1-256 символов A-Z, a-z, 0-9, _ и -")
+
+
+class WebhookServer:
+    """
+    Приём обновлений от Telegram по HTTP.
+    Запрос проверяется по секретному токену и кладётся в ограниченную очередь;
+    отдельный поток забирает обновления пачками и отдаёт в process_updates.
+    Если очередь полна, отвечаем 503 — Telegram повторит доставку позже.
+    """
+
+    def __init__(self, process_updates, parse_update, secret: str, path: str = "/",
+                 host: str = "0.0.0.0", port: int = 8443,
+                 queue_size: int = 10_000, batch_size: int = 100):
+        check_secret(secret)
+        self.process_updates = process_updates
+        self.parse_update = parse_update
+        self.secret = secret
+        self.path = path
+        self.batch_size = batch_size
+        self.queue: queue.Queue = queue.Queue(queue_size)
+        self.accepted = 0
+        self.rejected = 0
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._consumer = threading.Thread(target=self._consume, name="webhook-consumer", daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive для потока запросов
+
+            def do_POST(self):
+                # до проверки пути, секрета и длины тело не читаем: непрочитанное
+                # тело испортило бы keep-alive, поэтому такие ответы закрывают соединение
+                if self.path != server.path:
+                    return self._refuse(404)
+                token = self.headers.get(SECRET_HEADER)
+                if token is None or not hmac.compare_digest(token, server.secret):
+                    return self._refuse(403)
+                length = self.headers.get("Content-Length")
+                if length is None:
+                    return self._refuse(411)
+                if not length.isdigit():
+                    return self._refuse(400)
+                if int(length) > MAX_BODY:
+                    return self._refuse(413)
+                body = self.rfile.read(int(length))
+                try:
+                    update = json.loads(body)
+                except ValueError:
+                    return self._reply(400)
+                try:
+                    server.queue.put_nowait(update)
+                except queue.Full:
+                    server.rejected += 1
+                    return self._reply(503)
+                server.accepted += 1
+                self._reply(200)
+
+            def _refuse(self, code: int):
+                self.close_connection = True
+                self.send_response(code)
+                self.send_header("Content-Length", "0")
+                self.send_header("Connection", "close")
+                self.end_headers()
+
+            def _reply(self, code: int):
+                self.send_response(code)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass  # каждый запрос в лог не пишем
+
+        return Handler
+
+    def _consume(self):
+        while True:
+            batch = [self.queue.get()]
+            if batch[0] is None:
+                return
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.queue.put(None)  # остановимся после этой пачки
+                    break
+                batch.append(item)
+            try:
+                self.process_updates([self.parse_update(u) for u in batch])
+            except Exception:
+                logger.exception("Ошибка при обработке пачки обновлений")
+
+    def serve_forever(self):
+        self._consumer.start()
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
+            self.queue.put(None)
+            self._consumer.join()
+
+    def shutdown(self):
+        """Остановить приём (вызывать из другого потока)."""
+        self.httpd.shutdown()
@@ -0,0 +1,106 @@
+# writer.py
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Сколько ждать попутных изменений после первого в пачке (секунд).
+# По умолчанию не ждём: пачка — всё, что накопилось за время предыдущего
+# коммита. Ожидание помогает, только если писатели не ждут ответа:
+# обработчики бота ждут, и лишние миллисекунды лишь снижают пропускную способность
+GROUP_COMMIT_DELAY = 0.0
+# Не больше изменений в одной транзакции
+GROUP_COMMIT_BATCH = 256
+
+
+class GroupCommitWriter:
+    """
+    Единственный поток-писатель SQLite. Изменения из разных потоков
+    собираются в одну транзакцию (group commit) вместо того, чтобы
+    каждое ждало блокировку записи и делало свой коммит.
+    Изменение — функция func(conn); submit возвращает Future с её
+    результатом. Каждая функция выполняется в своей точке сохранения:
+    ошибка одной не откатывает остальные в пачке. Результат уходит в другой
+    поток, поэтому func возвращает данные, а не курсор.
+    check(conn) вызывается после каждой функции в той же точке сохранения:
+    то, что иначе всплыло бы только на общем коммите (отложенные внешние
+    ключи), откатывает одну функцию, а не всю пачку.
+    """
+
+    def __init__(self, connect, delay: float = GROUP_COMMIT_DELAY,
+                 batch_size: int = GROUP_COMMIT_BATCH, check=None):
+        self.connect = connect
+        self.check = check
+        self.delay = delay
+        self.batch_size = batch_size
+        self.queue: queue.Queue = queue.Queue()
+        self.commits = 0
+        self.writes = 0
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, func) -> Future:
+        future = Future()
+        self.queue.put((func, future))
+        return future
+
+    def _collect(self) -> list | None:
+        """Пачка изменений: первое ждём без ограничений, попутные — до delay."""
+        first = self.queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.delay
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self.queue.put(None)  # остановимся после этой пачки
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        # соединение — к первой пачке: к ней схема уже готова (DB_Manager.bootstrap)
+        conn = None
+        while (batch := self._collect()) is not None:
+            results = []
+            try:
+                if conn is None:
+                    conn = self.connect()
+                conn.execute("BEGIN IMMEDIATE")
+                for func, future in batch:
+                    conn.execute("SAVEPOINT write")
+                    try:
+                        result = func(conn)
+                        if self.check is not None:
+                            self.check(conn)
+                        results.append((future, result, None))
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO write")
+                        results.append((future, None, e))
+                    conn.execute("RELEASE write")
+                conn.commit()
+            except Exception as e:
+                # не удалось начать или зафиксировать транзакцию — не записано ничего
+                if conn is not None and conn.in_transaction:
+                    conn.rollback()
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.commits += 1
+            self.writes += len(batch)
+            # ответы — только после коммита: подтверждённое изменение уже в БД
+            for future, result, error in results:
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+
+    def close(self):
+        """Дописать то, что уже в очереди, и остановить поток."""
+        self.queue.put(None)
+        self._thread.join()